@@ -5,6 +5,7 @@
 import sys
 sys.path.append('/home/tobi/GitLab/CoACH_Teensy_interface/build/pc/pyplane')
 import pyplane # suceeeds if the .so is on that build folder
+# unfortunately we cannot import the nested classes like BiasAddress; see https://stackoverflow.com/questions/22885489/python-import-nested-classes-shorthand
 
 
 import os
@@ -12,14 +13,18 @@ import platform
 import glob
 import time
 import signal
-import time
 import numpy as np
-from matplotlib import pyplot as plt
-import pyplane # unfortunately we cannot import the nested classes like BiasAddress; see https://stackoverflow.com/questions/22885489/python-import-nested-classes-shorthand
+# matplotlib is only needed for the timing histograms, so it is imported in print_timing_info() to keep `import ne1` fast for headless use
 from engineering_notation import EngNumber as ef
 # printing values in engineering format, e.g. ef(2.3e-9)='2.3n'
-from deprecated import deprecated  # to mark methods here as deprecated, note this comes from Deprecated package https://pypi.org/project/Deprecated/
 import logging
+import functools
+import warnings
+import hashlib
+import itertools
+import weakref
+from contextlib import contextmanager
+from collections import namedtuple
 # general logger. Produces nice output format with live hyperlinks for pycharm users
 # to use it, just call log=get_logger() at the top of your Python file
 # all these loggers share the same logger name 'NE1'
@@ -80,6 +85,21 @@ def get_logger():
 
 log = get_logger()
 
+
+def deprecated(reason: str):
+    """ Marks a function as deprecated, like the decorator of the Deprecated package https://pypi.org/project/Deprecated/ but without importing it.
+
+    :param reason: the message, e.g. 'Use setup_ndp() instead'
+    :return: the decorator, which makes the function emit a DeprecationWarning when it is called
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            warnings.warn(f'Call to deprecated function {fn.__qualname__}. ({reason})', category=DeprecationWarning, stacklevel=2)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # def import_ne1_modules():
 #     import inspect,importlib
 #     frame = inspect.currentframe().
@@ -90,13 +110,536 @@ log = get_logger()
 #         del frame
 
 
-# https://stackoverflow.com/questions/6760685/creating-a-singleton-in-python
-from functools import lru_cache
-@lru_cache(maxsize=None)
+class ConnectionTracker():
+    """
+    Tracks whether the Plane PCB connection can be trusted to still be open,
+    so that Coach.check_open() does not need a USB round trip (get_firmware_version()) before every DAC write or ADC read.
+
+    The open state is trusted between calls. Liveness is checked again only after `heartbeat_interval_s` has elapsed since the last
+    successful check, or after a transport error was noted with `note_transport_error()`.
+    """
+
+    def __init__(self, heartbeat_interval_s: float = 1.0):
+        """
+        :param heartbeat_interval_s: how long in seconds to trust the open state before checking liveness again.
+            Set to 0 to check liveness on every call (the old behavior), or None to never check it once open.
+        """
+        self.heartbeat_interval_s = heartbeat_interval_s
+        self.saved_round_trips = 0
+        """ The number of liveness round trips that were skipped because the open state was trusted. """
+        self.liveness_checks = 0
+        """ The number of liveness round trips that were actually made. """
+        self.transport_errors = 0
+        """ The number of transport errors noted. """
+        self._last_verified = None  # time.monotonic() of last successful liveness check, None if not verified
+        self._last_error = None  # the last exception noted, so that the same one is counted once
+
+    def is_trusted(self) -> bool:
+        """ Checks if the open state can be trusted without a liveness check.
+
+        :return: True if the connection was verified recently enough and no transport error was noted since.
+        """
+        if self._last_verified is None:
+            return False
+        if self.heartbeat_interval_s is None:
+            return True
+        return time.monotonic() - self._last_verified < self.heartbeat_interval_s
+
+    def mark_verified(self) -> None:
+        """ Records that liveness was just checked successfully. """
+        self._last_verified = time.monotonic()
+
+    def mark_stale(self) -> None:
+        """ Forces a liveness check on the next Coach.check_open(), e.g. after closing. """
+        self._last_verified = None
+
+    def note_transport_error(self, e: Exception = None) -> None:
+        """ Records a transport error; the next Coach.check_open() will check liveness.
+
+        :param e: the exception, used only for logging
+        """
+        if e is not None and e is self._last_error:
+            return  # already noted where it was raised, e.g. by TrackedPlane
+        self._last_error = e
+        self.transport_errors += 1
+        log.debug(f'transport error noted ({e}); will check liveness on next check_open()')
+        self.mark_stale()
+
+    def __str__(self):
+        return f'ConnectionTracker(heartbeat_interval_s={self.heartbeat_interval_s}, liveness_checks={self.liveness_checks}, saved_round_trips={self.saved_round_trips}, transport_errors={self.transport_errors})'
+
+
+class TrackedPlane():
+    """
+    Wraps the pyplane.Plane (or SimPlane) of a Coach so that every call to the board that fails with a transport error
+    (RuntimeError, TimeoutError or OSError) is noted in the Coach's `ConnectionTracker` before the exception propagates,
+    and so that the Coach can follow calls that change the state it keeps shadow copies of, e.g. set_voltage().
+    Attributes are looked up on the wrapped object and set on it, so it behaves like the object itself.
+    The wrapper of each method is made on its first access and kept, so that later calls skip `__getattr__`;
+    setting or deleting a method through the wrapper, e.g. to monkeypatch it, drops its kept wrapper.
+    Both Coach.plane and Coach.get_pyplane() return this wrapper.
+    """
+
+    TRANSPORT_ERRORS = (RuntimeError, TimeoutError, OSError)
+    """ The exceptions that are taken as transport errors. """
+
+    def __init__(self, plane, connection: ConnectionTracker, after_calls: dict = None):
+        """
+        :param plane: the pyplane.Plane or SimPlane to wrap
+        :param connection: the ConnectionTracker that transport errors are noted in
+        :param after_calls: dict of method name -> fn(result, *args, **kwargs), called after each successful call of that method
+        """
+        object.__setattr__(self, '_plane', plane)
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_after_calls', after_calls or {})
+
+    def __getattr__(self, name):
+        attr = getattr(self._plane, name)
+        if not callable(attr):
+            return attr
+        connection = self._connection
+        after = self._after_calls.get(name)
+
+        def call(*args, **kwargs):
+            try:
+                result = attr(*args, **kwargs)
+            except TrackedPlane.TRANSPORT_ERRORS as e:
+                connection.note_transport_error(e)
+                raise
+            if after is not None:
+                after(result, *args, **kwargs)
+            return result
+        object.__setattr__(self, name, call)
+        return call
+
+    def __setattr__(self, name, value):
+        self.__dict__.pop(name, None)
+        setattr(self._plane, name, value)
+
+    def __delattr__(self, name):
+        self.__dict__.pop(name, None)
+        delattr(self._plane, name)
+
+    def __str__(self):
+        return str(self._plane)
+
+
+class SetupProfile():
+    """
+    Declarative description of how the CoACH chip is set up for one measurement: the mux select lines, the biases,
+    the ADC bit depth and how long to settle after changing them. See `Coach.SETUP_PROFILES` and `Coach.apply_profile()`.
+    """
+
+    def __init__(self, name: str, mux: tuple = None, biases: tuple = (), bit_depth: int = None, settle_s: float = 0):
+        """
+        :param name: the name of the profile, e.g. 'nfet'
+        :param mux: tuple of (CurrentOutputSelect, VoltageOutputSelect, VoltageInputSelect, SynapseSelect, misc int) for
+            pyplane.Coach.generate_aerc_event(), or None to leave the mux select lines as they are
+        :param biases: sequence of (address, type, coarse, fine) bias tuples, see `Coach.set_bias_from_tuple()`.
+            If an address appears more than once, the last value is used.
+        :param bit_depth: the ADC bit depth, 10 or 12, or None to leave it as it is
+        :param settle_s: how long to wait in seconds after applying the profile, if anything was changed
+        """
+        self.name = name
+        self.mux = mux
+        merged = {}
+        for b in biases:
+            merged[b[0]] = tuple(b)
+        self.biases = tuple(merged.values())
+        self.bit_depth = bit_depth
+        self.settle_s = settle_s
+        self._mux_event = None
+
+    def mux_event(self):
+        """ Returns the CoachInputEvent for the mux select lines, generated once and reused.
+
+        :return: the pyplane.CoachInputEvent, or None if this profile does not set the mux
+        """
+        if self.mux is not None and self._mux_event is None:
+            self._mux_event = pyplane.Coach.generate_aerc_event(*self.mux)
+        return self._mux_event
+
+    def __str__(self):
+        return f'SetupProfile({self.name}: mux={self.mux}, {len(self.biases)} biases, bit_depth={self.bit_depth}, settle_s={self.settle_s})'
+
+
+AveragedMeasurement = namedtuple('AveragedMeasurement', ['mean', 'std', 'n'])
+""" The result of Coach.measure_averaged(): the mean and sample standard deviation of n readings. """
+
+
+class SimPlane():
+    """
+    In-process stand-in for pyplane.Plane that needs no board, for benchmarking and regression testing Coach offline.
+
+    It implements the pyplane.Plane API (see stubs/pyplane/pyplane.pyi) with a configurable per-call latency, DAC and ADC quantization,
+    a simple subthreshold transistor model for the currents, Poisson C2F counts and Poisson output events.
+    Every call that would talk to the board is counted in `transactions`; the get_XXX() calls that do not read from the board are not.
+
+    Coach.open() uses it when the port name starts with 'sim://'. Options can be passed as a URL query,
+    e.g. `coach.open('sim://?latency_s=0.001&time_scale=0')`.
+    """
+
+    PORT_PREFIX = 'sim://'
+    """ Port names starting with this prefix select the SimPlane in Coach.open(). """
+
+    MAX_TIMESTAMP = 2**32
+    """ The output event timestamps wrap around at this value, like the 32 bit Teensy timestamps. """
+
+    TICKS_PER_S = 1024.
+    """ The output event timestamp ticks per second, as assumed by Coach.EVENT_TICKS_PER_S. """
+
+    max_settable_voltage_V = 1.8
+
+    _serial_numbers = itertools.count(1000000) # the default teensy_sn of each new SimPlane
+
+    def __init__(self, latency_s: float = 0, time_scale: float = 1, dac_bits: int = 10, noise: float = 0.01,
+                 event_rate_hz: float = 0, event_addresses=(0,), firmware_version: tuple = (0, 0, 0), teensy_sn: int = None,
+                 i0_A: float = 1e-15, kappa: float = 0.7, c2f_hz_per_A: float = 1e10, transient_tau_s: float = 1e-3, start_ticks: int = 0,
+                 seed: int = None):
+        """
+        :param latency_s: the latency in seconds of each call that talks to the board
+        :param time_scale: multiplies the durations of measurements that take time on the real board, e.g. read_c2f_output().
+            Set to 0 to return immediately.
+        :param dac_bits: the DAC resolution over 0 to max_settable_voltage_V
+        :param noise: the relative standard deviation of the Gaussian noise added to the ADC readings
+        :param event_rate_hz: the total rate of the Poisson output events generated after request_events()
+        :param event_addresses: the addresses that the output events are drawn from uniformly
+        :param firmware_version: the version returned by get_firmware_version()
+        :param teensy_sn: the serial number returned by get_teensy_sn(), by default a new one for each SimPlane, like separate boards
+        :param i0_A: the subthreshold leakage current of the modeled transistor
+        :param kappa: the subthreshold slope factor of the modeled transistor
+        :param c2f_hz_per_A: the gain of the modeled current to frequency converters
+        :param transient_tau_s: the first order time constant of acquire_transient_response()
+        :param start_ticks: the timestamp of the first output event, e.g. close to MAX_TIMESTAMP to test wrap around
+        :param seed: the random seed, or None
+        """
+        self.latency_s = latency_s
+        self.time_scale = time_scale
+        self.dac_lsb_V = self.max_settable_voltage_V / (2**dac_bits - 1)
+        self.noise = noise
+        self.event_rate_hz = event_rate_hz
+        self.event_addresses = np.array(event_addresses)
+        self.firmware_version = tuple(firmware_version)
+        self.teensy_sn = next(SimPlane._serial_numbers) if teensy_sn is None else teensy_sn
+        self.i0_A = i0_A
+        self.kappa = kappa
+        self.c2f_hz_per_A = c2f_hz_per_A
+        self.transient_tau_s = transient_tau_s
+        self.rng = np.random.default_rng(seed)
+        self.c2f_gains = self.rng.lognormal(0, .2, 16)  # per channel mismatch of the C2F converters
+        self.transactions = {}
+        """ The number of calls to the board, by method name. """
+        self.coach_events_sent = 0
+        """ The total number of CoachInputEvent sent to the chip. """
+        self.device_name = None
+        self._voltages = {}  # DacChannel value -> quantized set voltage
+        self._currents = {}  # AdcChannel value -> set current
+        self._last_voltage = 0.
+        self._waveform = []
+        self._bit_depth = 12
+        self._led_intensity = 0
+        self._events = []  # (simulated time s, address) pending for read_events()
+        self._events_until = 0.  # simulated time up to which events were requested
+        self._start_ticks = start_ticks
+        self._t0 = time.perf_counter()
+
+    @classmethod
+    def from_url(cls, url: str, **defaults) -> 'SimPlane':
+        """ Makes a SimPlane from a port name like 'sim://?latency_s=0.001&time_scale=0'.
+
+        :param url: the port name; the query parameters are passed as float keyword arguments to the constructor
+        :param defaults: keyword arguments to the constructor that are used unless given in the query
+        :return: the SimPlane
+        """
+        from urllib.parse import urlsplit, parse_qsl
+        kwargs = {k: float(v) for k, v in parse_qsl(urlsplit(url).query)}
+        for k in ('dac_bits', 'teensy_sn', 'seed'):
+            if k in kwargs:
+                kwargs[k] = int(kwargs[k])
+        return cls(**{**defaults, **kwargs})
+
+    def _transact(self, name: str, duration_s: float = 0) -> None:
+        """ Counts a call to the board and waits its latency plus the scaled duration. """
+        self.transactions[name] = self.transactions.get(name, 0) + 1
+        t = self.latency_s + duration_s * self.time_scale
+        if t > 0:
+            time.sleep(t)
+
+    def n_transactions(self) -> int:
+        """ :return: the total number of calls to the board """
+        return sum(self.transactions.values())
+
+    def _noisy(self, x: float) -> float:
+        return x * (1 + self.noise * self.rng.standard_normal()) if self.noise > 0 else x
+
+    def model_current_A(self, adc_channel=None) -> float:
+        """ The modeled current: a subthreshold nfet whose gate is the last set DAC voltage. Override it to model other circuits.
+
+        :param adc_channel: the AdcChannel being read, or None for the C2F input
+        :return: the current in Amps without noise
+        """
+        return self.i0_A * np.exp(self.kappa * self._last_voltage / 0.025)
+
+    def model_voltage_V(self, adc_channel=None) -> float:
+        """ The modeled voltage: a follower of the last set DAC voltage. Override it to model other circuits.
+
+        :param adc_channel: the AdcChannel being read
+        :return: the voltage in Volts without noise
+        """
+        return self._last_voltage
+
+    def open(self, device: str) -> None:
+        self._transact('open')
+        if self.device_name is not None and device != self.device_name:
+            raise RuntimeError(f'SimPlane already opened as {self.device_name}, cannot open {device}')
+        self.device_name = device
+
+    def get_device_name(self) -> str:
+        return self.device_name
+
+    def get_firmware_version(self) -> tuple:
+        self._transact('get_firmware_version')
+        return self.firmware_version
+
+    def get_teensy_sn(self) -> int:
+        self._transact('get_teensy_sn')
+        return self.teensy_sn
+
+    def reset(self, reset_type):
+        self._transact('reset', duration_s=3 if int(reset_type) == int(pyplane.ResetType.Hard) else 0)
+        self._voltages.clear()
+        self._currents.clear()
+        self._last_voltage = 0.
+        self._events.clear()
+        self._events_until = self._now()
+        return pyplane.TeensyStatus.Success
+
+    def set_voltage(self, dac_channel, v: float) -> float:
+        self._transact('set_voltage')
+        vq = round(min(max(v, 0.), self.max_settable_voltage_V) / self.dac_lsb_V) * self.dac_lsb_V
+        self._voltages[int(dac_channel)] = vq
+        self._last_voltage = vq
+        return vq
+
+    def get_set_voltage(self, dac_channel) -> float:
+        return self._voltages.get(int(dac_channel), 0.)
+
+    def set_current(self, adc_channel, dac_channel, i: float) -> float:
+        self._transact('set_current')
+        self._currents[int(adc_channel)] = i
+        return i
+
+    def get_set_current(self, adc_channel) -> float:
+        return self._currents.get(int(adc_channel), 0.)
+
+    def get_max_current(self, adc_channel) -> float:
+        return 1e-6
+
+    def read_voltage(self, adc_channel) -> float:
+        self._transact('read_voltage')
+        lsb = self.max_settable_voltage_V / (2**self._bit_depth - 1)
+        return round(self._noisy(self.model_voltage_V(adc_channel)) / lsb) * lsb
+
+    def read_current(self, adc_channel) -> float:
+        self._transact('read_current')
+        return self._noisy(self.model_current_A(adc_channel))
+
+    def read_c2f_output(self, duration: float) -> list:
+        self._transact('read_c2f_output', duration_s=duration)
+        rates = self.c2f_gains * self.c2f_hz_per_A * self.model_current_A()
+        return [int(round(c / duration)) for c in self.rng.poisson(rates * duration)]
+
+    def send_coach_events(self, events: list) -> None:
+        self._transact('send_coach_events')
+        self.coach_events_sent += len(events)
+
+    def set_bit_depth(self, bit_depth) -> None:
+        self._transact('set_bit_depth')
+        self._bit_depth = int(bit_depth)
+
+    def get_bit_depth(self):
+        return pyplane.BitDepth(self._bit_depth)
+
+    def set_led_intensity(self, intensity: int) -> None:
+        self._transact('set_led_intensity')
+        self._led_intensity = intensity
+
+    def get_led_intensity(self) -> int:
+        return self._led_intensity
+
+    def set_voltage_waveform(self, waveform: list) -> None:
+        self._transact('set_voltage_waveform')
+        self._waveform = list(waveform)
+
+    def get_voltage_waveform(self) -> list:
+        return self._waveform
+
+    def _acquire(self, dac_channel, adc_channel, time_interval: float, waveform) -> list:
+        # the current channels are GO0_P to GO3, the rest are voltages
+        is_current = int(pyplane.AdcChannel.GO0_P) <= int(adc_channel) <= int(pyplane.AdcChannel.GO3)
+        model = self.model_current_A if is_current else self.model_voltage_V
+        samples = []
+        for v in waveform:
+            self._last_voltage = float(v)
+            samples.append(self._noisy(model(adc_channel)))
+        self._voltages[int(dac_channel)] = self._last_voltage
+        return samples
+
+    def acquire_waveform(self, dac_channel, adc_channel, time_interval: float) -> list:
+        self._transact('acquire_waveform', duration_s=time_interval * len(self._waveform))
+        return self._acquire(dac_channel, adc_channel, time_interval, self._waveform)
+
+    def acquire_transient_response(self, dac_channel, adc_channel, time_interval: float, v_step: float) -> list:
+        n = len(self._waveform)
+        self._transact('acquire_transient_response', duration_s=time_interval * n)
+        v0 = self._voltages.get(int(dac_channel), 0.)
+        t = np.arange(n) * time_interval
+        waveform = v_step + (v0 - v_step) * np.exp(-t / self.transient_tau_s)
+        waveform[:1] = v0  # the first sample is from before the step
+        return self._acquire(dac_channel, adc_channel, time_interval, waveform)
+
+    def _now(self) -> float:
+        """ The simulated time in seconds; with time_scale=0 it only advances by the requested event durations. """
+        return (time.perf_counter() - self._t0) / self.time_scale if self.time_scale > 0 else self._events_until
+
+    def request_events(self, duration: float) -> None:
+        self._transact('request_events')
+        # a request during a previous one extends the collection without generating the overlapping part twice
+        now = self._now()
+        start, end = max(now, self._events_until), now + duration
+        if end > start:
+            n = self.rng.poisson(self.event_rate_hz * (end - start))
+            times = np.sort(self.rng.uniform(start, end, n))
+            addresses = self.rng.choice(self.event_addresses, n) if n > 0 else []
+            self._events.extend(zip(times.tolist(), addresses))
+            self._events_until = end
+
+    def read_events(self) -> list:
+        self._transact('read_events')
+        n = np.searchsorted([e[0] for e in self._events], self._now(), side='right') if self.time_scale > 0 else len(self._events)
+        ready, self._events = self._events[:n], self._events[n:]
+        return [pyplane.CoachOutputEvent(int(a), (self._start_ticks + int(t * self.TICKS_PER_S)) % self.MAX_TIMESTAMP) for t, a in ready]
+
+    def __str__(self):
+        return f'SimPlane(latency_s={self.latency_s}, time_scale={self.time_scale}, transactions={self.n_transactions()}, coach_events_sent={self.coach_events_sent})'
+
+
+class TeensyWatcher():
+    """
+    Keeps the device nodes of the attached Teensys up to date from udev add and remove events, so that finding a board
+    does not walk every tty device, and a reconnect can happen as soon as the board comes back instead of after a fixed wait.
+
+    The events are read by a background thread from a pyudev.Monitor, or from any object with the same poll(timeout) method,
+    e.g. a fake event source in tests. The devices need `action`, `device_node` and `properties` like pyudev.Device.
+    If the monitor fails, the thread stops and `alive` becomes False, since the cache can no longer be trusted.
+    """
+
+    def __init__(self, monitor=None, devices=None, poll_s: float = .5):
+        """
+        :param monitor: the event source; by default a pyudev.Monitor of the tty subsystem
+        :param devices: the devices that are already attached; by default the tty devices enumerated by pyudev
+        :param poll_s: the timeout of each monitor.poll() so the thread can be stopped
+        """
+        import threading
+        if monitor is None or devices is None:
+            from pyudev import Context, Monitor
+            context = Context()
+            if monitor is None:
+                monitor = Monitor.from_netlink(context)
+                monitor.filter_by('tty')
+            if devices is None:
+                devices = context.list_devices(subsystem='tty')
+        self.monitor = monitor
+        self.poll_s = poll_s
+        self.nodes = {}
+        """ dict of device node -> USB serial (udev ID_SERIAL_SHORT) of the attached Teensys. """
+        self._add_counts = {}  # USB serial -> number of add events seen
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self.alive = True
+        """ False once the monitor failed and the watcher stopped; then `nodes` may be stale. """
+        # start receiving events before enumerating, so that a Teensy attached in between is not missed
+        if hasattr(monitor, 'start'):
+            monitor.start()
+        for d in devices:
+            self._handle(d, 'add', count=False)
+        self._thread = threading.Thread(target=self._run, name='teensy-watcher', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def is_teensy(device) -> bool:
+        """ :return: True if the udev device is the Teensy of a Plane PCB """
+        p = device.properties
+        return p.get('ID_VENDOR') in Coach.TEENSY_VENDOR_NAMES and p.get('ID_VENDOR_ID') == Coach.TEENSY_VID and p.get('ID_MODEL_ID') == Coach.TEENSY_PID
+
+    def _handle(self, device, action: str, count: bool = True) -> None:
+        if device.device_node is None or not self.is_teensy(device):
+            return
+        serial = device.properties.get('ID_SERIAL_SHORT')
+        with self._cond:
+            if action == 'add':
+                self.nodes[device.device_node] = serial
+                if count:
+                    self._add_counts[serial] = self._add_counts.get(serial, 0) + 1
+                log.debug(f'Teensy {serial} added at {device.device_node}')
+            elif action == 'remove':
+                self.nodes.pop(device.device_node, None)
+                log.debug(f'Teensy {serial} removed from {device.device_node}')
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                device = self.monitor.poll(timeout=self.poll_s)
+                if device is not None:
+                    self._handle(device, device.action)
+        except Exception as e:
+            log.error(f'udev TeensyWatcher stopped by {e}; falling back to scanning the devices')
+            with self._cond:
+                self.alive = False
+                self._cond.notify_all()
+
+    def stop(self) -> None:
+        """ Stops the watcher thread. """
+        self._stop.set()
+        self._thread.join()
+
+    def find(self, serial: str = None) -> str:
+        """ Finds an attached Teensy from the cache, without walking the tty devices.
+
+        :param serial: the USB serial, or None for any Teensy
+        :return: the first device node in sorted order, or None if there is none
+        """
+        with self._cond:
+            nodes = sorted(n for n, s in self.nodes.items() if serial is None or s == serial)
+        return nodes[0] if len(nodes) > 0 else None
+
+    def add_count(self, serial: str) -> int:
+        """ :return: the number of add events seen for the serial, to pass to wait_for_add() """
+        with self._cond:
+            return self._add_counts.get(serial, 0)
+
+    def wait_for_add(self, serial: str, since_count: int, timeout: float = 10) -> str:
+        """ Waits until the Teensy with the serial is added again.
+
+        :param serial: the USB serial
+        :param since_count: the add_count() before the Teensy went away; returns at once if it was already added since
+        :param timeout: the maximum time to wait in seconds
+        :return: the device node, or None after the timeout
+        """
+        with self._cond:
+            added = self._cond.wait_for(lambda: not self.alive or (self._add_counts.get(serial, 0) > since_count and serial in self.nodes.values()), timeout)
+            if not self.alive:
+                return None
+            return next((n for n, s in sorted(self.nodes.items()) if s == serial), None) if added else None
+
+
 class Coach():
     """
     A wrapper for pyplane to make it easier to use in Python notebooks. 
-    NOTE Coach() is a singleton - you can only create one instance of it in a Python run.
+    NOTE there is one Coach per board: Coach() returns the same default instance for as long as it is referenced,
+    and Coach(usbport=...) or Coach(serial_number=...) return the instance for that board. See `CoachPool` to use several boards at once.
+    A board can be open in only one Coach at a time, e.g. opening it with Coach(usbport='/dev/ttyACM0') while Coach() has it open raises RuntimeError.
 
     The main methods are open(), close(), and setup_XXX() methods. These setup experiments and simplify the measurements.
 
@@ -110,8 +653,50 @@ class Coach():
     # the most recent firmware version. If board has different version user is warned
     _FIRMWARE_VERSION_LATEST = (1, 12, 5)
     """ The most recent version of Plane PCB firmware. """
+    DAC_BITS = 10
+    """ The resolution of the DAC53608 DACs that supply the DacChannel voltages. """
+    DAC_LSB_V = pyplane.Plane.max_settable_voltage_V/(2**DAC_BITS-1)
+    """ The voltage step size of the DACs; the DAC shadow uses the step of the open plane, from its max_settable_voltage_V. """
+    PLANE_RELEASE_S = .5
+    """ How long in seconds to wait after deleting a pyplane.Plane, which releases its serial port, before a board is opened again.
+    pyplane has no close() or any call that reports when the port is released, so there is nothing to poll. """
+    HEARTBEAT_INTERVAL_S = 1.0
+    """ How long in seconds check_open() trusts that the board is still open before checking liveness with a USB round trip. """
+    TEENSY_VID = '16c0'
+    TEENSY_PID = '0483'
+    TEENSY_VENDOR_NAMES = ('Teensyduino',)
+    """ The USB vendor and product IDs and vendor names of the Teensy on the Plane PCB. """
+
+    _instances = weakref.WeakValueDictionary() # (usbport, serial_number) -> Coach, as long as it is used
+    _open_boards = {} # Teensy serial number -> the Coach that has the board open
+    _teensy_watcher = None # the shared TeensyWatcher, made on first use
+
+    @staticmethod
+    def get_teensy_watcher() -> TeensyWatcher:
+        """ Returns the TeensyWatcher shared by all Coach instances, starting it on first use, or again if it has died.
+
+        :return: the TeensyWatcher, or None if udev is not available, e.g. on macOS, or it could not be started
+        """
+        if Coach._teensy_watcher is not None and not Coach._teensy_watcher.alive:
+            Coach._teensy_watcher = None
+        if Coach._teensy_watcher is None and platform.uname().system == "Linux":
+            try:
+                Coach._teensy_watcher = TeensyWatcher()
+            except Exception as e:
+                log.warning(f'could not start udev TeensyWatcher: {e}')
+        return Coach._teensy_watcher
 
-    def __init__(self, logging_level=_LOGGING_LEVEL):
+
+    def __new__(cls, logging_level=_LOGGING_LEVEL, usbport: str = None, serial_number: int = None):
+        key = (usbport, serial_number)
+        instance = cls._instances.get(key)
+        if instance is None:
+            instance = super().__new__(cls)
+            instance._initialized = False
+            cls._instances[key] = instance
+        return instance
+
+    def __init__(self, logging_level=_LOGGING_LEVEL, usbport: str = None, serial_number: int = None):
         """ Make or return existing CoACH device. Coach() is a wrapper for pyplane to make it easier to use in Python notebooks.
 
             The main methods are open(), close(), and setup_XXX() methods. These setup experiments and simplify the measurements.
@@ -119,12 +704,40 @@ class Coach():
             There are also methods for setting up measuring the C2F output frequencies and for setting biases.
 
         :param logging_level: set the logging level, e.g. logging.DEBUG. Default is logging.INFO
+        :param usbport: the USB port of the board that open() opens by default, e.g. '/dev/ttyACM1'.
+            Each port gets its own instance.
+        :param serial_number: the Teensy serial number (see `get_teensy_sn()`) of the board that open() opens by default.
+            Each serial number gets its own instance.
         """
+        log.setLevel(logging_level)
+        if self._initialized:
+            return
+        self._initialized = True
+        self.usbport = usbport
+        self.serial_number = serial_number
         # create a Plane object
         # we only make the pyplane object to use it to talk to CoACH chip when we open it
+        self.connection = ConnectionTracker(heartbeat_interval_s=self.HEARTBEAT_INTERVAL_S)
+        """ Tracks liveness of the connection, see `ConnectionTracker`. Set `coach.connection.heartbeat_interval_s` to change how often it is checked. """
+        self._dac_max_V = pyplane.Plane.max_settable_voltage_V # replaced by the values of the plane when it is opened
+        self._dac_lsb_V = self.DAC_LSB_V
         self.plane = None # perhaps destroy existing plane object, which should close any serial interface to it
         self.open_flag = False
-        log.setLevel(logging_level)
+        self._open_sn = None # the Teensy serial number of the open board, see _register_open_board()
+        self._batch_events = None # list of CoachInputEvent buffered inside a batch(), None if not batching
+        self._batch_depth = 0
+        self._bias_shadow = {} # BiasAddress -> (BiasType, BiasGenMasterCurrent, fine value) last programmed on the chip
+        self._dac_shadow = {} # DacChannel -> (DAC code, quantized voltage) last set on the board
+        self._mux_shadow = None # the mux tuple of the last applied SetupProfile, None if unknown
+        self._bit_depth_shadow = None # the last ADC bit depth set by a SetupProfile, None if unknown
+        self._waveform_hash = None # sha1 of the waveform last uploaded by set_waveform(), None if unknown
+        self.applied_profile = None
+        """ The name of the SetupProfile that was last applied with apply_profile(), or None """
+        self.coach_events_sent = 0
+        """ The number of CoachInputEvent sent to the chip so far; the events of a batch() count when it is sent, and not if it is discarded. """
+        self._coach_events_issued = 0 # the number of CoachInputEvent sent or buffered in a batch, to tell if a setup changed anything
+        self.settle_times = {}
+        """ dict of name -> how long in seconds the last settle() with that name took, see settle(). """
 
     def __del__(self):
         """We override the default destructor to make sure the Pyplane object is deleted"""
@@ -137,7 +750,8 @@ class Coach():
     def open(self, usbport: str = None) -> None:
         """ Opens the CoACH Plane PCB
 
-        :param usbport: the name of the Teensy USB port, if None, then try to scan for Teensyduino
+        :param usbport: the name of the Teensy USB port. If None, then use the port or serial number given to Coach(), or scan for Teensyduino.
+            If it starts with 'sim://', then open a `SimPlane` instead of a board, e.g. 'sim://?latency_s=0.001&time_scale=0'
         
         :raises: RunTimeError if board cannot be opened or there is a timeout or there is a firmware mismatch
         """
@@ -145,13 +759,28 @@ class Coach():
             log.info('was already open')
             return
         self.open_flag = False
+        self._invalidate_shadows()
+        if usbport is None:
+            usbport = self.usbport
+
+        if usbport is not None and usbport.startswith(SimPlane.PORT_PREFIX):
+            self.plane = SimPlane.from_url(usbport, firmware_version=self._FIRMWARE_VERSION_LATEST)
+            self.plane.open(usbport)
+            log.info(f'Opened simulated CoACH {self.plane}')
+            self.open_flag = True
+            self.connection.mark_verified()
+            self._register_open_board()
+            return
 
-        self.plane = pyplane.Plane()
         plane_version = pyplane.get_version()
         if plane_version != self._FIRMWARE_VERSION_LATEST:
             log.warning(f'The pyplane version {plane_version} is different than the latest firmware version {self._FIRMWARE_VERSION_LATEST}; you might be running obsolete pyplane PC library')
 
-        dev = self.find_coach() if usbport is None else usbport
+        if usbport is None and self.serial_number is not None:
+            self.plane, dev = self._find_coach_with_serial_number(self.serial_number)
+        else:
+            self.plane = pyplane.Plane()
+            dev = self.find_coach() if usbport is None else usbport
         if dev is None:
             raise RuntimeError(
                 f'no CoACH board found on USB bus. Did you forget to attach it? \nPlease check https://code.ini.uzh.ch/CoACH/CoACH-labs/-/blob/master/readme.md#troubleshooting-your-coach-chip-setup.')
@@ -175,10 +804,54 @@ class Coach():
                 log.info(
                     f'Opened CoACH at {dev} with firmware version {fw_version}')
                 self.open_flag = True
+                self.connection.mark_verified()
+                self._register_open_board()
         except (RuntimeError, TimeoutError) as e:
+            self.connection.note_transport_error(e)
             raise RuntimeError(
                 f'{dev} did not open; got {e}.\nPlease check https://code.ini.uzh.ch/CoACH/CoACH-labs/-/blob/master/readme.md#troubleshooting-your-coach-chip-setup.')
 
+    @staticmethod
+    def find_coaches() -> list:
+        """ Finds all the attached CoACH boards.
+
+        :return: list of the device names, e.g. ['/dev/ttyACM0','/dev/ttyACM1'], empty if none is found
+        """
+        uname = platform.uname().system
+        if uname == "Linux":
+            watcher = Coach.get_teensy_watcher()
+            devs = sorted(watcher.nodes) if watcher is not None else []
+            log.debug(f'found CoACH boards at {devs}')
+            return devs
+        elif uname == "Darwin":
+            return sorted(glob.glob("/dev/cu.usb*"))
+        else:
+            raise ValueError("Unsupported Operating System")
+
+    def _find_coach_with_serial_number(self, serial_number: int) -> tuple:
+        """ Opens the attached boards one by one until finding the one with the Teensy serial number.
+
+        :return: (plane, device name), with the plane open on the device
+        :raises: RuntimeError if there is no such board
+        """
+        for dev in self.find_coaches():
+            if any(c.plane is not None and c.plane.get_device_name() == dev for c in Coach._open_boards.values() if c is not self):
+                continue # another Coach has this board open
+            plane = pyplane.Plane()
+            try:
+                plane.open(dev)
+                sn = plane.get_teensy_sn()
+            except RuntimeError as e:
+                log.debug(f'could not open {dev} to check its serial number: {e}')
+                sn = None
+            if sn == serial_number:
+                log.debug(f'found Teensy with serial number {sn} at {dev}')
+                return plane, dev
+            # release the board the same way as close(), so that the next one is not opened while this port is still being released
+            del plane
+            time.sleep(self.PLANE_RELEASE_S)
+        raise RuntimeError(f'no CoACH board with Teensy serial number {serial_number} found on USB bus')
+
     def find_coach(self) -> str:
         """ Finds the CoACH board USB device if it is there.
 
@@ -186,10 +859,15 @@ class Coach():
         """
         uname = platform.uname().system
         if uname == "Linux":
+            watcher = self.get_teensy_watcher()
+            dev = watcher.find() if watcher is not None and watcher.alive else None
+            if dev is not None:
+                log.debug(f'Found CoACH at {dev} from udev cache')
+                return dev
             from pyudev import Context, Monitor
-            VID = '16c0'
-            PID = '0483'
-            VENDOR_NAMES = ('Teensyduino')
+            VID = self.TEENSY_VID
+            PID = self.TEENSY_PID
+            VENDOR_NAMES = self.TEENSY_VENDOR_NAMES
 
             ctx = Context()
             # devs=ctx.list_devices()
@@ -241,19 +919,51 @@ class Coach():
         if self.plane is None or not self.open_flag:
             return False
         if self.open_flag and self.get_firmware_version() == (255, 255, 255):
+            self.connection.mark_stale()
             return False
+        self.connection.mark_verified()
         return True
 
+    def _register_open_board(self) -> None:
+        """ Records that this Coach has the board open, keyed by its Teensy serial number, so that another Coach cannot open it too.
+
+        :raises: RuntimeError, after closing, if another open Coach already has this board
+        """
+        sn = self.plane.get_teensy_sn()
+        other = Coach._open_boards.get(sn)
+        if other is not None and other is not self and other.open_flag:
+            self.close()
+            raise RuntimeError(f'the CoACH board with Teensy serial number {sn} is already open by another Coach (usbport={other.usbport}, serial_number={other.serial_number}); use that one')
+        Coach._open_boards[sn] = self
+        self._open_sn = sn
+
     def close(self) -> None:
         """Closes the board. Deletes the pyplane.Plane() object. """
+        if Coach._open_boards.get(self._open_sn) is self:
+            del Coach._open_boards[self._open_sn]
+        self._open_sn = None
         if not self.plane is None:
             log.info('closing device (deleting pyplane.Plane() object')
+            simulated = isinstance(self._pyplane, SimPlane)
             del self.plane
-            time.sleep(.5) # to give time for cleanup
+            if not simulated:
+                time.sleep(self.PLANE_RELEASE_S)
         self.plane=None
+        self.open_flag = False
+        self.connection.mark_stale()
+        self._invalidate_shadows()
 
     def check_open(self) -> None:
-        """ Checks if open and opens if not. """
+        """ Checks if open and opens if not.
+
+        The open state is trusted without a USB round trip until the `connection` heartbeat interval expires
+        or a transport error is noted; see `ConnectionTracker`.
+        """
+        if self.plane is not None and self.open_flag and self.connection.is_trusted():
+            self.connection.saved_round_trips += 1
+            return
+        if self.plane is not None and self.open_flag:
+            self.connection.liveness_checks += 1
         if not self.is_open():
             self.open()
 
@@ -267,10 +977,48 @@ class Coach():
             return
         return self.plane.get_firmware_version()
 
-    def get_pyplane(self) -> pyplane.Plane:
-        """ Returns the low level pyplane object"""
+    def get_teensy_sn(self) -> int:
+        """ returns the serial number of the Teensy on the Plane PCB
+
+        :return: the serial number
+        """
+        self.check_open()
+        return self.plane.get_teensy_sn()
+
+    CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ne1')
+    """ The folder where per-board calibrations are cached. """
+
+    def get_pyplane(self) -> TrackedPlane:
+        """ Returns the low level pyplane object, wrapped in a `TrackedPlane` that behaves like it.
+        DAC voltages set with its set_voltage() are recorded in the DAC shadow, so that set_dac_voltage() does not skip a later write,
+        and the waveform hash of set_waveform() is forgotten, since the caller may reprogram the waveform buffer.
+        """
+        self._forget_waveform()
         return self.plane
 
+    @property
+    def plane(self) -> TrackedPlane:
+        """ The low level pyplane object wrapped in a `TrackedPlane`, so that transport errors of all the board calls are noted in `connection`
+        and DAC writes are recorded in the DAC shadow. """
+        return self._tracked_plane
+
+    @plane.setter
+    def plane(self, plane) -> None:
+        self._pyplane = plane
+        self._tracked_plane = None if plane is None else TrackedPlane(plane, self.connection, {
+            'set_voltage': self._note_dac_write,
+            # the calls that reprogram the waveform buffer
+            'set_voltage_waveform': self._forget_waveform,
+            'acquire_transient_response': self._forget_waveform,
+        })
+        if plane is not None:
+            self._dac_max_V = plane.max_settable_voltage_V
+            self._dac_lsb_V = self._dac_max_V/(2**self.DAC_BITS-1)
+
+    @plane.deleter
+    def plane(self) -> None:
+        self.plane = None
+
     def reset_soft(self) -> None:
         """Do a soft reset. This 
         1. turns off AER output, LEDs, DAC outputs
@@ -280,6 +1028,7 @@ class Coach():
         """
         self.check_open()
         self.plane.reset(pyplane.ResetType.Soft)
+        self._invalidate_shadows()
 
     def reset_hard(self) -> None:
         """
@@ -292,11 +1041,50 @@ class Coach():
             5. Tries to reconnect to the Teensy using the same device name with which it was opened.
             6. Checks that the board that it has now connected to has the same serial number as the board that it was connected to before the reset.
 
+        Steps 2-6 happen inside pyplane, so its wait cannot be shortened here. If pyplane fails to reconnect, e.g. because the board
+        came back on another device name, then reconnect() reopens it as soon as udev reports it.
+
         NOTE: This call will block the Coach board from being accessed for at least 5 seconds
         """
         self.check_open()
         log.warning('Doing a HARD reset. Board will be disconnected from host.')
-        self.plane.reset(pyplane.ResetType.Hard)
+        watcher = self.get_teensy_watcher() if not isinstance(self._pyplane, SimPlane) else None
+        serial = watcher.nodes.get(self.plane.get_device_name()) if watcher is not None else None
+        add_count = watcher.add_count(serial) if serial is not None else 0
+        try:
+            status = self.plane.reset(pyplane.ResetType.Hard)
+        except RuntimeError as e:
+            log.warning(f'hard reset did not reconnect: {e}')
+            status = pyplane.TeensyStatus.HardResetFailed
+        self.connection.mark_stale()
+        self._invalidate_shadows()
+        if status == pyplane.TeensyStatus.HardResetFailed:
+            self.reconnect(serial=serial, add_count=add_count)
+
+    def reconnect(self, timeout: float = 10, serial: str = None, add_count: int = None) -> None:
+        """ Reopens the board after it went away from the USB bus, as soon as udev reports that the same Teensy is back.
+
+        :param timeout: the maximum time to wait for the board in seconds
+        :param serial: the USB serial of the Teensy, by default the one of the device that is open now
+        :param add_count: the TeensyWatcher.add_count() from before the board went away; by default from now
+        :raises: RuntimeError if the board did not come back before the timeout
+        """
+        dev = self.plane.get_device_name() if self.plane is not None else self.usbport
+        watcher = self.get_teensy_watcher() if dev is None or not dev.startswith(SimPlane.PORT_PREFIX) else None
+        if watcher is not None and serial is None:
+            serial = watcher.nodes.get(dev)
+        if watcher is not None and add_count is None and serial is not None:
+            add_count = watcher.add_count(serial)
+        self.plane = None # drop the old pyplane.Plane without the close() cleanup wait
+        self.open_flag = False
+        if watcher is not None and serial is not None:
+            t = time.perf_counter()
+            new_dev = watcher.wait_for_add(serial, add_count, timeout=timeout)
+            if new_dev is None:
+                raise RuntimeError(f'Teensy {serial} did not come back at {dev} within {timeout}s')
+            log.info(f'Teensy {serial} came back at {new_dev} after {time.perf_counter()-t:.2f}s')
+            dev = new_dev
+        self.open(dev)
 
     def set_debug(self, yes:bool)->None:
         """ Enables or disables debug mode for pyplane.
@@ -315,24 +1103,237 @@ class Coach():
         :param yes: set True to turn on debugging.
         """
         self.check_open()
-        self.get_pyplane().debug=yes
+        self.plane.debug=yes
 
+    # NOTE DACs
 
+    def set_dac_voltage(self, dac_channel: pyplane.DacChannel, v: float) -> float:
+        """ Sets the voltage of a DAC channel, skipping the USB write if the channel already holds the same DAC code.
 
-    # NOTE NFET
+        The DAC code of the voltage that the board returned for the last write of each channel is kept in a shadow copy,
+        also for writes made with `get_pyplane().set_voltage()`. A request that rounds to the same DAC code
+        (in steps of max_settable_voltage_V/(2**DAC_BITS-1) of the plane) returns the cached value without touching the board.
+        Only a write that bypasses Coach, e.g. through a pyplane.Plane opened separately, needs `invalidate_dac_shadow()` afterwards.
 
-    def setup_nfet(self) -> None:
-        """ Setup the nfet for measurement"""
+        :param dac_channel: the pyplane.DacChannel, e.g. pyplane.DacChannel.AIN0
+        :param v: the voltage in volts
+        :return: the actual voltage set after DAC quantization
+        """
+        cached = self._dac_shadow.get(dac_channel)
+        if cached is not None and cached[0] == round(min(max(v, 0.), self._dac_max_V)/self._dac_lsb_V):
+            return cached[1]
+        self.check_open()
+        return self._set_dac_voltage(dac_channel, v)
+
+    def _set_dac_voltage(self, dac_channel: pyplane.DacChannel, v: float) -> float:
+        """ set_dac_voltage() without check_open(), for inner loops that checked once before the loop. """
+        cached = self._dac_shadow.get(dac_channel)
+        if cached is not None and cached[0] == round(min(max(v, 0.), self._dac_max_V)/self._dac_lsb_V):
+            return cached[1]
+        return self.plane.set_voltage(dac_channel, v) # recorded in the shadow by _note_dac_write()
+
+    def _note_dac_write(self, vq: float, dac_channel: pyplane.DacChannel, v: float) -> None:
+        """ Records the voltage that the board returned from set_voltage() in the DAC shadow; called by the `TrackedPlane`. """
+        self._dac_shadow[dac_channel] = (round(vq/self._dac_lsb_V), vq)
+
+    def get_dac_shadow(self) -> dict:
+        """ Returns the shadow copy of the DAC voltages that were set since the last open() or reset.
+
+        :return: dict of pyplane.DacChannel -> quantized voltage in volts
+        """
+        return {k: v[1] for k, v in self._dac_shadow.items()}
+
+    def invalidate_dac_shadow(self, dac_channel: pyplane.DacChannel = None) -> None:
+        """ Forgets the shadow copy of the DAC voltages, so that the next set_dac_voltage() is sent to the board.
+        Called by open(), close(), reset_soft() and reset_hard(), and for the channel driven by waveform and transient measurements.
+
+        :param dac_channel: the channel to forget, or None for all channels
+        """
+        if dac_channel is None:
+            self._dac_shadow = {}
+        else:
+            self._dac_shadow.pop(dac_channel, None)
+
+    # NOTE settling
+
+    def settle(self, measure_fn, abs_tol: float = 0, rel_tol: float = 0.01, n_stable: int = 3, interval_s: float = 0.01,
+               timeout_s: float = 5, min_s: float = 0, name: str = 'settle') -> tuple:
+        """ Waits until a measurement stops changing, instead of sleeping a fixed time.
+
+        Polls measure_fn every interval_s until the last n_stable readings are all within max(abs_tol, rel_tol*|reading|) of each other
+        and at least min_s has passed, or until timeout_s, in which case a warning is logged. The time it took is stored in `settle_times[name]`.
+        The readings must be far enough apart (interval_s) that a slow ramp changes them by more than the tolerance,
+        otherwise a slowly settling circuit is declared settled while it is still moving.
+
+        :param measure_fn: function without arguments that returns the reading, e.g. an ADC voltage or a C2F rate
+        :param abs_tol: the absolute tolerance of the readings
+        :param rel_tol: the tolerance of the readings relative to their magnitude
+        :param n_stable: the number of consecutive readings that must agree
+        :param interval_s: the time to wait between readings in seconds, in addition to the time measure_fn takes
+        :param timeout_s: the maximum time to wait in seconds
+        :param min_s: the minimum time to wait in seconds, e.g. about one time constant of the circuit
+        :param name: the name of what is settling, for settle_times and logging
+        :return: (reading, elapsed_s), the last reading and how long settling took in seconds
+        """
+        start = time.perf_counter()
+        readings = [measure_fn()]
+        while True:
+            elapsed_s = time.perf_counter() - start
+            last = readings[-n_stable:]
+            if elapsed_s >= min(min_s, timeout_s) and len(last) == n_stable and max(last) - min(last) <= max(abs_tol, rel_tol * abs(readings[-1])):
+                log.debug(f'{name} settled in {elapsed_s*1e3:.1f}ms to {readings[-1]:.4g} after {len(readings)} readings')
+                break
+            if elapsed_s >= timeout_s:
+                log.warning(f'{name} did not settle within {timeout_s}s, the last {n_stable} readings were {last}')
+                break
+            if interval_s > 0:
+                time.sleep(interval_s)
+            readings.append(measure_fn())
+        self.settle_times[name] = elapsed_s
+        return readings[-1], elapsed_s
+
+    def settle_voltage(self, adc_channel: pyplane.AdcChannel, abs_tol: float = 2e-3, timeout_s: float = 5, **kwargs) -> tuple:
+        """ Waits until an ADC voltage stops changing, see settle().
+
+        :param adc_channel: the pyplane.AdcChannel, e.g. pyplane.AdcChannel.AOUT10
+        :param abs_tol: the tolerance in volts
+        :param timeout_s: the maximum time to wait in seconds
+        :return: (voltage, elapsed_s)
+        """
+        self.check_open()
+        return self.settle(lambda: self.plane.read_voltage(adc_channel), abs_tol=abs_tol, rel_tol=0, timeout_s=timeout_s,
+                           name=kwargs.pop('name', f'voltage {adc_channel}'), **kwargs)
+
+    def settle_c2f(self, channel: int = 0, window_s: float = 0.02, rel_tol: float = 0.05, timeout_s: float = 5, **kwargs) -> tuple:
+        """ Waits until a C2F frequency stops changing, see settle().
+
+        The frequencies are counted in windows of window_s, so they are quantized in steps of 1/window_s;
+        by default readings that differ by up to 2 counts (abs_tol=2/window_s) also count as settled, so that slow channels can settle.
+
+        :param channel: the C2F channel, 0-15
+        :param window_s: the duration of each frequency measurement in seconds; rel_tol must allow for its Poisson count noise
+        :param rel_tol: the relative tolerance of the frequency
+        :param timeout_s: the maximum time to wait in seconds
+        :return: (frequency in Hz, elapsed_s)
+        """
         self.check_open()
+        return self.settle(lambda: self.measure_c2f_freqs(window_s)[channel], abs_tol=kwargs.pop('abs_tol', 2/window_s), rel_tol=rel_tol,
+                           interval_s=kwargs.pop('interval_s', 0), timeout_s=timeout_s, name=kwargs.pop('name', f'C2F channel {channel}'), **kwargs)
+
+    # NOTE averaging
+
+    def measure_averaged(self, measure_fn, *args, rel_sem: float = 0.01, abs_sem: float = 0, min_n: int = 2, max_n: int = 100) -> AveragedMeasurement:
+        """ Averages repeated readings only until the standard error of their mean is small enough.
+
+        Readings are taken until the standard error std/sqrt(n) is at most max(abs_sem, rel_sem*|mean|), but at least min_n and at most max_n readings.
+        E.g. `coach.measure_averaged(coach.measure_nfet_id, rel_sem=.01)` takes two readings of a quiet above threshold current
+        and up to max_n of a noisy subthreshold current.
+
+        :param measure_fn: the measurement function, e.g. coach.measure_nfet_id, returning a number
+        :param args: the arguments of measure_fn, e.g. the ADC channel for coach.plane.read_voltage
+        :param rel_sem: the target standard error relative to the magnitude of the mean
+        :param abs_sem: the target absolute standard error
+        :param min_n: the minimum number of readings; the error can only be estimated from 2 or more
+        :param max_n: the maximum number of readings
+        :return: AveragedMeasurement(mean, std, n); std is 0 for a single reading
+        """
+        mean, m2, n = 0., 0., 0
+        while n < max_n:
+            x = measure_fn(*args)
+            n += 1
+            delta = x - mean  # Welford's running mean and sum of squared deviations
+            mean += delta / n
+            m2 += delta * (x - mean)
+            if n >= max(min_n, 2) and np.sqrt(m2 / (n - 1) / n) <= max(abs_sem, rel_sem * abs(mean)):
+                converged = True
+                break
+        else:
+            converged = False
+        std = np.sqrt(m2 / (n - 1)) if n > 1 else 0.
+        if not converged:
+            log.debug(f'{getattr(measure_fn, "__name__", measure_fn)} reached max_n={max_n} readings with std error {std/np.sqrt(n):.3g}')
+        return AveragedMeasurement(mean, std, n)
+
+    # NOTE ADC scan
+
+    def scan_adc(self, adc_channels, n_repeats: int = None, duration_s: float = None, read_current: bool = False) -> tuple:
+        """ Samples several ADC channels round-robin in a tight loop, e.g. all the WTA outputs `WTA_LVOUT_CHANNELS`.
+
+        Each row of the result reads every channel once, in the given order, and is timestamped with time.perf_counter_ns() just before its first read.
+        The channels of a row are read one USB round trip apart, so channel k lags the row timestamp by about k*(row duration)/n_channels;
+        the row duration is the difference of consecutive timestamps.
+
+        :param adc_channels: the list of pyplane.AdcChannel to read
+        :param n_repeats: the number of rows to sample
+        :param duration_s: alternatively to n_repeats, sample rows for this long in seconds
+        :param read_current: set True to read currents with plane.read_current() instead of voltages with plane.read_voltage()
+        :return: (samples, timestamps_ns): (n_rows, n_channels) array of the voltages in V (or currents in A) and the (n_rows,) int64 array of row timestamps in ns
+        """
+        if (n_repeats is None) == (duration_s is None):
+            raise ValueError('give either n_repeats or duration_s')
+        self.check_open()
+        read = self.plane.read_current if read_current else self.plane.read_voltage
+        channels = list(adc_channels)
+        rows = []
+        timestamps_ns = []
+        if n_repeats is not None:
+            for _ in range(n_repeats):
+                timestamps_ns.append(time.perf_counter_ns())
+                rows.append([read(ch) for ch in channels])
+        else:
+            end_ns = time.perf_counter_ns() + int(duration_s * 1e9)
+            while True:
+                t = time.perf_counter_ns()
+                if t >= end_ns:
+                    break
+                timestamps_ns.append(t)
+                rows.append([read(ch) for ch in channels])
+        samples = np.array(rows, dtype=float).reshape(len(rows), len(channels))
+        timestamps_ns = np.array(timestamps_ns, dtype=np.int64)
+        if len(rows) > 1:
+            log.debug(f'scanned {len(channels)} ADC channels {len(rows)} times, {np.mean(np.diff(timestamps_ns))/1e3:.1f}us per row')
+        return samples, timestamps_ns
+
+    FET_SWEEP_DTYPE = np.dtype([('vg', 'f8'), ('vd', 'f8'), ('vs', 'f8'), ('id', 'f8'), ('is', 'f8')])
+    """ The dtype of the structured arrays returned by sweep_nfet() and sweep_pfet(); voltages in volts, currents in amps. """
+
+    def _sweep_fet(self, terminals: dict, currents: dict, settle_s: float) -> np.ndarray:
+        """ Sweeps the FET terminal voltages over the broadcast grid of the given arrays and measures the currents at each point.
+
+        :param terminals: dict of field name -> (pyplane.DacChannel, voltages or None to leave the terminal as it is)
+        :param currents: dict of field name -> pyplane.AdcChannel to measure, the other current fields are NaN
+        :param settle_s: time to wait after setting the voltages of each point before measuring
+        :return: structured array of `FET_SWEEP_DTYPE` with the broadcast shape of the voltages
+        """
         self.check_open()
-        # configure muxes to measure NFET
-        events = [pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine5,
-            pyplane.Coach.VoltageOutputSelect.NoneSelected,
-            pyplane.Coach.VoltageInputSelect.SelectLine2,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)]
+        swept = {k: np.asarray(v, dtype=float) for k, (ch, v) in terminals.items() if v is not None}
+        shape = np.broadcast_shapes(*(v.shape for v in swept.values()))
+        out = np.full(shape, np.nan, dtype=self.FET_SWEEP_DTYPE)
+        for k, (ch, v) in terminals.items():
+            if v is None and ch in self._dac_shadow:
+                out[k] = self._dac_shadow[ch][1]
+        # plain python lists and locals so that the inner loop makes only the USB calls
+        points = [(k, terminals[k][0], np.broadcast_to(v, shape).ravel().tolist()) for k, v in swept.items()]
+        measured = list(currents.items())
+        flat = out.reshape(-1)
+        set_dac_voltage = self._set_dac_voltage
+        read_current = self.plane.read_current
+        for i in range(flat.size):
+            for k, ch, vs in points:
+                flat[i][k] = set_dac_voltage(ch, vs[i])
+            if settle_s > 0:
+                time.sleep(settle_s)
+            for k, ch in measured:
+                flat[i][k] = read_current(ch)
+        return out
+
+
+
+    # NOTE NFET
 
-        self.plane.send_coach_events(events)
+    def setup_nfet(self) -> None:
+        """ Setup the nfet for measurement"""
+        self.apply_profile('nfet')
         log.debug('setup NFET measurement')
 
     def set_nfet_vg(self, v) -> float:
@@ -341,8 +1342,7 @@ class Coach():
         :return: the actual voltage set after DAC quantization
         """
         self.check_open()
-        self.plane.set_voltage(pyplane.DacChannel.AIN0, v)
-        return self.plane.get_set_voltage(pyplane.DacChannel.AIN0)
+        return self.set_dac_voltage(pyplane.DacChannel.AIN0, v)
 
     def set_nfet_vb(self, v) -> int:
         """ does nothing, since nfet bulk is always zero"""
@@ -355,13 +1355,13 @@ class Coach():
     def set_nfet_vs(self, v) -> float:
         """ set the nfet source voltage"""
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.GO20, v)
+        v = self.set_dac_voltage(pyplane.DacChannel.GO20, v)
         return v
 
     def set_nfet_vd(self, v) -> float:
         """ set the nfet drain voltage"""
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.GO22, v)
+        v = self.set_dac_voltage(pyplane.DacChannel.GO22, v)
         return v
 
     def measure_nfet_id(self) -> float:
@@ -382,6 +1382,25 @@ class Coach():
         i = self.plane.read_current(pyplane.AdcChannel.GO20_N)
         return i
 
+    def sweep_nfet(self, vg=None, vd=None, vs=None, measure=('id', 'is'), settle_s: float = 0) -> np.ndarray:
+        """ Sweeps the nfet terminal voltages and measures its currents at each point.
+
+        The voltages are broadcast against each other, e.g. `sweep_nfet(vg=np.linspace(0,1,100), vd=np.array([.1,1])[:,None], vs=0)`
+        measures an Id-Vg curve for each of two drain voltages and returns a (2,100) array.
+        The points are measured in C order, so the voltages along the last axis change fastest; DAC writes that would not change the DAC code are skipped.
+        Call setup_nfet() first.
+
+        :param vg: the gate voltages, or None to leave the gate as it is
+        :param vd: the drain voltages, or None to leave the drain as it is
+        :param vs: the source voltages, or None to leave the source as it is
+        :param measure: the currents to measure at each point, any of 'id' and 'is'
+        :param settle_s: time to wait in seconds after setting the voltages of each point
+        :return: structured array of `FET_SWEEP_DTYPE` with fields vg, vd, vs (the actual quantized voltages) and id, is (the currents, NaN if not measured)
+        """
+        return self._sweep_fet({'vg': (pyplane.DacChannel.AIN0, vg), 'vd': (pyplane.DacChannel.GO22, vd), 'vs': (pyplane.DacChannel.GO20, vs)},
+                               {k: {'id': pyplane.AdcChannel.GO22, 'is': pyplane.AdcChannel.GO20_N}[k] for k in measure},
+                               settle_s)
+
 # NOTE NFET and PFET arrays (NFA and PFA)
 
     # the length in um of the NFETs in the NFA are (N+1)*NFA_LENGTHS_UNIT_UM where N is the C2F channel number
@@ -397,18 +1416,7 @@ class Coach():
 
         The FET lengths are  in `(N+1)*NFA_LENGTHS_UNIT_UM` where `N` is the C2F channel number.
         """
-        self.check_open()
-        self.setup_c2f()
-        import pyplane
-
-        # configure nfet array C2Fs
-        # they are on C2F select line 0
-        # the gate voltage input is on Select 2
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine0,
-            pyplane.Coach.VoltageOutputSelect.SelectLine1,
-            pyplane.Coach.VoltageInputSelect.SelectLine2,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])
+        self.apply_profile('nfa')
 
     def set_nfa_vg(self, vgn) -> float:
         """Sets the NFET array gate voltage
@@ -417,7 +1425,7 @@ class Coach():
         :return: the quantized voltage
         """
         self.check_open()
-        return self.plane.set_voltage(pyplane.DacChannel.AIN1, vgn)
+        return self.set_dac_voltage(pyplane.DacChannel.AIN1, vgn)
 
     def setup_pfa(self) -> None:
         """Sets up the PFET array.  
@@ -429,18 +1437,7 @@ class Coach():
 
         The FET lengths are  in `(N+1)*NFA_LENGTHS_UNIT_UM` where `N` is the C2F channel number.
         """
-        self.check_open()
-        self.setup_c2f()
-        import pyplane
-
-        # configure pfet array C2Fs
-        # they are on C2F select line 1 (Table 8 of https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=sharing)
-        # the gate voltage input is on Select 1 (Table 3 of chip_architecture.pdf https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=sharing)
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine1,
-            pyplane.Coach.VoltageOutputSelect.SelectLine1,
-            pyplane.Coach.VoltageInputSelect.SelectLine1,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])  # TODO not checked yet
+        self.apply_profile('pfa')
 
     def set_pfa_vg(self, vgp) -> float:
         """Sets the PFET array gate voltage
@@ -450,7 +1447,7 @@ class Coach():
         """
         self.check_open()
         # TODO not checked
-        return self.plane.set_voltage(pyplane.DacChannel.AIN2, vgp)
+        return self.set_dac_voltage(pyplane.DacChannel.AIN2, vgp)
 
 
 # NOTE PFET
@@ -458,15 +1455,7 @@ class Coach():
 
     def setup_pfet(self) -> None:
         """ setup the PFET for measurement"""
-        self.check_open()
-        # configure muxes to measure PFET
-        events = [pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine5,
-            pyplane.Coach.VoltageOutputSelect.NoneSelected,
-            pyplane.Coach.VoltageInputSelect.SelectLine1,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)]
-
-        self.plane.send_coach_events(events)
+        self.apply_profile('pfet')
         log.debug('setup PFET measurement')
 
     def set_pfet_vg(self, v) -> float:
@@ -475,25 +1464,25 @@ class Coach():
         :return: the actual voltage set after DAC quantization
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN0, v)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN0, v)
         return v
 
     def set_pfet_vb(self, v) -> float:
         """ set the pfet bulk voltage"""
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN1, v)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN1, v)
         return v
 
     def set_pfet_vs(self, v) -> float:
         """ set the pfet source voltage"""
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.GO23, v)
+        v = self.set_dac_voltage(pyplane.DacChannel.GO23, v)
         return v
 
     def set_pfet_vd(self, v) -> float:
         """ set the pfet drain voltage"""
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.GO21, v)
+        v = self.set_dac_voltage(pyplane.DacChannel.GO21, v)
         return v
 
     def measure_pfet_id(self) -> float:
@@ -516,6 +1505,22 @@ class Coach():
             pyplane.AdcChannel.GO21_N)  # note here we measure the PFET current at its source
         return i
 
+    def sweep_pfet(self, vg=None, vd=None, vs=None, measure=('id', 'is'), settle_s: float = 0) -> np.ndarray:
+        """ Sweeps the pfet terminal voltages and measures its currents at each point.
+
+        The voltages are broadcast against each other like in sweep_nfet(). Set the bulk with set_pfet_vb() and call setup_pfet() first.
+
+        :param vg: the gate voltages, or None to leave the gate as it is
+        :param vd: the drain voltages, or None to leave the drain as it is
+        :param vs: the source voltages, or None to leave the source as it is
+        :param measure: the currents to measure at each point, any of 'id' and 'is', measured as in measure_pfet_id() and measure_pfet_is()
+        :param settle_s: time to wait in seconds after setting the voltages of each point
+        :return: structured array of `FET_SWEEP_DTYPE` with fields vg, vd, vs (the actual quantized voltages) and id, is (the currents, NaN if not measured)
+        """
+        return self._sweep_fet({'vg': (pyplane.DacChannel.AIN0, vg), 'vd': (pyplane.DacChannel.GO21, vd), 'vs': (pyplane.DacChannel.GO23, vs)},
+                               {k: {'id': pyplane.AdcChannel.GO23, 'is': pyplane.AdcChannel.GO21_N}[k] for k in measure},
+                               settle_s)
+
 # NOTE diff pair (n type) NDP
     NDP_I1_C2F_CHANNEL = 0
     NDP_I2_C2F_CHANNEL = 1
@@ -552,14 +1557,7 @@ class Coach():
 # NOTE synonyms for NDP
     def setup_ndp(self) -> None:
         """ Sets up n-type diff pair. """
-        self.check_open()
-        self.setup_c2f()
-
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine5,
-            pyplane.Coach.VoltageOutputSelect.NoneSelected,
-            pyplane.Coach.VoltageInputSelect.SelectLine2,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])
+        self.apply_profile('ndp')
 
     def set_ndp_v1(self, v1) -> float:
         """ Sets NDP V1
@@ -568,7 +1566,7 @@ class Coach():
         :return: its quantized value
         """
         self.check_open()
-        return self.plane.set_voltage(pyplane.DacChannel.AIN5, v1)  # V1 = 0.6
+        return self.set_dac_voltage(pyplane.DacChannel.AIN5, v1)  # V1 = 0.6
 
     def set_ndp_v2(self, v2) -> float:
         """ Sets NDP V2
@@ -577,7 +1575,7 @@ class Coach():
         :return: its quantized value
         """
         self.check_open()
-        return self.plane.set_voltage(pyplane.DacChannel.AIN6, v2)  # V2 = 0.2
+        return self.set_dac_voltage(pyplane.DacChannel.AIN6, v2)  # V2 = 0.2
 
     def set_ndp_ib(self, bias_coarse: pyplane.Coach.BiasGenMasterCurrent, fine_value) -> float:
         """Sets the bias current of the NDP (n type diff pair).
@@ -601,14 +1599,7 @@ class Coach():
 
     def setup_bab(self) -> None:
         """ Setup the Bump Anti Bump (BAB) circuit."""
-        self.check_open()
-        self.setup_c2f()
-
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine5,
-            pyplane.Coach.VoltageOutputSelect.NoneSelected,
-            pyplane.Coach.VoltageInputSelect.SelectLine2,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])
+        self.apply_profile('bab')
 
     def set_bab_v1(self, v1) -> float:
         """Sets the V1 input of the BAB
@@ -617,7 +1608,7 @@ class Coach():
         :return: the actual quantized voltage
         """
         self.check_open()
-        return self.plane.set_voltage(pyplane.DacChannel.AIN12, v1)
+        return self.set_dac_voltage(pyplane.DacChannel.AIN12, v1)
 
     def set_bab_v2(self, v2) -> float:
         """Sets the V2 input of the BAB
@@ -626,7 +1617,7 @@ class Coach():
         :return: the actual quantized voltage
         """
         self.check_open()
-        return self.plane.set_voltage(pyplane.DacChannel.AIN13, v2)
+        return self.set_dac_voltage(pyplane.DacChannel.AIN13, v2)
 
     def set_bab_ib(self, coarse_current_bab: pyplane.Coach.BiasGenMasterCurrent, fine_current_bab) -> float:
         """Sets the bias current of the BAB bump-antibump circuit. 
@@ -646,13 +1637,13 @@ class Coach():
             coarse_current=coarse_current_bab, fine_value=fine_current_bab)
         return Ib_bab
 
+    R2R_BUFFER_BIAS = (pyplane.Coach.BiasAddress.RR_BIAS_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I240nA, 255)
+    """ The (address, type, coarse, fine) bias tuple of the output rail-to-rail buffer. """
+
     def setup_r2r_buffer(self)->None:
         ''' Sets up the rail to rail buffer for all analog outputs'''
         # setup output rail-to-rail buffer
-        self.set_bias(
-            pyplane.Coach.BiasAddress.RR_BIAS_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I240nA, 255)
+        self.set_bias_from_tuple(self.R2R_BUFFER_BIAS)
         log.debug('setup rail to rail (RR) output analog voltage buffer')
 
 
@@ -666,19 +1657,7 @@ class Coach():
 
     def setup_nta(self) -> None:
         """Sets up the NTA (n-type 5-T transamp)."""
-        self.check_open()
-        self.setup_c2f()
-
-        # setup output p-type rail-to-rail buffer
-        self.setup_r2r_buffer()
-
-        # configure N type TransAmp
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine5,
-            pyplane.Coach.VoltageOutputSelect.SelectLine1,
-            pyplane.Coach.VoltageInputSelect.SelectLine2,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])
-
+        self.apply_profile('nta')
         log.debug('setup NTA')
 
     def set_nta_ib(self, bias_coarse: pyplane.Coach.BiasGenMasterCurrent, fine_value: int) -> float:
@@ -703,7 +1682,7 @@ class Coach():
         :param v1: volts 
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN3, v1)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN3, v1)
         return v
 
     def set_nta_v2(self, v2) -> float:
@@ -712,7 +1691,7 @@ class Coach():
         :param v2: volts
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN4, v2)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN4, v2)
         return v
 
     def measure_nta_vout(self) -> float:
@@ -730,19 +1709,7 @@ class Coach():
 
     def setup_pta(self) -> None:
         """Sets up the PTA (p-type 5-T transamp)."""
-        self.check_open()
-        self.setup_c2f()
-
-        # setup output p-type rail-to-rail buffer
-        self.setup_r2r_buffer()
-
-        # configure P type TransAmp
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine5,
-            pyplane.Coach.VoltageOutputSelect.SelectLine1,
-            pyplane.Coach.VoltageInputSelect.SelectLine1,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])
-
+        self.apply_profile('pta')
         log.debug('setup PTA')
 
     def set_pta_ib(self, bias_coarse: pyplane.Coach.BiasGenMasterCurrent, fine_value) -> float:
@@ -767,7 +1734,7 @@ class Coach():
         :param v1: volts 
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN7, v1)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN7, v1)
         return v
 
     def set_pta_v2(self, v2) -> float:
@@ -776,7 +1743,7 @@ class Coach():
         :param v2: volts
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN8, v2)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN8, v2)
         return v
 
     def measure_pta_vout(self) -> float:
@@ -791,19 +1758,7 @@ class Coach():
 
     def setup_wrt(self) -> None:
         """Sets up the WRT (wide output range transamp). Note only the Vout node can be measured in open loop."""
-        self.check_open()
-        self.setup_c2f()
-
-        # setup output rail-to-rail buffer
-        self.setup_r2r_buffer()
-
-        # configure wide-range TransAmp
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine5,
-            pyplane.Coach.VoltageOutputSelect.SelectLine1,
-            pyplane.Coach.VoltageInputSelect.SelectLine2,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])
-
+        self.apply_profile('wrt')
         log.debug('setup WRT')
 
     def set_wrt_ib(self, bias_coarse: pyplane.Coach.BiasGenMasterCurrent, fine_value):
@@ -827,7 +1782,7 @@ class Coach():
         :param v1: volts 
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN7, v1)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN7, v1)
         return v
 
     def set_wrt_v2(self, v2):
@@ -836,7 +1791,7 @@ class Coach():
         :param v2: volts
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN8, v2)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN8, v2)
         return v
 
     def measure_wrt_vout(self):
@@ -846,180 +1801,108 @@ class Coach():
         return v
 
 # NOTE disable all AER sources (neurons, DVS pixel)
-    def disable_all_aer_event_sources(self) -> None:
+    AER_SOURCES_OFF_BIASES = (
         # disable synapses
-        self.set_bias(
-            pyplane.Coach.BiasAddress.LDS_VTAU_P,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DPI_VTAU_P,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DDI_VTAU_P,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
+        (pyplane.Coach.BiasAddress.LDS_VTAU_P, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DPI_VTAU_P, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DDI_VTAU_P, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
         # disable axon-hillock neuron, set reset to max to prevent input from making spikes
-        self.set_bias(
-            pyplane.Coach.BiasAddress.AHN_VPW_N,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
+        (pyplane.Coach.BiasAddress.AHN_VPW_N, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
         # disable thresholded neuron
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ATN_VLEAK_N,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ATN_VDC_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ATN_VGAIN_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ATN_VSPKTHR_P,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
+        (pyplane.Coach.BiasAddress.ATN_VLEAK_N, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ATN_VDC_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ATN_VGAIN_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ATN_VSPKTHR_P, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
         # disable sigma-delta neuron
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ASN_VLEAK_N,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+        (pyplane.Coach.BiasAddress.ASN_VLEAK_N, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ASN_VDC_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ASN_VGAIN_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        # disable exp neuron
+        (pyplane.Coach.BiasAddress.ACN_VLEAK_N, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ACN_VGAIN_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ACN_VDC_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.ACN_VREFR_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I240nA, 255),
+        # disable Hodgkin-Huxley neuron
+        (pyplane.Coach.BiasAddress.HHN_VBUF_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.HHN_VCABUF_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.HHN_VDC_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.HHN_VELEAK_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        # disable DVS pixels
+        (pyplane.Coach.BiasAddress.DVS_DIFF_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DVS_CAS_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DVS_ON_N, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DVS_OFF_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DVS_SF_P, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DVS_PR_P, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+        (pyplane.Coach.BiasAddress.DVS_REFR_P, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 0),
+    )
+    """ The (address, type, coarse, fine) bias tuples that disable all the AER event sources (synapses, neurons and DVS pixel). """
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ASN_VDC_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+    def disable_all_aer_event_sources(self) -> None:
+        """ Disables all the AER neuron and DVS pixel event sources by biasing them off with `AER_SOURCES_OFF_BIASES`. """
+        with self.batch():
+            for b in self.AER_SOURCES_OFF_BIASES:
+                self.set_bias_from_tuple(b)
+        log.debug('disabled all AER neuron and DVS sources by biasing them off')
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ASN_VGAIN_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
 
-        # disable exp neuron
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ACN_VLEAK_N,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+################################################################ NOTE DVS pixel
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ACN_VGAIN_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+    DVS_ON_ADDRESS=5
+    DVS_OFF_ADDRESS=6
+    
+    def setup_dvs(self, on_off_ratio=2, settle_duration=5) -> None:
+        """ Sets up the DVS pixel. 
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ACN_VDC_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+        :param on_off_ratio: the desired ratio of Ion/Id and Id/Ioff
+        :param settle_duration: the maximum time to settle in seconds, since we are turning on DVS pixel that was totally disabled.
+            It waits only until the event rate stops changing, see settle_dvs().
+        
+        See [Coach chip report](https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=share_link), Table 15, page 28 for event addresses.
+        
+        :return: ipr,isf,icas,idiff,ion,ioff,irefr
+            The actual programmed bias currents in Amps
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.ACN_VREFR_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I240nA, 255)
+        """
+        currents, changed = self._setup_dvs_without_settling(on_off_ratio)
+        if not changed:
+            log.info('DVS pixel was already set up, not waiting for it to settle')
+        elif settle_duration > 0:
+            self.settle_dvs(settle_duration)
+        log.info('setup DVS pixel')
+        return currents
 
-        # disable Hodgkin-Huxley neuron
-        self.set_bias(
-            pyplane.Coach.BiasAddress.HHN_VBUF_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+    DVS_SETTLE_WINDOW_S = 0.25
+    """ The duration in seconds of each event rate measurement of settle_dvs(). """
+    DVS_MIN_SETTLE_S = 1
+    """ The minimum time in seconds that settle_dvs() waits, since a pixel that is still settling can be quiet for a while. """
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.HHN_VCABUF_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+    def settle_dvs(self, timeout_s: float = 5, rel_tol: float = 0.2) -> tuple:
+        """ Waits until the DVS pixel event rate stops changing after it was turned on, see settle().
+        It waits at least `DVS_MIN_SETTLE_S` (or timeout_s if that is shorter). The events captured while settling are discarded.
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.HHN_VDC_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
+        :param timeout_s: the maximum time to wait in seconds
+        :param rel_tol: the relative tolerance of the event rate, which must allow for its Poisson noise
+        :return: (event rate in Hz, elapsed_s)
+        """
+        t = self.DVS_SETTLE_WINDOW_S
+        log.info(f'waiting up to {timeout_s} seconds for DVS to settle')
+        return self.settle(lambda: len(self.capture_coach_output_events(t))/t, abs_tol=2/t, rel_tol=rel_tol, interval_s=0,
+                           timeout_s=timeout_s, min_s=self.DVS_MIN_SETTLE_S, name='DVS')
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.HHN_VELEAK_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        # disable DVS pixels
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DVS_DIFF_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DVS_CAS_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DVS_ON_N,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DVS_OFF_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DVS_SF_P,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DVS_PR_P,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DVS_REFR_P,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 0)
-
-        log.debug('disabled all AER neuron and DVS sources by biasing them off')
-
-
-################################################################ NOTE DVS pixel
-
-    DVS_ON_ADDRESS=5
-    DVS_OFF_ADDRESS=6
-    
-    def setup_dvs(self, on_off_ratio=2, settle_duration=5) -> None:
-        """ Sets up the DVS pixel. 
-
-        :param on_off_ratio: the desired ratio of Ion/Id and Id/Ioff
-        :param settle_duration: how long to settle in seconds,  since we are turning on DVS pixel that was totally disabled
-        
-        See [Coach chip report](https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=share_link), Table 15, page 28 for event addresses.
-        
-        :return: ipr,isf,icas,idiff,ion,ioff,irefr
-            The actual programmed bias currents in Amps
+    def _setup_dvs_without_settling(self, on_off_ratio=2) -> (tuple, bool):
+        """ Does the work of setup_dvs() except for waiting for the pixel to settle.
 
+        :return: (ipr,isf,icas,idiff,ion,ioff,irefr), changed; changed is True if anything was sent to the chip
         """
         self.check_open()
         # self.reset_soft()
-        self.disable_all_aer_event_sources()
-        ipr,isf,icas,idiff,ion,ioff,irefr=self.setup_dvs_biases(on_off_ratio=on_off_ratio)
-        # select lines and neuron latches - set mysterious misc flag to 0, TODO not clear what is the effect, seems to be a synapse switch selection
-        # select lines and neuron latches
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine6,
-            pyplane.Coach.VoltageOutputSelect.SelectLine2,
-            pyplane.Coach.VoltageInputSelect.NoneSelected,
-            pyplane.Coach.SynapseSelect.NoneSelected, 0)])
-
-        log.info(f'sleeping {settle_duration} seconds for DVS to settle')
-        time.sleep(settle_duration)
-        log.info('setup DVS pixel')
-        return ipr,isf,icas,idiff,ion,ioff,irefr
+        n_issued = self._coach_events_issued
+        with self.batch():
+            # disables the other AER sources, sets the default DVS biases and the select lines
+            self.apply_profile('dvs')
+            currents = self.setup_dvs_biases(on_off_ratio=on_off_ratio)
+        return currents, self._coach_events_issued != n_issued
 
     DVS_DIFF_FINE_VAL=16 
     """ Coarse bias of DVS pixel change detector """
@@ -1044,25 +1927,26 @@ class Coach():
         :return: ipr,isf,icas,idiff,ion,ioff,irefr
             The actual programmed bias currents in Amps
         """
-        # change bias buffer bias 
-        ibuffer=self.set_bias(pyplane.Coach.BiasAddress.BUFFER,pyplane.Coach.BiasType.N,
-                              pyplane.Coach.BiasGenMasterCurrent.I240nA,255)
+        with self.batch():
+            # change bias buffer bias 
+            ibuffer=self.set_bias(pyplane.Coach.BiasAddress.BUFFER,pyplane.Coach.BiasType.N,
+                                  pyplane.Coach.BiasGenMasterCurrent.I240nA,255)
         
-        def set_dvs_bias(name)->float:
-            return self.set_bias_from_tuple(self.DVS_DEFAULT_BIASES[name])
+            def set_dvs_bias(name)->float:
+                return self.set_bias_from_tuple(self.DVS_DEFAULT_BIASES[name])
 
-        # photoreceptor and source follower
-        ipr= set_dvs_bias('pr')  # bias PR strongly
-        isf=set_dvs_bias('sf')  # lowpass filter output with source follower
+            # photoreceptor and source follower
+            ipr= set_dvs_bias('pr')  # bias PR strongly
+            isf=set_dvs_bias('sf')  # lowpass filter output with source follower
 
-        # Cascode
-        icas=set_dvs_bias('cas') # bias cascode hard to make sure it is working
+            # Cascode
+            icas=set_dvs_bias('cas') # bias cascode hard to make sure it is working
 
-        # change detector
-        idiff,ion,ioff=self.set_dvs_threshold_biases(on_off_ratio)
+            # change detector
+            idiff,ion,ioff=self.set_dvs_threshold_biases(on_off_ratio)
 
-        # refractory period
-        irefr=set_dvs_bias('refr')
+            # refractory period
+            irefr=set_dvs_bias('refr')
         
         s='\nbias\t\t\tcurrent(A)\n'
         def printi(a,b):
@@ -1108,7 +1992,7 @@ class Coach():
     def filter_dvs_events(self, coach_events_list:list) -> tuple:
         """ After a call to `request_events(t)`, `filter_dvs_events` returns the timestamps of ON and OFF events.
         
-        :param coach_events_list: the list of CoachOutputEvent returned by `read_events()`
+        :param coach_events_list: the list of CoachOutputEvent returned by `read_events()`, or a block of `EVENT_DTYPE` from `stream_events()`
 
         If you want signed ON and OFF events to plot with timestamps, you can do
         ```            
@@ -1122,18 +2006,19 @@ class Coach():
         NOTE that addresses that are not DVS addresses are filtered out! 
         There could be other neuron circuits that generate events, and if these dominate the output,
         then there could be problems with overruns.
+        Use `events_by_address()` to get the timestamps of all the addresses.
 
         See [Coach chip report](https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=share_link), Table 15, page 28 for event addresses.
         """
-        timestamps,addresses=self.coach_events_to_timestamps_addresses(coach_events_list)
-        on_timestamps=timestamps[addresses==Coach.DVS_ON_ADDRESS]
-        off_timestamps=timestamps[addresses==Coach.DVS_OFF_ADDRESS]
+        timestamps_by_address,counts,_=self.events_by_address(coach_events_list)
+        on_timestamps=timestamps_by_address.get(Coach.DVS_ON_ADDRESS,np.empty(0))
+        off_timestamps=timestamps_by_address.get(Coach.DVS_OFF_ADDRESS,np.empty(0))
         n_on=len(on_timestamps)
         n_off=len(off_timestamps)
-        n_tot=len(coach_events_list)
+        n_tot=sum(counts.values())
         if n_on + n_off < n_tot:
             log.warning(f' #on ({n_on}) + # off ({n_off}) = {(n_on+n_off):,} != n_tot ({n_tot}) - filtered out events')
-        return np.array(on_timestamps),np.array(off_timestamps)
+        return on_timestamps,off_timestamps
 
 
     def set_led_intensity(self, intensity: int) -> None:
@@ -1177,6 +2062,22 @@ class Coach():
         log.debug(f'read_events() got {len(events)} events')
         return events
 
+    EVENT_TICKS_PER_S = 1024.
+    """ The event timestamps count in ticks of this many per second. """
+
+    def stream_events(self, chunk_s: float = 10, overlap_s: float = .5, max_blocks: int = 10000) -> 'EventStream':
+        """ Starts streaming events continuously from a background thread, for recordings longer than the 64 s limit of request_events().
+
+        :param chunk_s: the duration of each request_events() chunk in seconds
+        :param overlap_s: how long before the end of a chunk to request the next one
+        :param max_blocks: the capacity of the ring buffer in blocks of events
+        :return: the started EventStream; iterate it for numpy blocks of events and stop() it when done
+        """
+        return EventStream(self, chunk_s=chunk_s, overlap_s=overlap_s, max_blocks=max_blocks).start()
+
+    EVENT_READ_MARGIN_S = .01
+    """ Extra time in seconds to wait after the request_events() duration before reading the events. """
+
     def capture_coach_output_events(self, t: float) -> list:
         """ Reads AER events from Coach.
 
@@ -1187,18 +2088,49 @@ class Coach():
                 The timestamps in CoachOutputEvents are in units of 1.024 milliseconds.
         """
         assert t > 0 and t < 64, 't must be greater than >0 and <=64 seconds'
-        t_eps=.01 # extra time to wait to read the events
         self.check_open()
         log.debug(
             f'Starting  a request to collect events for {t}s, will block for this time')
         try:
             self.request_coach_output_events(t)
-            time.sleep(t+t_eps)
+            time.sleep(t+self.EVENT_READ_MARGIN_S)
             return self.read_coach_output_events()
         except Exception as e:
             log.error(f'got exception in request_events/read_events: Exception is {e}')
+            self.connection.note_transport_error(e)
             raise(e)
     
+    @staticmethod
+    def events_by_address(es, duration_s: float = None) -> tuple:
+        """ Groups the event timestamps by address for all the addresses at once, with one stable sort.
+
+        E.g. to get the AHN spike times and all the event rates from a mixed capture:
+        ```
+            timestamps_by_address,counts,rates=Coach.events_by_address(coach.capture_coach_output_events(1), duration_s=1)
+        ```
+        See [Coach chip report](https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=share_link), Table 15, page 28 for event addresses.
+
+        :param es: list of CoachOutputEvent, an array of `EVENT_DTYPE` or an EventArray
+        :param duration_s: the capture duration in seconds for the rates; by default the time between the first and last events
+        :return: (timestamps_by_address, counts, rates)
+            Each is a dict keyed by the int address of the addresses that have events.
+            `timestamps_by_address` holds float64 arrays of timestamps in seconds, in their original order,
+            `counts` the number of events and `rates` the event rate in Hz.
+        """
+        if isinstance(es, EventArray):
+            es = es.events
+        timestamps, addresses = Coach.coach_events_to_arrays(es)
+        if duration_s is None:
+            duration_s = float(timestamps.max() - timestamps.min()) if len(timestamps) > 1 else 0.
+        order = np.argsort(addresses, kind='stable')
+        counts = np.bincount(addresses) if len(addresses) > 0 else np.zeros(0, dtype=np.int64)
+        present = np.flatnonzero(counts)
+        groups = np.split(timestamps[order], np.cumsum(counts[present])[:-1])
+        timestamps_by_address = {int(a): g for a, g in zip(present, groups)}
+        counts = {int(a): int(counts[a]) for a in present}
+        rates = {a: (n/duration_s if duration_s > 0 else np.nan) for a, n in counts.items()}
+        return timestamps_by_address, counts, rates
+
     def coach_events_to_timestamps_addresses(self, es:list)->tuple:
         """ Converts list of CoachOutputEvent to tuple (`timestamp`, `addresses`).
         :param es: list of CoachOutputEvent
@@ -1208,37 +2140,33 @@ class Coach():
 
         """
         log.debug(f'Number of events returned: {len(es):,}')
-        # print('Timestamp\t\tAddress')
-        timestamps=[]
-        addresses=[]
-        for e in es:
-            # print(f'{e.timestamp}\t\t{e.address}')
-            timestamps.append(float(e.timestamp)/1024.) # convert the int timestamp (in 1.024ms units) to seconds
-            addresses.append(int(e.address))
-        timestamps=np.array(timestamps)
-        addresses=np.array(addresses)
-        return timestamps,addresses
+        return self.coach_events_to_arrays(es)
+
+    @staticmethod
+    def coach_events_to_arrays(es, raw_timestamps: bool = False) -> tuple:
+        """ Converts events to numpy arrays in bulk, without building intermediate python lists.
+
+        :param es: list of CoachOutputEvent, or a numpy array of `EVENT_DTYPE` such as the blocks from `stream_events()`
+        :param raw_timestamps: set True to return the timestamps in ticks instead of seconds
+        :return: (timestamps, addresses)
+            `timestamps` is a float64 array in seconds, or with raw_timestamps the uint32 ticks (uint64 for EVENT_DTYPE input).
+            `addresses` is an int32 array.
+        """
+        if isinstance(es, np.ndarray):
+            timestamps, addresses = es['timestamp'], es['address'].astype(np.int32)
+        else:
+            n = len(es)
+            timestamps = np.fromiter((e.timestamp for e in es), dtype=np.uint32, count=n)
+            addresses = np.fromiter((e.address for e in es), dtype=np.int32, count=n)
+        if not raw_timestamps:
+            timestamps = timestamps / Coach.EVENT_TICKS_PER_S # convert the int timestamp ticks to seconds
+        return timestamps, addresses
 
 # NOTE follower-integrator (FOI)
 
-    def setup_foi(self):
+    def setup_foi(self) -> None:
         """Sets up the FOI (follower-integrator)."""
-        self.check_open()
-        # self.setup_c2f()
-
-        self.plane.set_bit_depth(pyplane.BitDepth(10))
-        self.plane.send_coach_events(
-            [
-                pyplane.Coach.generate_aerc_event(
-                    pyplane.Coach.CurrentOutputSelect.SelectLine0,
-                    pyplane.Coach.VoltageOutputSelect.SelectLine1,
-                    pyplane.Coach.VoltageInputSelect.SelectLine2,
-                    pyplane.Coach.SynapseSelect.NoneSelected,
-                    0,
-                )
-            ]
-        )
-
+        self.apply_profile('foi')
         log.debug("setup FOI")
 
     def set_foi_vin(self, v1):
@@ -1247,7 +2175,7 @@ class Coach():
         :param v1: volts
         """
         self.check_open()
-        v = self.plane.set_voltage(pyplane.DacChannel.AIN9, v1)
+        v = self.set_dac_voltage(pyplane.DacChannel.AIN9, v1)
         return v
 
     def measure_foi_vout(self):
@@ -1263,8 +2191,8 @@ class Coach():
         :return: The offset compensated input voltage for the FOI
         """
         _ = self.set_foi_vin(v)
-        time.sleep(0.5)
-        Vo = self.measure_foi_vout()
+        # readings 0.1 s apart, so that the slow ramp of a weakly biased follower integrator is not taken as settled
+        Vo, _ = self.settle_voltage(pyplane.AdcChannel.AOUT10, interval_s=.1, name='FOI vout')
         Voff = Vo - v
         Vcorr = v - Voff
 
@@ -1307,17 +2235,35 @@ class Coach():
         vout = self.plane.acquire_waveform(
             pyplane.DacChannel.AIN9, pyplane.AdcChannel.AOUT10, interval
         )
+        self.invalidate_dac_shadow(pyplane.DacChannel.AIN9)
 
         return vout
 
-    def set_waveform(self, wf:list):
-        self.check_open()
+    def set_waveform(self, wf) -> bool:
         """ 
         Sets the waveform for driving the DAC output.
+
+        A hash of the waveform on the board is kept, so setting the same waveform again, e.g. for repeated trials, skips the upload.
+        The hash is forgotten by the calls that may reprogram the waveform buffer, e.g. transient_response() or get_pyplane().
+        See `Waveforms` for building common stimuli.
         
-        :param: wf: a List of float voltages
+        :param: wf: a list or 1d numpy array of float voltages
+        :return: True if the waveform was uploaded, False if the board already had it
         """
-        self.plane.set_voltage_waveform(wf)
+        self.check_open()
+        wf = np.asarray(wf, dtype=float).ravel()
+        h = hashlib.sha1(wf.tobytes()).hexdigest()
+        if h == self._waveform_hash:
+            log.debug(f'waveform of {len(wf)} samples is already on the board, not uploading it')
+            return False
+        self.plane.set_voltage_waveform(wf.tolist())
+        self._waveform_hash = h
+        return True
+
+    def _forget_waveform(self, *args, **kwargs) -> None:
+        """ Forgets the hash of the waveform on the board, so that the next set_waveform() uploads it.
+        Called by get_pyplane() and, through the `TrackedPlane`, after each plane call that reprograms the waveform buffer. """
+        self._waveform_hash = None
 
 
 # NOTE: winner-takes-all (WTA)
@@ -1360,39 +2306,15 @@ class Coach():
         pyplane.AdcChannel.AOUT0
     ]
 
-    def setup_wta_iout(self):
+    def setup_wta_iout(self) -> None:
         """Sets up the WTA (winner-takes-all) to read from Iout"""
-        self.check_open()
-
-        self.plane.send_coach_events(
-            [
-                pyplane.Coach.generate_aerc_event(
-                    pyplane.Coach.CurrentOutputSelect.SelectLine2,
-                    pyplane.Coach.VoltageOutputSelect.SelectLine0,
-                    pyplane.Coach.VoltageInputSelect.SelectLine0,
-                    pyplane.Coach.SynapseSelect.NoneSelected,
-                    0
-                )
-            ]
-        )
+        self.apply_profile('wta_iout')
         log.debug("setup WTA to read Iout")
 
 
-    def setup_wta_iall(self):
+    def setup_wta_iall(self) -> None:
         """Sets up the WTA (winner-takes-all) to read from Iall"""
-        self.check_open()
-
-        self.plane.send_coach_events(
-            [
-                pyplane.Coach.generate_aerc_event(
-                    pyplane.Coach.CurrentOutputSelect.SelectLine3,
-                    pyplane.Coach.VoltageOutputSelect.SelectLine0,
-                    pyplane.Coach.VoltageInputSelect.SelectLine0,
-                    pyplane.Coach.SynapseSelect.NoneSelected,
-                    0
-                )
-            ]
-        )
+        self.apply_profile('wta_iall')
         log.debug("setup WTA to read Iall")
 
 
@@ -1465,58 +2387,82 @@ class Coach():
         )
         return Ib * 3
 
+    def apply_wta_pattern(self, vin, settle_s: float = 0) -> np.ndarray:
+        """ Sets the 16 WTA input voltages and reads the 16 WTA outputs, see apply_wta_patterns().
+
+        :param vin: the 16 input voltages in the order of WTA_VIN_CHANNELS
+        :param settle_s: time to wait in seconds after setting the inputs
+        :return: the 16 output voltages in the order of WTA_LVOUT_CHANNELS
+        """
+        return self.apply_wta_patterns(np.reshape(vin, (1, -1)), settle_s)[0]
+
+    def apply_wta_patterns(self, vins, settle_s: float = 0) -> np.ndarray:
+        """ Applies a sequence of WTA stimulus patterns and reads the 16 WTA outputs after each one.
+
+        Only the inputs whose DAC code differs from what the board holds are written (see set_dac_voltage()), so e.g. a bump
+        that moves by one input costs a few DAC writes rather than 16. Call setup_wta_iout() or setup_wta_iall() first.
+
+        :param vins: (N, 16) input voltages, one pattern per row, columns in the order of WTA_VIN_CHANNELS
+        :param settle_s: time to wait in seconds after setting the inputs of each pattern
+        :return: (N, 16) output voltages, columns in the order of WTA_LVOUT_CHANNELS
+        """
+        vins = np.asarray(vins, dtype=float)
+        if vins.ndim != 2 or vins.shape[1] != len(self.WTA_VIN_CHANNELS):
+            raise ValueError(f'vins must be (N, {len(self.WTA_VIN_CHANNELS)}), got {vins.shape}')
+        self.check_open()
+        out = np.empty((len(vins), len(self.WTA_LVOUT_CHANNELS)))
+        # plain python lists and locals so that the inner loop makes only the USB calls
+        set_dac_voltage = self._set_dac_voltage
+        read_voltage = self.plane.read_voltage
+        vin_channels = self.WTA_VIN_CHANNELS
+        out_channels = self.WTA_LVOUT_CHANNELS
+        for n, vin in enumerate(vins.tolist()):
+            for ch, v in zip(vin_channels, vin):
+                set_dac_voltage(ch, v)
+            if settle_s > 0:
+                time.sleep(settle_s)
+            out[n] = [read_voltage(ch) for ch in out_channels]
+        return out
+
 
 # diff-pair integrator (DPI)
 
 
     def setup_dpi(self) -> None:
         """Sets up the DPI (diff-pair integrator)."""
-        self.check_open()
-        # self.setup_c2f()
-
-        self.plane.send_coach_events(
-            [
-                pyplane.Coach.generate_aerc_event(
-                    pyplane.Coach.CurrentOutputSelect.SelectLine5,
-                    pyplane.Coach.VoltageOutputSelect.SelectLine2,
-                    pyplane.Coach.VoltageInputSelect.NoneSelected,
-                    pyplane.Coach.SynapseSelect.DPI,
-                    0
-                )
-            ]
-        )
-
+        self.apply_profile('dpi')
         log.debug("setup DPI")
 
     def set_dpi_baseline(self)->None:
         ''' Sets DPI synapse baseline DPI_VTAU_P, DPI_VTHR_N, DPI_VWEIGHT_N, PEX_VTAU_N biases.'''
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DPI_VTAU_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA,
-            25
-        )
+        with self.batch():
+            self.set_bias(
+                pyplane.Coach.BiasAddress.DPI_VTAU_P,
+                pyplane.Coach.BiasType.P,
+                pyplane.Coach.BiasGenMasterCurrent.I60pA,
+                25
+            )
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DPI_VTHR_N,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA,
-            30
-        )
+            self.set_bias(
+                pyplane.Coach.BiasAddress.DPI_VTHR_N,
+                pyplane.Coach.BiasType.P,
+                pyplane.Coach.BiasGenMasterCurrent.I60pA,
+                30
+            )
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.DPI_VWEIGHT_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I30nA,
-            100
-        )
+            self.set_bias(
+                pyplane.Coach.BiasAddress.DPI_VWEIGHT_N,
+                pyplane.Coach.BiasType.N,
+                pyplane.Coach.BiasGenMasterCurrent.I30nA,
+                100
+            )
 
-        self.set_bias(
-            pyplane.Coach.BiasAddress.PEX_VTAU_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA,
-            10
-        )
+            self.set_bias(
+                pyplane.Coach.BiasAddress.PEX_VTAU_N,
+                pyplane.Coach.BiasType.N,
+                pyplane.Coach.BiasGenMasterCurrent.I60pA,
+                10
+            )
 
     def measure_dpi_vsyn(self) -> float:
         ''' Reads and returns the DPI VSyn voltage
@@ -1529,20 +2475,32 @@ class Coach():
     def send_dpi_pulse(self):
         ''' Sends pulse to stimulate DPI synapse'''
         self.check_open()
-        self.plane.send_coach_events([pyplane.Coach.generate_pulse_event()])
+        self._send_coach_events([pyplane.Coach.generate_pulse_event()])
         return
 
     class DPI_C2F:
         ''' Class to calibrate the DPI C2F converters. 
         Constructing this class calibrates the C2F converters and stores the calibration in self.fit variable.
         Then users can use the `DPI_C2F.f2i` method to convert a C2F frequency to a current
+
+        The calibration is cached on disk in `Coach.CACHE_DIR` for each board (Teensy serial number and firmware version),
+        and reused the next time unless it is older than `max_age_s` or `recalibrate=True`.
         '''
-        def __init__(self, super) -> None:
-            ''' Construct the instance and calibrates.
+        MAX_AGE_S = 7*24*3600
+        """ The default maximum age of a cached calibration in seconds. """
+
+        def __init__(self, super, recalibrate: bool = False, max_age_s: float = None) -> None:
+            ''' Construct the instance and calibrates, or loads the cached calibration of this board.
             :param super: existing Coach() instance
+            :param recalibrate: set True to calibrate even if there is a cached calibration
+            :param max_age_s: the maximum age in seconds of a cached calibration to reuse, by default MAX_AGE_S
             :return: None
             '''
             self.coach = super
+            self.cache_file = self._cache_file()
+            if not recalibrate and self._load(self.MAX_AGE_S if max_age_s is None else max_age_s):
+                self.coach.setup_dpi()
+                return
 
             fine_values = np.arange(1, 255, 5)
             Ib_cal = []
@@ -1560,14 +2518,65 @@ class Coach():
 
                 self.coach.set_ndp_v1(.6)
                 self.coach.set_ndp_v2(.2)
-                time.sleep(.1)
+                # the rate only grows along the sweep, so the previous rate is the expected one: it sets a window of about 100 counts
+                # (up to .1s at low rates) and a tolerance of 3 standard deviations of their Poisson noise, rather than the default 2 counts;
+                # wait at least the .1s that this step used to sleep
+                expected_hz = c2f_calI1[-1] if c2f_calI1 else 0
+                window_s = min(.1, max(.02, 100/expected_hz)) if expected_hz > 0 else .1
+                abs_tol = max(3*np.sqrt(expected_hz*window_s), 2)/window_s
+                self.coach.settle_c2f(0, window_s=window_s, abs_tol=abs_tol, rel_tol=0, timeout_s=2, min_s=.1, name='DPI C2F')
                 c2f_freqs = self.coach.measure_c2f_freqs(.1)
                 c2f_calI1.append(c2f_freqs[0])
 
             self.fit = np.polyfit(c2f_calI1, Ib_cal, 2)
+            self.Ib_cal = np.array(Ib_cal)
+            self.c2f_calI1 = np.array(c2f_calI1)
+            self._save()
 
             self.coach.setup_dpi()
 
+        def _cache_file(self) -> str:
+            """ :return: the cache file path of this board's calibration """
+            sn = self.coach.get_teensy_sn()
+            fw = '.'.join(str(v) for v in self.coach.get_firmware_version())
+            return os.path.join(Coach.CACHE_DIR, f'dpi_c2f_{sn}_{fw}.json')
+
+        def _load(self, max_age_s: float) -> bool:
+            """ Loads the cached calibration if there is one that is not too old.
+
+            :return: True if it was loaded
+            """
+            import json
+            try:
+                with open(self.cache_file) as f:
+                    cal = json.load(f)
+            except (OSError, ValueError):
+                return False
+            try:
+                age_s = time.time()-cal['time']
+                fit = np.array(cal['fit'], dtype=float)
+                Ib_cal = np.array(cal['Ib_cal'], dtype=float)
+                c2f_calI1 = np.array(cal['c2f_calI1'], dtype=float)
+            except (KeyError, TypeError, ValueError) as e:
+                log.warning(f'ignoring malformed cached DPI C2F calibration {self.cache_file} ({type(e).__name__}: {e}), recalibrating')
+                return False
+            if age_s > max_age_s:
+                log.info(f'cached DPI C2F calibration {self.cache_file} is {age_s/3600:.1f}h old, recalibrating')
+                return False
+            self.fit, self.Ib_cal, self.c2f_calI1 = fit, Ib_cal, c2f_calI1
+            log.info(f'using cached DPI C2F calibration {self.cache_file} from {age_s/3600:.1f}h ago')
+            return True
+
+        def _save(self) -> None:
+            """ Saves the calibration to the cache file, logging a warning if it cannot. """
+            import json
+            try:
+                os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+                with open(self.cache_file, 'w') as f:
+                    json.dump({'time': time.time(), 'fit': self.fit.tolist(), 'Ib_cal': self.Ib_cal.tolist(), 'c2f_calI1': self.c2f_calI1.tolist()}, f)
+            except OSError as e:
+                log.warning(f'could not cache DPI C2F calibration in {self.cache_file}: {e}')
+
         def f2i(self, freq):
             ''' 
             Convert a frequency in Hz to current in A
@@ -1580,21 +2589,7 @@ class Coach():
 # AHN
     def setup_ahn(self) -> None:
         """ Sets up the Axon-Hillock circuit. """
-        self.check_open()
-        self.disable_all_aer_event_sources()
-        # select lines and neuron latches
-        self.plane.send_coach_events([pyplane.Coach.generate_aerc_event(
-            pyplane.Coach.CurrentOutputSelect.SelectLine6,
-            pyplane.Coach.VoltageOutputSelect.SelectLine2,
-            pyplane.Coach.VoltageInputSelect.NoneSelected,
-            pyplane.Coach.SynapseSelect.NoneSelected, 320)])
-        # enable axon-hillock neuron
-        # can't set AHN reset too high or it will prevent spiking, since it will be larger than fixed input current
-        self.set_bias(
-            pyplane.Coach.BiasAddress.AHN_VPW_N,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 5)  # set a small current but large enough that it makes finite width spikes
-        self.setup_r2r_buffer()
+        self.apply_profile('ahn')
         log.info('setup AHN (axon hillock neuron)')
 
     def set_ahn_vpw_ib(self, coarse_current: pyplane.Coach.BiasGenMasterCurrent, fine_value: int) -> float:
@@ -1617,40 +2612,9 @@ class Coach():
 
 # i&f neuron
 
-    def setup_ief(self):
-        self.check_open()
-        self.disable_all_aer_event_sources()
-
-        self.set_bias(
-                pyplane.Coach.BiasAddress.ACN_VLEAK_N,
-                pyplane.Coach.BiasType.N,
-                pyplane.Coach.BiasGenMasterCurrent.I60pA,
-                2
-                )
-
-        self.set_bias(
-                pyplane.Coach.BiasAddress.ACN_VGAIN_N,
-                pyplane.Coach.BiasType.N,
-                pyplane.Coach.BiasGenMasterCurrent.I60pA,
-                6
-                )
-
-        self.set_bias(
-                pyplane.Coach.BiasAddress.ACN_VDC_P,
-                pyplane.Coach.BiasType.P,
-                pyplane.Coach.BiasGenMasterCurrent.I30nA,
-                3
-                )
-
-        self.set_bias(
-                pyplane.Coach.BiasAddress.ACN_VREFR_N,
-                pyplane.Coach.BiasType.N,
-                pyplane.Coach.BiasGenMasterCurrent.I30nA,
-                8
-                )
-
-        self.setup_r2r_buffer()
-
+    def setup_ief(self) -> None:
+        """ Sets up the I&F (integrate and fire) neuron. """
+        self.apply_profile('ief')
         log.info("setup I&F neuron")
 
     def read_i2f_transient_vout(self, time_interval=0.00025, vstep=1):
@@ -1662,6 +2626,15 @@ class Coach():
 
 ####################################################################### NOTE C2F
 
+    C2F_BIASES = (
+        (pyplane.Coach.BiasAddress.C2F_HYS_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I60pA, 100),
+        (pyplane.Coach.BiasAddress.C2F_BIAS_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I240nA, 255),
+        (pyplane.Coach.BiasAddress.C2F_PWLK_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I240nA, 255),
+        (pyplane.Coach.BiasAddress.C2F_REF_L, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 255),
+        (pyplane.Coach.BiasAddress.C2F_REF_H, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I30nA, 255),
+    )
+    """ The (address, type, coarse, fine) bias tuples of the C2F current-to-frequency converters. """
+
     def setup_c2f(self) -> None:
         """ Sets up the C2F biases. 
                 NOTE: the correct C2F channels must be selected for any measurements to make sense.
@@ -1669,39 +2642,17 @@ class Coach():
                 For example
                 ```
                     # configure wide-range TransAmp
-                    self.plane.send_coach_events([pyplane.Coach.generate_aerc_event( \
-                        pyplane.Coach.CurrentOutputSelect.SelectLine5, \
+                    self.set_mux(pyplane.Coach.CurrentOutputSelect.SelectLine5, \
                         pyplane.Coach.VoltageOutputSelect.SelectLine1, \
                         pyplane.Coach.VoltageInputSelect.SelectLine2, \
-                        pyplane.Coach.SynapseSelect.NoneSelected, 0)])
+                        pyplane.Coach.SynapseSelect.NoneSelected, 0)
 
                 ```
         """
         self.check_open()
-        self.set_bias(
-            pyplane.Coach.BiasAddress.C2F_HYS_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I60pA, 100)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.C2F_BIAS_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I240nA, 255)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.C2F_PWLK_P,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I240nA, 255)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.C2F_REF_L,
-            pyplane.Coach.BiasType.N,
-            pyplane.Coach.BiasGenMasterCurrent.I30nA, 255)
-
-        self.set_bias(
-            pyplane.Coach.BiasAddress.C2F_REF_H,
-            pyplane.Coach.BiasType.P,
-            pyplane.Coach.BiasGenMasterCurrent.I30nA, 255)
+        with self.batch():
+            for b in self.C2F_BIASES:
+                self.set_bias_from_tuple(b)
 
     def measure_c2f_freqs(self, duration=0.1) -> list:
         """ Measures all the C2F frequencies and returns the array of measurements.
@@ -1713,6 +2664,87 @@ class Coach():
         c2f_calI1_temp = self.plane.read_c2f_output(duration)
         return c2f_calI1_temp  # an array with 16 elements, the frequencies in Hz
 
+    C2F_COUNT_WINDOW_S = 1.
+    """ The longest C2F read whose spike counts are recovered exactly, since the board reports the frequencies rounded to 1 Hz. """
+
+    def measure_c2f_counts(self, duration: float = 0.1) -> np.ndarray:
+        """ Measures the spike counts of all the C2F channels.
+
+        The board reports the frequencies rounded to 1 Hz, which determine the counts exactly only for windows
+        up to `C2F_COUNT_WINDOW_S`, so longer windows are measured in several reads of at most that length.
+
+        :param duration: how long to count in seconds
+        :return: the 16 C2F spike counts as ints
+        """
+        n = max(1, int(np.ceil(duration / self.C2F_COUNT_WINDOW_S - 1e-9)))
+        d = duration / n
+        counts = np.zeros(C2FCalibration.N_CHANNELS, dtype=np.int64)
+        for _ in range(n):
+            counts += np.round(np.asarray(self.measure_c2f_freqs(d), dtype=float) * d).astype(np.int64)
+        return counts
+
+    def measure_c2f_freqs_adaptive(self, rel_precision: float = 0.01, probe_s: float = 0.005, max_s: float = 1.0, channels=None) -> tuple:
+        """ Measures all the C2F frequencies with a window just long enough for the requested precision.
+
+        A short probe read estimates the frequencies; since the counts are Poisson, a channel firing at f Hz needs
+        1/(rel_precision**2 * f) seconds for the relative precision, so the slowest channel of interest sets the window of the second read.
+        Both reads are pooled. By default the channels that are silent in the probe read are left out of the choice,
+        so that an unused channel does not push the window to max_s; a silent channel named in `channels` does.
+
+        :param rel_precision: the target relative standard deviation of the frequencies, e.g. 0.01 for 1%
+        :param probe_s: the probe read duration in seconds
+        :param max_s: the maximum total measurement time in seconds
+        :param channels: the channels whose precision sets the window, by default all the channels that fire in the probe read
+        :return: (freqs, sigma, counts), the 16 C2F frequencies in Hz, their standard deviations in Hz
+            and the spike counts they were computed from over the whole measurement time
+        """
+        counts = self.measure_c2f_counts(probe_s)
+        total_s = probe_s
+        c = counts[counts > 0] if channels is None else counts[list(channels)]
+        if len(c) == 0 or np.any(c <= 0):
+            window_s = max_s
+        else:
+            window_s = 1 / (rel_precision**2 * c.min() / probe_s)
+        window_s = min(window_s, max_s) - probe_s
+        if window_s > 0:
+            counts += self.measure_c2f_counts(window_s)
+            total_s += window_s
+        log.debug(f'measured C2F frequencies for {total_s*1e3:.1f}ms')
+        return counts / total_s, np.sqrt(np.maximum(counts, 1)) / total_s, counts
+
+    def calibrate_c2f(self, set_input, values, duration: float = 0.1, settle_s: float = 0.1, degree: int = 2) -> 'C2FCalibration':
+        """ Calibrates all 16 C2F channels in one sweep of a known input current.
+
+        For each value, `set_input(value)` programs the input and returns the reference current in A,
+        either one current for all channels or 16 currents, one per channel.
+        All 16 frequencies are then measured together and every channel is fitted from the same sweep.
+
+        :param set_input: function of one sweep value that sets up the input and returns the reference current(s) in A
+        :param values: the sweep values passed to set_input
+        :param duration: how long to measure the frequencies for at each value in seconds
+        :param settle_s: the settling time in seconds after setting each value
+        :param degree: the degree of the current vs frequency polynomial
+        :return: the C2FCalibration
+        """
+        self.check_open()
+        currents = []
+        freqs = []
+        for v in values:
+            currents.append(set_input(v))
+            if settle_s > 0:
+                time.sleep(settle_s)
+            freqs.append(self.measure_c2f_freqs(duration))
+        return C2FCalibration.fit(freqs, currents, degree)
+
+    def measure_c2f_currents(self, calibration: 'C2FCalibration', duration: float = 0.1) -> np.ndarray:
+        """ Measures all the C2F frequencies and converts them to currents.
+
+        :param calibration: the C2FCalibration from `calibrate_c2f()`
+        :param duration: how long to measure event rate for in seconds
+        :return: 16 C2F input currents in A
+        """
+        return calibration.f2i(self.measure_c2f_freqs(duration))
+
 ################################################################## NOTE biasgen BG
 
     from enum import Enum
@@ -1832,6 +2864,118 @@ class Coach():
     #     WTA_VINH_N=pyplane.Coach.BiasAddress.WTA_VINH_N
     #     WTA_VGAIN_P=pyplane.Coach.BiasAddress.WTA_VGAIN_P
 
+    @contextmanager
+    def batch(self):
+        """ Context manager that buffers all the bias and mux events sent inside it and sends them to the board
+        in a single `send_coach_events` call when the block exits. E.g.
+        ```
+            with coach.batch():
+                coach.set_bias(...)
+                coach.set_bias(...)
+        ```
+        Methods like set_bias() still return their computed currents immediately.
+        Batches can be nested; the events are sent when the outermost batch exits.
+        If the block raises an exception, the buffered events are discarded and not sent.
+        If the block or the sending raises, the bias and mux shadows are forgotten, since they may hold values the chip never received.
+        """
+        if self._batch_depth == 0:
+            self._batch_events = []
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                log.warning(f'discarding {len(self._batch_events)} batched coach events because of exception')
+                self._batch_events = None
+                self.invalidate_bias_shadow() # the shadows may hold values that were never sent
+                self.invalidate_mux_shadow()
+            raise
+        else:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                events, self._batch_events = self._batch_events, None
+                if len(events) > 0:
+                    self.check_open()
+                    log.debug(f'sending {len(events)} batched coach events')
+                    try:
+                        self.plane.send_coach_events(events)
+                    except BaseException:
+                        log.warning(f'sending {len(events)} batched coach events failed')
+                        self.invalidate_bias_shadow() # the shadows hold values that were never sent
+                        self.invalidate_mux_shadow()
+                        raise
+                    self.coach_events_sent += len(events)
+
+    def _send_coach_events(self, events: list) -> None:
+        """ Sends the list of CoachInputEvent to the chip, or buffers them if inside a `batch()`. """
+        self._coach_events_issued += len(events)
+        if self._batch_events is not None:
+            self._batch_events.extend(events)
+        else:
+            self.plane.send_coach_events(events)
+            self.coach_events_sent += len(events)
+
+    def _invalidate_shadows(self) -> None:
+        """ Forgets all the shadow copies of the chip and board state (biases, DACs, mux select lines, ADC bit depth, waveform). """
+        self.invalidate_bias_shadow()
+        self.invalidate_dac_shadow()
+        self.invalidate_mux_shadow()
+        self._waveform_hash = None
+
+    def get_bias_shadow(self) -> dict:
+        """ Returns the shadow copy of the biases that were programmed since the last open() or reset.
+
+        :return: dict of pyplane.Coach.BiasAddress -> (bias_type, coarse_current, fine_value)
+        """
+        return dict(self._bias_shadow)
+
+    def invalidate_bias_shadow(self) -> None:
+        """ Forgets the shadow copy of the programmed biases, so that the next set_bias() for each address is sent to the chip.
+        Called by open(), close(), reset_soft() and reset_hard().
+        """
+        self._bias_shadow = {}
+
+    def set_mux(self, current_output: pyplane.Coach.CurrentOutputSelect, voltage_output: pyplane.Coach.VoltageOutputSelect,
+                voltage_input: pyplane.Coach.VoltageInputSelect, synapse: pyplane.Coach.SynapseSelect = pyplane.Coach.SynapseSelect.NoneSelected,
+                misc: int = 0, force: bool = False) -> None:
+        """ Sets the mux select lines, keeping the shadow copy that apply_profile() compares against up to date.
+        Use this rather than sending pyplane.Coach.generate_aerc_event() with get_pyplane().send_coach_events().
+
+        :param current_output: the pyplane.Coach.CurrentOutputSelect
+        :param voltage_output: the pyplane.Coach.VoltageOutputSelect
+        :param voltage_input: the pyplane.Coach.VoltageInputSelect
+        :param synapse: the pyplane.Coach.SynapseSelect
+        :param misc: the misc int of generate_aerc_event()
+        :param force: set True to send the event even if the mux already holds these select lines
+        """
+        mux = (current_output, voltage_output, voltage_input, synapse, misc)
+        if not force and self._mux_shadow == mux:
+            return
+        self.check_open()
+        self._send_coach_events([pyplane.Coach.generate_aerc_event(*mux)])
+        self._mux_shadow = mux
+        self.applied_profile = None
+
+    def set_bit_depth(self, bit_depth: int) -> None:
+        """ Sets the ADC bit depth, keeping the shadow copy that apply_profile() compares against up to date.
+
+        :param bit_depth: 10 or 12
+        """
+        self.check_open()
+        self.plane.set_bit_depth(pyplane.BitDepth(bit_depth))
+        self._bit_depth_shadow = bit_depth
+        self.applied_profile = None
+
+    def invalidate_mux_shadow(self) -> None:
+        """ Forgets the shadow copies of the mux select lines and ADC bit depth and the applied profile, so that the next apply_profile() sends them.
+        Call it after sending mux events or setting the bit depth directly with get_pyplane(); set_mux() and set_bit_depth() keep the shadows up to date.
+        Called by open(), close(), reset_soft() and reset_hard().
+        """
+        self._mux_shadow = None
+        self._bit_depth_shadow = None
+        self.applied_profile = None
+
     def set_bias_from_tuple(self,b):
         """ Sets a bias from tuple of (address,type,course,fine) values. See `Coach.set_bias`.
         :return: the bias current in A
@@ -1841,7 +2985,7 @@ class Coach():
     def set_bias(self, bias_address: pyplane.Coach.BiasAddress,
                  bias_type: pyplane.Coach.BiasType,
                  coarse_current: pyplane.Coach.BiasGenMasterCurrent,
-                 fine_value: int) -> float:
+                 fine_value: int, force: bool = False) -> float:
         """ Set a particular bias. To use this class, import the pyplane class to access its constants. E.g.
         ```
                 import pyplane
@@ -1863,6 +3007,8 @@ class Coach():
             See [coach.h](https://code.ini.uzh.ch/CoACH/CoACH_Teensy_interface/-/blob/master/src/pc/coach.h);
         :param fine_value: 0-255 int fine value. 
             0 should not really be used since the current is badly defined.
+        :param force: set True to send the bias even if the shadow copy (see `get_bias_shadow()`) says that
+            this address already holds the same value; otherwise identical writes are skipped.
 
         :return: the computed actual current in Amps as COARSE_CURRENTS[coarse_current]*fine_current/255
         """
@@ -1885,11 +3031,16 @@ class Coach():
             log.warning(
                 f'the fine_value {old_fine_val} was truncated to {fine_value}')
         fine_value = int(fine_value)
+        cur = self.BIAS_COARSE_CURRENTS[coarse_current]*fine_value/255
+        value = (bias_type, coarse_current, fine_value)
+        if not force and self._bias_shadow.get(bias_address) == value:
+            log.debug(f'bias {bias_address} already holds {value}, not sending it again')
+            return cur
         self.check_open()
         log.debug(f'sending coach events')
-        self.plane.send_coach_events([pyplane.Coach.generate_biasgen_event(
+        self._send_coach_events([pyplane.Coach.generate_biasgen_event(
             bias_address, bias_type, coarse_current, fine_value)])
-        cur = self.BIAS_COARSE_CURRENTS[coarse_current]*fine_value/255
+        self._bias_shadow[bias_address] = value
         log.debug(
             f'set bias {bias_address} to current {ef(cur)}A (coarse current {coarse_current} and fine value {fine_value})')
         return cur
@@ -1907,7 +3058,7 @@ class Coach():
         Each circuit schematic includes the DAC and ADC channels.
 
         Also, the pyplane.Coach.VoltageOutputSelect.SelectLine1 and pyplane.Coach.VoltageInputSelect 
-        must be sent using get_pyplane().send_coach_events(). 
+        must be selected using set_mux() (or with get_pyplane().send_coach_events() followed by invalidate_mux_shadow()). 
         See Tables 3 (ADC outputs) and 5 (DAC inputs) in [CoACH Chip architecture report](https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=drive_link).
 
 
@@ -1920,6 +3071,7 @@ class Coach():
         vout = self.plane.acquire_waveform(
             dac_channel, adc_channel, interval
         )
+        self.invalidate_dac_shadow(dac_channel)
 
         return vout
     
@@ -1947,8 +3099,789 @@ class Coach():
         """
 
         res = self.plane.acquire_transient_response(DAC, ADC, time_interval, V_step)
+        self.invalidate_dac_shadow(DAC)
         return res
 
+############################################# NOTE setup profiles
+
+    IEF_BIASES = (
+        (pyplane.Coach.BiasAddress.ACN_VLEAK_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 2),
+        (pyplane.Coach.BiasAddress.ACN_VGAIN_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 6),
+        (pyplane.Coach.BiasAddress.ACN_VDC_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I30nA, 3),
+        (pyplane.Coach.BiasAddress.ACN_VREFR_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 8),
+    )
+    """ The (address, type, coarse, fine) bias tuples of the I&F neuron. """
+
+    AHN_BIASES = (
+        # can't set AHN reset too high or it will prevent spiking, since it will be larger than fixed input current
+        (pyplane.Coach.BiasAddress.AHN_VPW_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I60pA, 5), # set a small current but large enough that it makes finite width spikes
+    )
+    """ The (address, type, coarse, fine) bias tuples of the axon-hillock neuron. """
+
+    DVS_PROFILE_BIASES = (
+        (pyplane.Coach.BiasAddress.BUFFER, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I240nA, 255),
+        DVS_DEFAULT_BIASES['pr'],
+        DVS_DEFAULT_BIASES['sf'],
+        DVS_DEFAULT_BIASES['cas'],
+        DVS_DEFAULT_BIASES['diff'],
+        DVS_DEFAULT_BIASES['refr'],
+    )
+    """ The (address, type, coarse, fine) bias tuples of the DVS pixel, without the ON and OFF thresholds,
+    which setup_dvs() sets from its on_off_ratio (see set_dvs_threshold_biases()) so that repeating it with the same ratio sends nothing. """
+
+    SETUP_PROFILES = {p.name: p for p in (
+        SetupProfile('nfet', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.NoneSelected,
+                                  pyplane.Coach.VoltageInputSelect.SelectLine2, pyplane.Coach.SynapseSelect.NoneSelected, 0)),
+        SetupProfile('pfet', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.NoneSelected,
+                                  pyplane.Coach.VoltageInputSelect.SelectLine1, pyplane.Coach.SynapseSelect.NoneSelected, 0)),
+        # nfet array C2Fs are on C2F select line 0, the gate voltage input is on Select 2
+        SetupProfile('nfa', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine0, pyplane.Coach.VoltageOutputSelect.SelectLine1,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine2, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     biases=C2F_BIASES),
+        # pfet array C2Fs are on C2F select line 1 (Table 8 of https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=sharing)
+        # the gate voltage input is on Select 1 (Table 3 of chip_architecture.pdf https://drive.google.com/file/d/1ljX2ACBuOxAENr4ZQkguyslIfM6LT5ks/view?usp=sharing)
+        SetupProfile('pfa', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine1, pyplane.Coach.VoltageOutputSelect.SelectLine1,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine1, pyplane.Coach.SynapseSelect.NoneSelected, 0),  # TODO not checked yet
+                     biases=C2F_BIASES),
+        SetupProfile('ndp', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.NoneSelected,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine2, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     biases=C2F_BIASES),
+        SetupProfile('bab', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.NoneSelected,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine2, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     biases=C2F_BIASES),
+        SetupProfile('nta', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.SelectLine1,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine2, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     biases=C2F_BIASES+(R2R_BUFFER_BIAS,)),
+        SetupProfile('pta', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.SelectLine1,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine1, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     biases=C2F_BIASES+(R2R_BUFFER_BIAS,)),
+        SetupProfile('wrt', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.SelectLine1,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine2, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     biases=C2F_BIASES+(R2R_BUFFER_BIAS,)),
+        SetupProfile('foi', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine0, pyplane.Coach.VoltageOutputSelect.SelectLine1,
+                                 pyplane.Coach.VoltageInputSelect.SelectLine2, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     bit_depth=10),
+        SetupProfile('wta_iout', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine2, pyplane.Coach.VoltageOutputSelect.SelectLine0,
+                                      pyplane.Coach.VoltageInputSelect.SelectLine0, pyplane.Coach.SynapseSelect.NoneSelected, 0)),
+        SetupProfile('wta_iall', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine3, pyplane.Coach.VoltageOutputSelect.SelectLine0,
+                                      pyplane.Coach.VoltageInputSelect.SelectLine0, pyplane.Coach.SynapseSelect.NoneSelected, 0)),
+        SetupProfile('dpi', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine5, pyplane.Coach.VoltageOutputSelect.SelectLine2,
+                                 pyplane.Coach.VoltageInputSelect.NoneSelected, pyplane.Coach.SynapseSelect.DPI, 0)),
+        # select lines and neuron latches
+        SetupProfile('ahn', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine6, pyplane.Coach.VoltageOutputSelect.SelectLine2,
+                                 pyplane.Coach.VoltageInputSelect.NoneSelected, pyplane.Coach.SynapseSelect.NoneSelected, 320),
+                     biases=AER_SOURCES_OFF_BIASES+AHN_BIASES+(R2R_BUFFER_BIAS,)),
+        SetupProfile('ief', biases=AER_SOURCES_OFF_BIASES+IEF_BIASES+(R2R_BUFFER_BIAS,)),
+        # select lines and neuron latches - set mysterious misc flag to 0, TODO not clear what is the effect, seems to be a synapse switch selection
+        SetupProfile('dvs', mux=(pyplane.Coach.CurrentOutputSelect.SelectLine6, pyplane.Coach.VoltageOutputSelect.SelectLine2,
+                                 pyplane.Coach.VoltageInputSelect.NoneSelected, pyplane.Coach.SynapseSelect.NoneSelected, 0),
+                     # the ON and OFF thresholds are left to setup_dvs(), which sets them from its on_off_ratio
+                     biases=tuple(b for b in AER_SOURCES_OFF_BIASES
+                                  if b[0] not in (pyplane.Coach.BiasAddress.DVS_ON_N, pyplane.Coach.BiasAddress.DVS_OFF_N))+DVS_PROFILE_BIASES),
+        )}
+    """ The registry of `SetupProfile` used by the setup_XXX() methods, keyed by name.
+    You can add your own, e.g. `Coach.SETUP_PROFILES['my_circuit']=SetupProfile('my_circuit', mux=..., biases=...)`, and apply it with `apply_profile('my_circuit')`. """
+
+    def apply_profile(self, profile, force: bool = False) -> int:
+        """ Applies a `SetupProfile`, sending only what differs from the current state of the chip.
+
+        The mux select lines and ADC bit depth are sent only if they differ from the last applied values,
+        and biases only if they differ from the shadow copy (see `get_bias_shadow()`). All the events are sent in one batch.
+        If anything was sent, waits the profile's settle time.
+
+        :param profile: the name of a profile in `SETUP_PROFILES`, or a SetupProfile
+        :param force: set True to send the whole profile regardless of the current state
+        :return: the number of coach events that were sent, or buffered if called inside a batch()
+        """
+        if isinstance(profile, str):
+            profile = self.SETUP_PROFILES[profile]
+        self.check_open()
+        n_sent = self._coach_events_issued
+        changed = False
+        with self.batch():
+            if profile.mux is not None and (force or self._mux_shadow != profile.mux):
+                self._send_coach_events([profile.mux_event()])
+                self._mux_shadow = profile.mux
+            for b in profile.biases:
+                self.set_bias(b[0], b[1], b[2], b[3], force=force)
+        if profile.bit_depth is not None and (force or self._bit_depth_shadow != profile.bit_depth):
+            self.plane.set_bit_depth(pyplane.BitDepth(profile.bit_depth))
+            self._bit_depth_shadow = profile.bit_depth
+            changed = True
+        n_sent = self._coach_events_issued - n_sent
+        changed = changed or n_sent > 0
+        log.debug(f'applied setup profile {profile.name} (previous {self.applied_profile}) by sending {n_sent} coach events')
+        self.applied_profile = profile.name
+        if changed and profile.settle_s > 0:
+            time.sleep(profile.settle_s)
+        return n_sent
+
+
+class C2FCalibration():
+    """
+    Frequency to current calibration of all the C2F channels.
+
+    Channel c converts frequency f to current with the polynomial `coeffs[c]` (highest power first, as `np.polyval`)
+    evaluated at f/`scale[c]`, so that the fits stay well conditioned at high frequencies.
+    `f2i()` converts whole (N, 16) frequency matrices in one vectorized call.
+    """
+
+    N_CHANNELS = 16
+
+    def __init__(self, coeffs, scale):
+        """ Construct the calibration from fitted coefficients; use `fit()` or `Coach.calibrate_c2f()` to obtain them.
+
+        :param coeffs: (16, k) polynomial coefficients, highest power first
+        :param scale: (16,) frequency scale of each channel in Hz
+        """
+        self.coeffs = np.asarray(coeffs, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        if self.coeffs.ndim != 2 or self.scale.shape != (self.coeffs.shape[0],):
+            raise ValueError(f'coeffs must be (channels, k) and scale (channels,), got {self.coeffs.shape} and {self.scale.shape}')
+
+    @classmethod
+    def fit(cls, freqs, currents, degree: int = 2) -> 'C2FCalibration':
+        """ Fits every channel by least squares in one batched solve.
+
+        :param freqs: (M, 16) measured frequencies in Hz, one row per sweep point
+        :param currents: (M,) reference currents in A common to all channels, or (M, 16) per channel
+        :param degree: the polynomial degree, which must be less than M
+        :return: the C2FCalibration
+        """
+        freqs = np.asarray(freqs, dtype=float)
+        currents = np.broadcast_to(np.asarray(currents, dtype=float).reshape(len(freqs), -1), freqs.shape)
+        if len(freqs) <= degree:
+            raise ValueError(f'need more than {degree} sweep points to fit degree {degree}, got {len(freqs)}')
+        scale = np.abs(freqs).max(axis=0)
+        scale[scale == 0] = 1
+        x = (freqs / scale).T  # (channels, M)
+        vander = x[..., None] ** np.arange(degree, -1, -1)  # (channels, M, k)
+        coeffs = np.einsum('ckm,cm->ck', np.linalg.pinv(vander), currents.T)
+        return cls(coeffs, scale)
+
+    def f2i(self, freqs) -> np.ndarray:
+        """ Converts C2F frequencies to currents.
+
+        :param freqs: frequencies in Hz with the channels along the last axis, e.g. (16,) or (N, 16)
+        :return: the currents in A, with the same shape
+        """
+        x = np.asarray(freqs, dtype=float) / self.scale
+        i = np.zeros_like(x)
+        for c in self.coeffs.T:  # Horner's scheme over the k powers, vectorized over samples and channels
+            i = i * x + c
+        return i
+
+
+class Waveforms():
+    """
+    Builders of common DAC stimulus waveforms for `Coach.set_waveform()`, computed with numpy.
+    Each returns a 1d float array of n voltages; the samples are played at the interval given to the acquisition,
+    e.g. `Coach.measure_waveform()`, so the builders that need time take the same interval_s. For example
+
+    ```
+    coach.set_waveform(Waveforms.sine(1000, interval_s=1e-4, freq_hz=50, amplitude=.1, offset=.5))
+    vout = coach.measure_foi_waveform(1e-4)
+    ```
+    """
+
+    @staticmethod
+    def step(n: int, v_low: float, v_high: float, step_index: int = None) -> np.ndarray:
+        """ A step from v_low to v_high.
+
+        :param n: the number of samples
+        :param step_index: the first sample at v_high, by default n//2
+        """
+        wf = np.full(n, float(v_low))
+        wf[n // 2 if step_index is None else step_index:] = v_high
+        return wf
+
+    @staticmethod
+    def staircase(n: int, levels) -> np.ndarray:
+        """ Holds each of the levels in turn for an equal number of samples; the last level gets the remainder.
+
+        :param n: the number of samples
+        :param levels: the sequence of voltages
+        """
+        levels = np.asarray(levels, dtype=float)
+        counts = np.full(len(levels), n // len(levels))
+        counts[-1] += n - counts.sum()
+        return np.repeat(levels, counts)
+
+    @staticmethod
+    def sine(n: int, interval_s: float, freq_hz: float, amplitude: float, offset: float = 0, phase: float = 0) -> np.ndarray:
+        """ A sine wave offset + amplitude*sin(2*pi*freq_hz*t + phase).
+
+        :param n: the number of samples
+        :param interval_s: the sample interval in seconds
+        """
+        t = np.arange(n) * interval_s
+        return offset + amplitude * np.sin(2 * np.pi * freq_hz * t + phase)
+
+    @staticmethod
+    def chirp(n: int, interval_s: float, f0_hz: float, f1_hz: float, amplitude: float, offset: float = 0, log_sweep: bool = False) -> np.ndarray:
+        """ A sine wave whose frequency sweeps from f0_hz at the first sample to f1_hz at the end, e.g. to measure a frequency response in one acquisition.
+
+        :param n: the number of samples
+        :param interval_s: the sample interval in seconds
+        :param log_sweep: set True to sweep the frequency exponentially instead of linearly
+        """
+        t = np.arange(n) * interval_s
+        duration_s = n * interval_s
+        if log_sweep:
+            k = np.log(f1_hz / f0_hz)
+            phase = 2 * np.pi * f0_hz * duration_s / k * np.expm1(k * t / duration_s)
+        else:
+            phase = 2 * np.pi * (f0_hz * t + (f1_hz - f0_hz) * t**2 / (2 * duration_s))
+        return offset + amplitude * np.sin(phase)
+
+    @staticmethod
+    def pwm(n: int, period: int, duty, v_low: float, v_high: float) -> np.ndarray:
+        """ A pulse width modulated square wave that is v_high for the first duty fraction of every period.
+
+        :param n: the number of samples
+        :param period: the period in samples
+        :param duty: the duty cycle from 0 to 1, or an array of n duty cycles to modulate it
+        """
+        phase = np.arange(n) % period
+        return np.where(phase < np.asarray(duty) * period, float(v_high), float(v_low))
+
+
+EVENT_DTYPE = np.dtype([('timestamp', '<u8'), ('address', '<u2')])
+""" Packed (10 bytes per event) dtype of event blocks: the unwrapped timestamp in ticks (see `Coach.EVENT_TICKS_PER_S`) and the address. """
+
+
+class TimestampUnwrapper():
+    """
+    Unwraps the 32 bit event timestamps from the board to monotonic 64 bit timestamps across any number of calls.
+
+    A backward jump of more than half the 32 bit range is taken as a wrap around; smaller backward jumps are left as they are
+    since they come from events that arrived slightly out of order.
+    """
+
+    RANGE = 2**32
+
+    def __init__(self):
+        self.wraps = 0
+        """ The number of wrap arounds seen so far. """
+        self._last = None  # last raw timestamp
+
+    def unwrap(self, raw) -> np.ndarray:
+        """ Unwraps the next block of raw timestamps.
+
+        :param raw: 1d array of raw 32 bit timestamps in arrival order
+        :return: uint64 array of unwrapped timestamps
+        """
+        raw = np.asarray(raw, dtype=np.int64)
+        if len(raw) == 0:
+            return np.empty(0, dtype=np.uint64)
+        prev = np.empty_like(raw)
+        prev[0] = raw[0] if self._last is None else self._last
+        prev[1:] = raw[:-1]
+        wrapped = np.cumsum(raw - prev < -self.RANGE // 2) + self.wraps
+        self.wraps = int(wrapped[-1])
+        self._last = int(raw[-1])
+        return (raw + wrapped * self.RANGE).astype(np.uint64)
+
+
+class EventArray():
+    """
+    Compact array of AER output events: a numpy structured array of `EVENT_DTYPE`, 10 bytes per event,
+    with the timestamps in ticks (`Coach.EVENT_TICKS_PER_S`) unwrapped to 64 bits and in increasing order.
+
+    Slice it by time with `time_slice()` and by address with `select()`. `save()` writes a small header followed by the raw events,
+    and `load()` memory-maps such a file so that long recordings open instantly without being read into RAM.
+    """
+
+    MAGIC = b'NE1EVTS1'
+    HEADER_DTYPE = np.dtype([('magic', 'S8'), ('n_events', '<u8'), ('ticks_per_s', '<f8'), ('reserved', '<u8')])
+    """ The 32 byte header of the saved files. """
+
+    def __init__(self, events: np.ndarray = None):
+        """
+        :param events: array of `EVENT_DTYPE`, or None for an empty EventArray
+        """
+        if events is None:
+            events = np.empty(0, dtype=EVENT_DTYPE)
+        if events.dtype != EVENT_DTYPE:
+            raise ValueError(f'events have dtype {events.dtype}, not EVENT_DTYPE')
+        self.events = events
+
+    @classmethod
+    def from_coach_events(cls, es: list, unwrapper: 'TimestampUnwrapper' = None) -> 'EventArray':
+        """ Makes an EventArray from CoachOutputEvent, e.g. from capture_coach_output_events().
+
+        :param es: the list of CoachOutputEvent
+        :param unwrapper: the TimestampUnwrapper to continue from, to unwrap consecutive lists consistently
+        :return: the EventArray
+        """
+        timestamps, addresses = Coach.coach_events_to_arrays(es, raw_timestamps=True)
+        events = np.empty(len(addresses), dtype=EVENT_DTYPE)
+        events['timestamp'] = (TimestampUnwrapper() if unwrapper is None else unwrapper).unwrap(timestamps)
+        events['address'] = addresses
+        return cls(events)
+
+    @classmethod
+    def concatenate(cls, blocks) -> 'EventArray':
+        """ Concatenates blocks of events, e.g. the blocks from an EventStream.
+
+        :param blocks: iterable of EventArray or arrays of `EVENT_DTYPE`
+        :return: the EventArray
+        """
+        arrays = [b.events if isinstance(b, EventArray) else b for b in blocks]
+        return cls(np.concatenate(arrays) if len(arrays) > 0 else None)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """ The uint64 timestamps in ticks. """
+        return self.events['timestamp']
+
+    @property
+    def addresses(self) -> np.ndarray:
+        """ The uint16 addresses. """
+        return self.events['address']
+
+    def timestamps_s(self) -> np.ndarray:
+        """ :return: the float64 timestamps in seconds """
+        return self.events['timestamp'] / Coach.EVENT_TICKS_PER_S
+
+    def duration_s(self) -> float:
+        """ :return: the time between the first and last events in seconds """
+        return float(self.timestamps[-1] - self.timestamps[0]) / Coach.EVENT_TICKS_PER_S if len(self) > 1 else 0.
+
+    def time_slice(self, t0_s: float = None, t1_s: float = None) -> 'EventArray':
+        """ Selects the events with t0_s <= timestamp < t1_s by binary search, without copying.
+
+        :param t0_s: the start time in seconds, or None for the first event
+        :param t1_s: the end time in seconds, or None for after the last event
+        :return: the EventArray view of the events
+        """
+        ts = self.timestamps
+        i0 = 0 if t0_s is None else np.searchsorted(ts, np.ceil(t0_s * Coach.EVENT_TICKS_PER_S), side='left')
+        i1 = len(ts) if t1_s is None else np.searchsorted(ts, np.ceil(t1_s * Coach.EVENT_TICKS_PER_S), side='left')
+        return EventArray(self.events[i0:i1])
+
+    def by_address(self, duration_s: float = None) -> tuple:
+        """ Groups the timestamps by address, see `Coach.events_by_address()`.
+
+        :param duration_s: the recording duration for the rates; by default `duration_s()`
+        :return: (timestamps_by_address, counts, rates) dicts keyed by address
+        """
+        return Coach.events_by_address(self.events, duration_s=duration_s)
+
+    def select(self, addresses) -> 'EventArray':
+        """ Selects the events from some addresses.
+
+        :param addresses: an address or a list of them
+        :return: the EventArray copy of the selected events
+        """
+        return EventArray(self.events[np.isin(self.addresses, addresses)])
+
+    def save(self, path: str) -> None:
+        """ Saves the events to a file that load() can memory-map.
+
+        :param path: the file path, e.g. 'recording.ne1evts'
+        """
+        header = np.array([(self.MAGIC, len(self), Coach.EVENT_TICKS_PER_S, 0)], dtype=self.HEADER_DTYPE)
+        with open(path, 'wb') as f:
+            header.tofile(f)
+            self.events.tofile(f)
+        log.info(f'saved {len(self):,} events to {path}')
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'EventArray':
+        """ Loads events saved with save().
+
+        :param path: the file path
+        :param mmap: set False to read all the events into memory instead of memory-mapping the file read-only
+        :return: the EventArray
+        :raises: ValueError if the file is not an event file
+        """
+        header = np.fromfile(path, dtype=cls.HEADER_DTYPE, count=1)
+        if len(header) == 0 or header['magic'][0] != cls.MAGIC:
+            raise ValueError(f'{path} is not an NE1 event file')
+        n = int(header['n_events'][0])
+        if mmap:
+            events = np.memmap(path, dtype=EVENT_DTYPE, mode='r', offset=cls.HEADER_DTYPE.itemsize, shape=(n,))
+        else:
+            events = np.fromfile(path, dtype=EVENT_DTYPE, count=n, offset=cls.HEADER_DTYPE.itemsize)
+        return cls(events)
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, item):
+        e = self.events[item]
+        return EventArray(e) if isinstance(e, np.ndarray) else e
+
+    def __str__(self):
+        return f'EventArray({len(self):,} events over {self.duration_s():.3f}s)'
+
+
+class EventStream():
+    """
+    Streams AER output events continuously from a background thread, without the 64 s limit and the gaps of capture_coach_output_events().
+
+    The thread issues request_events() chunks back to back, requesting the next chunk `overlap_s` before the current one ends,
+    and drains read_events() into a bounded ring buffer of numpy blocks of `EVENT_DTYPE` with 64 bit unwrapped timestamps.
+    Iterate the stream to get the blocks as they arrive:
+
+    ```
+    with coach.stream_events() as stream:
+        for block in stream:
+            on = block['timestamp'][block['address'] == Coach.DVS_ON_ADDRESS]
+            ...
+    ```
+
+    To keep a whole recording, collect the blocks with `EventArray.concatenate(stream)` after stopping the stream, or save them as they come.
+    If the consumer falls behind by more than `max_blocks` blocks, the oldest blocks are dropped and counted in `dropped_blocks`.
+    The stream thread owns the board while it runs; don't call other Coach methods that talk to the board until it is stopped.
+    """
+
+    def __init__(self, coach: 'Coach', chunk_s: float = 10, overlap_s: float = .5, poll_s: float = .05, max_blocks: int = 10000):
+        """
+        :param coach: the open Coach
+        :param chunk_s: the duration of each request_events() chunk in seconds, max 64
+        :param overlap_s: how long before the end of a chunk to request the next one
+        :param poll_s: the interval in seconds between read_events() calls
+        :param max_blocks: the capacity of the ring buffer in blocks
+        """
+        import threading
+        from collections import deque
+        assert 0 < chunk_s < 64, 'chunk_s must be >0 and <64 seconds'
+        assert 0 <= overlap_s < chunk_s, 'overlap_s must be less than chunk_s'
+        self.coach = coach
+        self.chunk_s = chunk_s
+        self.overlap_s = overlap_s
+        self.poll_s = poll_s
+        self.blocks = deque(maxlen=max_blocks)
+        self.n_events = 0
+        """ The number of events received. """
+        self.dropped_blocks = 0
+        """ The number of blocks dropped because the ring buffer was full. """
+        self.error = None
+        """ The exception that stopped the stream thread, if any. """
+        self._unwrapper = TimestampUnwrapper()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'EventStream':
+        """ Starts the stream thread.
+
+        :return: self
+        """
+        import threading
+        self.coach.check_open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='coach-event-stream', daemon=True)
+        self._thread.start()
+        log.info(f'started event stream with {self.chunk_s}s chunks')
+        return self
+
+    def stop(self) -> None:
+        """ Stops the stream thread; blocks already received can still be iterated. """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._cond:
+            self._cond.notify_all()
+        log.info(f'stopped event stream after {self.n_events:,} events ({self.dropped_blocks} blocks dropped)')
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self):
+        return self if self.is_running() else self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self) -> None:
+        plane = self.coach.plane
+        try:
+            next_request = time.perf_counter()
+            while not self._stop.is_set():
+                now = time.perf_counter()
+                if now >= next_request:
+                    plane.request_events(self.chunk_s)
+                    next_request = now + self.chunk_s - self.overlap_s
+                events = plane.read_events()
+                if len(events) > 0:
+                    self._put(self._to_block(events))
+                self._stop.wait(self.poll_s)
+            self._put(self._to_block(plane.read_events()))
+        except Exception as e:
+            log.error(f'event stream stopped by {e}')
+            self.error = e
+            self.coach.connection.note_transport_error(e)
+        finally:
+            self._stop.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    def _to_block(self, events: list) -> np.ndarray:
+        timestamps, addresses = Coach.coach_events_to_arrays(events, raw_timestamps=True)
+        block = np.empty(len(events), dtype=EVENT_DTYPE)
+        block['timestamp'] = self._unwrapper.unwrap(timestamps)
+        block['address'] = addresses
+        return block
+
+    def _put(self, block: np.ndarray) -> None:
+        if len(block) == 0:
+            return
+        with self._cond:
+            if len(self.blocks) == self.blocks.maxlen:
+                self.dropped_blocks += 1
+            self.blocks.append(block)
+            self.n_events += len(block)
+            self._cond.notify_all()
+
+    def get(self, timeout: float = None):
+        """ Returns the next block, waiting for it if needed.
+
+        :param timeout: how long to wait in seconds, or None to wait until the stream is stopped
+        :return: the block, or None if there is none after the timeout or the stream is stopped and empty
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.blocks) > 0 or self._stop.is_set(), timeout)
+            return self.blocks.popleft() if len(self.blocks) > 0 else None
+
+    def __iter__(self):
+        while True:
+            block = self.get()
+            if block is None:
+                return
+            yield block
+
+
+class AsyncCoach():
+    """
+    asyncio front end for Coach. Every call to the board runs on one dedicated worker thread that owns the pyplane.Plane,
+    so the calls are serialized, and the long waits are done with asyncio.sleep() so that the event loop stays free.
+
+    Any Coach method can be awaited, e.g.
+
+    ```
+    c = AsyncCoach()
+    await c.open()
+    await c.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 10)
+    events = await c.capture_events(1)
+    await c.close()
+    ```
+
+    Don't call the wrapped Coach directly from other threads while the AsyncCoach is in use.
+    """
+
+    def __init__(self, coach: Coach = None):
+        """
+        :param coach: the Coach to wrap, by default Coach()
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        self.coach = Coach() if coach is None else coach
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='coach-io')
+
+    async def _run(self, fn, *args, **kwargs):
+        """ Runs fn(*args, **kwargs) on the worker thread and returns its result. """
+        import asyncio, functools
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.coach, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await self._run(attr, *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+    async def capture_events(self, t: float) -> list:
+        """ Awaitable version of Coach.capture_coach_output_events(); other coroutines and board calls can run while the events are collected.
+
+        :param t: how long to collect events in seconds, max 64
+        :return: the list of pyplane.CoachOutputEvent
+        """
+        import asyncio
+        assert t > 0 and t < 64, 't must be greater than >0 and <=64 seconds'
+        await self._run(self.coach.check_open)
+        await self._run(self.coach.request_coach_output_events, t)
+        await asyncio.sleep(t+self.coach.EVENT_READ_MARGIN_S)
+        return await self._run(self.coach.read_coach_output_events)
+
+    async def capture_coach_output_events(self, t: float) -> list:
+        """ Same as capture_events(). """
+        return await self.capture_events(t)
+
+    async def setup_dvs(self, on_off_ratio=2, settle_duration=5) -> tuple:
+        """ Awaitable version of Coach.setup_dvs(); the pixel settles on the worker thread while the event loop stays free.
+
+        :return: ipr,isf,icas,idiff,ion,ioff,irefr
+        """
+        currents, changed = await self._run(self.coach._setup_dvs_without_settling, on_off_ratio)
+        if changed and settle_duration > 0:
+            await self._run(self.coach.settle_dvs, settle_duration)
+        log.info('setup DVS pixel')
+        return currents
+
+    async def close(self) -> None:
+        """ Closes the Coach and stops the worker thread. """
+        await self._run(self.coach.close)
+        self._executor.shutdown(wait=False)
+
+
+def _run_on_board(port: str, fn, args: tuple, kwargs: dict):
+    """ Opens the board in a worker process of a CoachPool, runs fn(coach, *args, **kwargs) on it and closes it. """
+    coach = Coach(usbport=port)
+    coach.open()
+    try:
+        return fn(coach, *args, **kwargs)
+    finally:
+        coach.close()
+
+
+class CoachPool():
+    """
+    Runs the same function on several Plane PCBs at once, e.g. to characterize a tray of chips:
+
+    ```
+    def measure(coach, vgs):
+        coach.setup_nfet()
+        return coach.sweep_nfet(vg=vgs, vd=.5, vs=0)
+
+    with CoachPool() as pool:
+        results = pool.map(measure, np.linspace(0, 1, 100)) # dict of port -> result
+    ```
+
+    With threads (the default) the pool opens a Coach for every board and keeps them open, so `coaches` can also be used directly.
+    With processes each call opens the board in a worker process, so the function and its arguments must be picklable,
+    i.e. a module level function.
+    """
+
+    def __init__(self, ports: list = None, use_processes: bool = False):
+        """
+        :param ports: the USB ports of the boards, by default all the boards found by Coach.find_coaches()
+        :param use_processes: set True to run in a process pool instead of a thread pool
+        """
+        self.ports = Coach.find_coaches() if ports is None else list(ports)
+        if len(self.ports) == 0:
+            raise RuntimeError('no CoACH boards found on USB bus')
+        self.use_processes = use_processes
+        self.coaches = {}
+        """ dict of port -> open Coach, empty with use_processes. """
+        if not use_processes:
+            for port in self.ports:
+                coach = Coach(usbport=port)
+                coach.open()
+                self.coaches[port] = coach
+        log.info(f'pool of {len(self.ports)} CoACH boards: {self.ports}')
+
+    def map(self, fn, *args, **kwargs) -> dict:
+        """ Runs fn(coach, *args, **kwargs) on every board concurrently and gathers the results.
+
+        :param fn: the function, called with the Coach of the board as its first argument
+        :return: dict of port -> the result of fn for that board
+        :raises: the first exception raised by fn, after all the boards are done
+        """
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+        if self.use_processes:
+            with ProcessPoolExecutor(max_workers=len(self.ports)) as executor:
+                futures = {port: executor.submit(_run_on_board, port, fn, args, kwargs) for port in self.ports}
+                return {port: f.result() for port, f in futures.items()}
+        with ThreadPoolExecutor(max_workers=len(self.ports), thread_name_prefix='coach-pool') as executor:
+            futures = {port: executor.submit(fn, coach, *args, **kwargs) for port, coach in self.coaches.items()}
+            return {port: f.result() for port, f in futures.items()}
+
+    def close(self) -> None:
+        """ Closes all the boards. """
+        for coach in self.coaches.values():
+            coach.close()
+        self.coaches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.ports)
+
+
+############################################# NOTE adaptive sweeps
+
+
+def adaptive_sweep(set_fn, measure_fn, x_min: float, x_max: float, n_initial: int = 9, max_points: int = 64, tol: float = 0.01,
+                   log_x: bool = False, log_y: bool = False, key=None, settle_s: float = 0, min_step: float = None) -> tuple:
+    """
+    Sweeps x from x_min to x_max, placing the points where the measured curve bends instead of on a uniform grid.
+
+    The sweep starts with n_initial evenly spaced points and then repeatedly bisects the intervals next to points that deviate
+    from the straight line through their neighbors by more than tol (as a fraction of the range of y), largest deviations first,
+    until no interval needs refining, max_points are measured, or the intervals reach min_step.
+    With log_y the deviations are taken on log10|y|, so e.g. the subthreshold to above threshold knee of a FET is refined
+    rather than only its steep above threshold part. For example
+
+    ```
+    coach.setup_nfet()
+    vg, i = adaptive_sweep(lambda v: coach.set_dac_voltage(pyplane.DacChannel.AIN0, v),
+                           lambda: coach.plane.read_current(pyplane.AdcChannel.GO22), 0, 1.8, log_y=True)
+    ```
+
+    :param set_fn: function of x that sets up the sweep point, e.g. a Coach setter
+    :param measure_fn: function without arguments that measures the point and returns a number or array
+    :param x_min: the start of the sweep
+    :param x_max: the end of the sweep
+    :param n_initial: the number of points of the initial uniform grid
+    :param max_points: the maximum number of points to measure
+    :param tol: the deviation from linear at which intervals are refined, as a fraction of the range of the (log) y values
+    :param log_x: set True to space and refine the points evenly in log x, e.g. for bias currents; x_min and x_max must be positive
+    :param log_y: set True to refine by the bends of log10|y|
+    :param key: function that maps a measurement to the number to refine on, e.g. `lambda f: f[0]` for one channel of measure_c2f_freqs
+    :param settle_s: time to wait in seconds after setting each point
+    :param min_step: the smallest interval to bisect in (log) x, by default 1/1000 of the (log) x range
+    :return: (x, y), numpy arrays of the sorted x values and the corresponding measurements
+    """
+    if log_x and (x_min <= 0 or x_max <= 0):
+        raise ValueError(f'log_x sweep needs positive x_min and x_max, got {x_min} and {x_max}')
+    to_u = np.log10 if log_x else (lambda x: x)
+    from_u = (lambda u: 10**u) if log_x else (lambda u: u)
+    u_min, u_max = to_u(x_min), to_u(x_max)
+    if min_step is None:
+        min_step = abs(u_max - u_min) / 1000
+    measured = {}  # u -> measurement
+
+    def measure(u):
+        set_fn(from_u(u))
+        if settle_s > 0:
+            time.sleep(settle_s)
+        measured[u] = measure_fn()
+
+    for u in np.linspace(u_min, u_max, max(2, min(n_initial, max_points))).tolist():
+        measure(u)
+    while len(measured) < max_points:
+        u = np.array(sorted(measured))
+        y = np.array([float(measured[v] if key is None else key(measured[v])) for v in u])
+        if log_y:
+            y = np.log10(np.maximum(np.abs(y), np.finfo(float).tiny))
+        y_range = np.ptp(y)
+        if len(u) < 3 or y_range == 0:
+            break
+        # deviation of each interior point from the chord through its neighbors
+        chord = y[:-2] + (y[2:] - y[:-2]) * (u[1:-1] - u[:-2]) / (u[2:] - u[:-2])
+        dev = np.zeros(len(u))
+        dev[1:-1] = np.abs(y[1:-1] - chord) / y_range
+        score = np.maximum(dev[:-1], dev[1:])  # of each interval
+        score[np.diff(u) < 2 * min_step] = 0
+        refine = [i for i in np.argsort(-score) if score[i] > tol][:max_points - len(measured)]
+        if len(refine) == 0:
+            break
+        for i in sorted(refine):
+            measure((u[i] + u[i + 1]) / 2)
+    u = sorted(measured)
+    log.debug(f'adaptive sweep measured {len(u)} points')
+    return from_u(np.array(u)), np.array([measured[v] for v in u])
+
 
 ############################################# NOTE input utilities
 
@@ -2103,6 +4036,7 @@ def print_timing_info():
                 log.error(f'could not save numpy file {timers[k].numpy_file}; caught {e}')
 
         if timers[k].show_hist:
+            from matplotlib import pyplot as plt
 
             def plot_loghist(x, bins):
                 hist, bins = np.histogram(x, bins=bins) # histogram x linearly
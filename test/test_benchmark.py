@@ -0,0 +1,261 @@
+# Latency benchmarks of the Coach API, run on the SimPlane so that no board is needed
+# from root of CoACH-labs, do "pytest -m benchmark"
+# Each case reports the p50/p95/p99 latency and the number of board transactions per call and writes them to test/benchmark_results.json.
+# Every public Coach method has a case named after it, or is listed in EXCLUDED with the reason why it is not benchmarked.
+# The test fails if a method makes more transactions per call than in test/benchmark_baseline.json, which holds only these deterministic counts.
+# After an intended change, rewrite the baseline with
+# NE1_BENCHMARK_UPDATE_BASELINE=1 pytest -m benchmark
+# Latencies depend on the machine and its load, so they are only reported. To also check them, save the results of a run
+# on the same machine before the change and point to them, e.g.
+# NE1_BENCHMARK_JSON=/tmp/before.json pytest -m benchmark   (before the change)
+# NE1_BENCHMARK_LATENCY_REFERENCE=/tmp/before.json pytest -m benchmark   (after the change)
+# which fails if a p95 latency is more than LATENCY_TOLERANCE times the reference.
+
+from ne1 import * # import Coach() class
+import pyplane
+import pytest
+import time
+import json
+import os
+import gc
+import types
+import numpy as np
+from engineering_notation import EngNumber as ef
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+RESULTS_FILE = os.environ.get('NE1_BENCHMARK_JSON', os.path.join(os.path.dirname(__file__), 'benchmark_results.json'))
+SIM_PORT = 'sim://?time_scale=0&seed=1' # no latency or measurement durations, so the timings are the host overhead of Coach itself
+N_CALLS = 50 # calls per case
+LATENCY_REFERENCE_FILE = os.environ.get('NE1_BENCHMARK_LATENCY_REFERENCE') # results of an earlier run on this machine, or None to only report latencies
+LATENCY_TOLERANCE = 5 # timings vary from run to run, so only flag gross latency regressions
+LATENCY_FLOOR_S = 1e-3 # p95 latencies below this are never flagged
+
+I30nA = pyplane.Coach.BiasGenMasterCurrent.I30nA
+DVS_EVENTS_10K = [pyplane.CoachOutputEvent(Coach.DVS_ON_ADDRESS+i%2, i) for i in range(10000)]
+SINE_1K = Waveforms.sine(1000, 1e-4, 50, .1, .5)
+C2F_CAL_1PA_PER_HZ = C2FCalibration(np.tile([0, 1e-12, 0], (C2FCalibration.N_CHANNELS, 1)), np.ones(C2FCalibration.N_CHANNELS))
+NFA_VG_5 = np.linspace(.3, .8, 5)
+WTA_BUMP = np.where(np.arange(16) == 3, .8, .3)
+
+
+def set_dpi_biases_in_batch(c, i):
+    with c.batch():
+        c.set_dpi_baseline()
+        c.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, I30nA, 1+i%255)
+
+# name -> (setup, call); setup(coach) is run once before the calls, call(coach, i) is timed for i in range(N_CALLS)
+CASES = {
+    'set_bias': (None, lambda c, i: c.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, I30nA, 1+i%255)),
+    'set_bias_unchanged': (None, lambda c, i: c.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, I30nA, 10)),
+    'set_nfet_vg': (Coach.setup_nfet, lambda c, i: c.set_nfet_vg(.2+.01*(i%100))),
+    'set_nfet_vg_unchanged': (Coach.setup_nfet, lambda c, i: c.set_nfet_vg(.5)),
+    'measure_nfet_id': (Coach.setup_nfet, lambda c, i: c.measure_nfet_id()),
+    'sweep_nfet_10_points': (Coach.setup_nfet, lambda c, i: c.sweep_nfet(vg=np.linspace(0, 1, 10), vd=.5, vs=0, measure=('id',))),
+    'set_pfet_vg': (Coach.setup_pfet, lambda c, i: c.set_pfet_vg(.2+.01*(i%100))),
+    'measure_pfet_id': (Coach.setup_pfet, lambda c, i: c.measure_pfet_id()),
+    'set_nta_v1': (Coach.setup_nta, lambda c, i: c.set_nta_v1(.2+.01*(i%100))),
+    'measure_nta_vout': (Coach.setup_nta, lambda c, i: c.measure_nta_vout()),
+    'set_wta_vgain': (Coach.setup_wta_iout, lambda c, i: c.set_wta_vgain(.2+.01*(i%100))),
+    'scan_adc_wta_outputs': (Coach.setup_wta_iout, lambda c, i: c.scan_adc(Coach.WTA_LVOUT_CHANNELS, n_repeats=1)),
+    'apply_wta_pattern_moving_bump': (Coach.setup_wta_iout, lambda c, i: c.apply_wta_pattern(np.where(np.arange(16) == i%16, .8, .3))),
+    'measure_dpi_vsyn': (Coach.setup_dpi, lambda c, i: c.measure_dpi_vsyn()),
+    'send_dpi_pulse': (Coach.setup_dpi, lambda c, i: c.send_dpi_pulse()),
+    'measure_c2f_freqs': (Coach.setup_nfa, lambda c, i: c.measure_c2f_freqs(.1)),
+    'set_waveform_unchanged': (lambda c: c.set_waveform(SINE_1K), lambda c, i: c.set_waveform(SINE_1K)),
+    'capture_coach_output_events': (Coach.setup_ahn, lambda c, i: c.capture_coach_output_events(.001)),
+    'filter_dvs_events_10k': (None, lambda c, i: c.filter_dvs_events(DVS_EVENTS_10K)),
+    'set_led_intensity': (None, lambda c, i: c.set_led_intensity(i%256)),
+    'setup_nfet': (None, lambda c, i: c.setup_nfet()),
+    'setup_nta': (None, lambda c, i: c.setup_nta()),
+    'setup_nta_after_setup_pfet': (None, lambda c, i: (c.setup_pfet(), c.setup_nta())),
+    'setup_dvs': (None, lambda c, i: c.setup_dvs(settle_duration=0)),
+    'setup_dvs_after_disable': (None, lambda c, i: (c.disable_all_aer_event_sources(), c.setup_dvs(settle_duration=0))),
+    'set_dvs_threshold_biases': (lambda c: c.setup_dvs(settle_duration=0), lambda c, i: c.set_dvs_threshold_biases(2+i%3)),
+    'disable_all_aer_event_sources': (None, lambda c, i: c.disable_all_aer_event_sources()),
+    # the rest of the public Coach methods, so that every one that is not in EXCLUDED has a case named after it
+    'apply_profile_unchanged': (Coach.setup_nta, lambda c, i: c.apply_profile('nta')),
+    'apply_wta_patterns_2': (Coach.setup_wta_iout, lambda c, i: c.apply_wta_patterns([WTA_BUMP, WTA_BUMP[::-1]])),
+    'batch_5_biases': (None, set_dpi_biases_in_batch),
+    'calibrate_c2f_5_points': (Coach.setup_nfa, lambda c, i: c.calibrate_c2f(lambda v: (c.set_nfa_vg(v), 1e-9*v)[1], NFA_VG_5, duration=.01, settle_s=0)),
+    'check_open': (None, lambda c, i: c.check_open()),
+    'coach_events_to_arrays_10k': (None, lambda c, i: Coach.coach_events_to_arrays(DVS_EVENTS_10K)),
+    'coach_events_to_timestamps_addresses_10k': (None, lambda c, i: c.coach_events_to_timestamps_addresses(DVS_EVENTS_10K)),
+    'events_by_address_10k': (None, lambda c, i: Coach.events_by_address(DVS_EVENTS_10K, duration_s=10)),
+    'get_bias_shadow': (Coach.setup_ahn, lambda c, i: c.get_bias_shadow()),
+    'get_dac_shadow': (Coach.setup_nfet, lambda c, i: c.get_dac_shadow()),
+    'get_firmware_version': (None, lambda c, i: c.get_firmware_version()),
+    'get_pyplane': (None, lambda c, i: c.get_pyplane()),
+    'get_teensy_sn': (None, lambda c, i: c.get_teensy_sn()),
+    'invalidate_bias_shadow': (None, lambda c, i: c.invalidate_bias_shadow()),
+    'invalidate_dac_shadow': (None, lambda c, i: c.invalidate_dac_shadow()),
+    'invalidate_mux_shadow': (None, lambda c, i: c.invalidate_mux_shadow()),
+    'is_open': (None, lambda c, i: c.is_open()),
+    'measure_averaged_nfet_id': (Coach.setup_nfet, lambda c, i: c.measure_averaged(c.measure_nfet_id, max_n=10)),
+    'measure_c2f_currents': (Coach.setup_nfa, lambda c, i: c.measure_c2f_currents(C2F_CAL_1PA_PER_HZ, .1)),
+    'measure_c2f_counts': (Coach.setup_nfa, lambda c, i: c.measure_c2f_counts(.1)),
+    'measure_c2f_freqs_adaptive': (Coach.setup_nfa, lambda c, i: c.measure_c2f_freqs_adaptive()),
+    'measure_foi_vout': (Coach.setup_foi, lambda c, i: c.measure_foi_vout()),
+    'measure_foi_waveform': (lambda c: (c.setup_foi(), c.set_waveform(SINE_1K)), lambda c, i: c.measure_foi_waveform(1e-4)),
+    'measure_nfet_is': (Coach.setup_nfet, lambda c, i: c.measure_nfet_is()),
+    'measure_pfet_is': (Coach.setup_pfet, lambda c, i: c.measure_pfet_is()),
+    'measure_pta_vout': (Coach.setup_pta, lambda c, i: c.measure_pta_vout()),
+    'measure_waveform': (lambda c: (c.setup_nta(), c.set_waveform(SINE_1K)),
+                         lambda c, i: c.measure_waveform(pyplane.DacChannel.AIN0, pyplane.AdcChannel.AOUT11, 1e-4)),
+    'measure_wrt_vout': (Coach.setup_wrt, lambda c, i: c.measure_wrt_vout()),
+    'read_ahn_vout': (Coach.setup_ahn, lambda c, i: c.read_ahn_vout()),
+    'read_coach_output_events': (Coach.setup_ahn, lambda c, i: (c.request_coach_output_events(.001), c.read_coach_output_events())),
+    'read_i2f_transient_vout': (Coach.setup_ief, lambda c, i: c.read_i2f_transient_vout()),
+    'request_coach_output_events': (Coach.setup_ahn, lambda c, i: c.request_coach_output_events(.001)),
+    'reset_soft': (None, lambda c, i: c.reset_soft()),
+    'set_ahn_vpw_ib': (Coach.setup_ahn, lambda c, i: c.set_ahn_vpw_ib(I30nA, 1+i%255)),
+    'set_bab_ib': (Coach.setup_bab, lambda c, i: c.set_bab_ib(I30nA, 1+i%255)),
+    'set_bab_v1': (Coach.setup_bab, lambda c, i: c.set_bab_v1(.2+.01*(i%100))),
+    'set_bab_v2': (Coach.setup_bab, lambda c, i: c.set_bab_v2(.2+.01*(i%100))),
+    'set_bias_from_tuple': (None, lambda c, i: c.set_bias_from_tuple((pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, I30nA, 1+i%255))),
+    'set_bit_depth': (None, lambda c, i: c.set_bit_depth(10+2*(i%2))),
+    'set_dac_voltage': (None, lambda c, i: c.set_dac_voltage(pyplane.DacChannel.AIN0, .2+.01*(i%100))),
+    'set_debug': (None, lambda c, i: c.set_debug(False)),
+    'set_dpi_baseline_unchanged': (Coach.set_dpi_baseline, lambda c, i: c.set_dpi_baseline()),
+    'set_foi_ib': (Coach.setup_foi, lambda c, i: c.set_foi_ib(I30nA, 1+i%255)),
+    'set_foi_vin': (Coach.setup_foi, lambda c, i: c.set_foi_vin(.2+.01*(i%100))),
+    'set_mux_unchanged': (Coach.setup_nfet, lambda c, i: c.set_mux(*Coach.SETUP_PROFILES['nfet'].mux)),
+    'set_ndp_ib': (Coach.setup_ndp, lambda c, i: c.set_ndp_ib(I30nA, 1+i%255)),
+    'set_ndp_v1': (Coach.setup_ndp, lambda c, i: c.set_ndp_v1(.2+.01*(i%100))),
+    'set_ndp_v2': (Coach.setup_ndp, lambda c, i: c.set_ndp_v2(.2+.01*(i%100))),
+    'set_nfa_vg': (Coach.setup_nfa, lambda c, i: c.set_nfa_vg(.2+.01*(i%100))),
+    'set_nfet_vd': (Coach.setup_nfet, lambda c, i: c.set_nfet_vd(.2+.01*(i%100))),
+    'set_nfet_vs': (Coach.setup_nfet, lambda c, i: c.set_nfet_vs(.2+.01*(i%100))),
+    'set_nta_ib': (Coach.setup_nta, lambda c, i: c.set_nta_ib(I30nA, 1+i%255)),
+    'set_nta_v2': (Coach.setup_nta, lambda c, i: c.set_nta_v2(.2+.01*(i%100))),
+    'set_pfa_vg': (Coach.setup_pfa, lambda c, i: c.set_pfa_vg(.2+.01*(i%100))),
+    'set_pfet_vb': (Coach.setup_pfet, lambda c, i: c.set_pfet_vb(.2+.01*(i%100))),
+    'set_pfet_vd': (Coach.setup_pfet, lambda c, i: c.set_pfet_vd(.2+.01*(i%100))),
+    'set_pfet_vs': (Coach.setup_pfet, lambda c, i: c.set_pfet_vs(.2+.01*(i%100))),
+    'set_pta_ib': (Coach.setup_pta, lambda c, i: c.set_pta_ib(I30nA, 1+i%255)),
+    'set_pta_v1': (Coach.setup_pta, lambda c, i: c.set_pta_v1(.2+.01*(i%100))),
+    'set_pta_v2': (Coach.setup_pta, lambda c, i: c.set_pta_v2(.2+.01*(i%100))),
+    'set_wrt_ib': (Coach.setup_wrt, lambda c, i: c.set_wrt_ib(I30nA, 1+i%255)),
+    'set_wrt_v1': (Coach.setup_wrt, lambda c, i: c.set_wrt_v1(.2+.01*(i%100))),
+    'set_wrt_v2': (Coach.setup_wrt, lambda c, i: c.set_wrt_v2(.2+.01*(i%100))),
+    'set_wta_bias_fine': (Coach.setup_wta_iout, lambda c, i: c.set_wta_bias_fine(1+i%255)),
+    'set_wta_vex': (Coach.setup_wta_iout, lambda c, i: c.set_wta_vex(.2+.01*(i%100))),
+    'set_wta_vinh': (Coach.setup_wta_iout, lambda c, i: c.set_wta_vinh(.2+.01*(i%100))),
+    'settle_nfet_id': (Coach.setup_nfet, lambda c, i: c.settle(c.measure_nfet_id, rel_tol=1, interval_s=0)),
+    'settle_c2f': (Coach.setup_nfa, lambda c, i: c.settle_c2f(rel_tol=1)),
+    'settle_voltage': (Coach.setup_nta, lambda c, i: c.settle_voltage(pyplane.AdcChannel.AOUT11, abs_tol=1, interval_s=0)),
+    'setup_ahn': (None, lambda c, i: c.setup_ahn()),
+    'setup_bab': (None, lambda c, i: c.setup_bab()),
+    'setup_c2f': (None, lambda c, i: c.setup_c2f()),
+    'setup_dpi': (None, lambda c, i: c.setup_dpi()),
+    'setup_dvs_biases': (None, lambda c, i: c.setup_dvs_biases()),
+    'setup_foi': (None, lambda c, i: c.setup_foi()),
+    'setup_ief': (None, lambda c, i: c.setup_ief()),
+    'setup_ndp': (None, lambda c, i: c.setup_ndp()),
+    'setup_nfa': (None, lambda c, i: c.setup_nfa()),
+    'setup_pfa': (None, lambda c, i: c.setup_pfa()),
+    'setup_pfet': (None, lambda c, i: c.setup_pfet()),
+    'setup_pta': (None, lambda c, i: c.setup_pta()),
+    'setup_r2r_buffer': (None, lambda c, i: c.setup_r2r_buffer()),
+    'setup_wrt': (None, lambda c, i: c.setup_wrt()),
+    'setup_wta_iall': (None, lambda c, i: c.setup_wta_iall()),
+    'setup_wta_iout': (None, lambda c, i: c.setup_wta_iout()),
+    'sweep_pfet_10_points': (Coach.setup_pfet, lambda c, i: c.sweep_pfet(vg=np.linspace(0, 1, 10), vd=.5, vs=0, measure=('id',))),
+    'transient_response': (Coach.setup_nta, lambda c, i: c.transient_response(pyplane.DacChannel.AIN0, pyplane.AdcChannel.AOUT11, 1e-4, .5)),
+}
+
+# public Coach methods without a case; every other public method must have a case named after it (exactly or as a prefix followed by '_')
+EXCLUDED = {
+    'open': 'changes the connection that the cases run on; its latency is the USB handshake with the board, which the SimPlane does not model',
+    'close': 'changes the connection that the cases run on; on a board it sleeps .5s for the cleanup',
+    'reconnect': 'closes and reopens the connection, and waits for udev to report the board',
+    'reset_hard': 'resets and reconnects the board, which takes seconds inside pyplane',
+    'find_coach': 'enumerates the USB devices through udev, not the board',
+    'find_coaches': 'enumerates the USB devices through udev, not the board',
+    'get_teensy_watcher': 'returns the process-wide udev watcher, not a board call',
+    'settle_dvs': 'waits at least DVS_MIN_SETTLE_S of wall-clock time by design',
+    'foi_compensate_vin': 'polls the FOI output .1s apart by design, so its latency is the settling wait',
+    'stream_events': 'starts a background thread whose latency is its chunk_s recording time',
+    'set_nfet_vb': 'does nothing, since the NFET bulk is always ground',
+    'setup_diffpair_n': 'deprecated alias of setup_ndp',
+    'set_diffpair_n_ib': 'deprecated alias of set_ndp_ib',
+    'set_diffpair_n_v1': 'deprecated alias of set_ndp_v1',
+    'set_diffpair_n_v2': 'deprecated alias of set_ndp_v2',
+}
+
+
+def run_case(coach, setup, call) -> dict:
+    """ Runs one benchmark case
+
+    :return: dict of p50_s, p95_s, p99_s latencies and transactions_per_call
+    """
+    sim = coach.get_pyplane() # before the setup, since it makes the next set_waveform() upload again
+    coach.reset_soft()
+    if setup is not None:
+        setup(coach)
+    n0 = sim.n_transactions()
+    dts = np.empty(N_CALLS)
+    gc.collect()
+    gc.disable() # so that a collection of garbage left by earlier cases or tests does not land in the timings
+    try:
+        for i in range(N_CALLS):
+            t = time.perf_counter()
+            call(coach, i)
+            dts[i] = time.perf_counter()-t
+    finally:
+        gc.enable()
+    p50, p95, p99 = np.percentile(dts, [50, 95, 99])
+    return {'p50_s': p50, 'p95_s': p95, 'p99_s': p99, 'transactions_per_call': (sim.n_transactions()-n0)/N_CALLS}
+
+
+@pytest.mark.benchmark
+def test_benchmark_covers_public_coach_methods():
+    """ Checks that every public Coach method either has a case or is listed in EXCLUDED with the reason"""
+    public = {name for name, attr in vars(Coach).items() if not name.startswith('_') and isinstance(attr, (types.FunctionType, staticmethod, classmethod))}
+    uncovered = sorted(m for m in public - EXCLUDED.keys() if not any(name == m or name.startswith(m+'_') for name in CASES))
+    assert not uncovered, f'public Coach methods without a benchmark case or an EXCLUDED reason: {uncovered}'
+    assert not EXCLUDED.keys() - public, f'EXCLUDED lists methods that are not public Coach methods: {sorted(EXCLUDED.keys() - public)}'
+
+
+@pytest.mark.serial  #https://github.com/pytest-dev/pytest-xdist/issues/84
+@pytest.mark.benchmark
+def test_benchmark_coach_api():
+    """ Benchmarks the Coach API on the SimPlane and compares it with the stored baseline"""
+    coach = Coach()
+    coach.close()
+    coach.open(SIM_PORT)
+    heartbeat_interval_s = coach.connection.heartbeat_interval_s
+    coach.connection.heartbeat_interval_s = None # no liveness round trips in the middle of a case when the heartbeat interval expires
+    try:
+        results = {name: run_case(coach, setup, call) for name, (setup, call) in CASES.items()}
+    finally:
+        coach.connection.heartbeat_interval_s = heartbeat_interval_s
+        coach.close()
+
+    print(f'{"method":35s} {"p50":>8s} {"p95":>8s} {"p99":>8s} {"trans/call":>10s}')
+    for name, r in results.items():
+        print(f'{name:35s} {str(ef(r["p50_s"]))+"s":>8s} {str(ef(r["p95_s"]))+"s":>8s} {str(ef(r["p99_s"]))+"s":>8s} {r["transactions_per_call"]:10.2f}')
+    with open(RESULTS_FILE, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    transactions = {name: {'transactions_per_call': r['transactions_per_call']} for name, r in results.items()}
+    if os.environ.get('NE1_BENCHMARK_UPDATE_BASELINE') or not os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(transactions, f, indent=1)
+        return
+
+    with open(BASELINE_FILE) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        b = baseline[name]
+        if r['transactions_per_call'] > b['transactions_per_call']+1e-9:
+            regressions.append(f'{name}: {r["transactions_per_call"]:.2f} transactions/call, baseline {b["transactions_per_call"]:.2f}')
+    if LATENCY_REFERENCE_FILE is not None:
+        with open(LATENCY_REFERENCE_FILE) as f:
+            reference = json.load(f)
+        for name, r in results.items():
+            if name in reference and r['p95_s'] > max(LATENCY_TOLERANCE*reference[name]['p95_s'], LATENCY_FLOOR_S):
+                regressions.append(f'{name}: p95 {ef(r["p95_s"])}s, reference {ef(reference[name]["p95_s"])}s')
+    assert not regressions, 'benchmark regressions:\n'+'\n'.join(regressions)
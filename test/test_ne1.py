@@ -7,7 +7,6 @@
 from ne1 import * # import Coach() class
 import logging
 import pyplane
-from deprecated import deprecated
 import pytest
 import time
 from matplotlib import pyplot as plt
@@ -325,10 +324,10 @@ def test_dvs_bias_loading_but_no_change(request):
         fine_values=prb_dc+prb_ac*np.sin(cycles*2*np.pi*ts/t)
         # es=p.capture_events(t) # max is 64 (64k ms)
         coach.request_coach_output_events(t)
-        coach.set_bias(pyplane.Coach.BiasAddress.DVS_SF_P,pyplane.Coach.BiasType.P,pyplane.Coach.BiasGenMasterCurrent.I30nA,int(prb_dc))
+        coach.set_bias(pyplane.Coach.BiasAddress.DVS_SF_P,pyplane.Coach.BiasType.P,pyplane.Coach.BiasGenMasterCurrent.I30nA,int(prb_dc),force=True)
         time.sleep(1)
         for fine_value in tqdm(fine_values,mininterval=5):
-            coach.set_bias(pyplane.Coach.BiasAddress.DVS_SF_P,pyplane.Coach.BiasType.P,pyplane.Coach.BiasGenMasterCurrent.I30nA,int(fine_value))
+            coach.set_bias(pyplane.Coach.BiasAddress.DVS_SF_P,pyplane.Coach.BiasType.P,pyplane.Coach.BiasGenMasterCurrent.I30nA,int(fine_value),force=True) # force reloading the same value
             time.sleep(dt)
         es=coach.read_coach_output_events()
         assert len(es)>0, 'Coach did not return any events'
@@ -406,6 +405,745 @@ def test_ahn(): # axon hillock test
 
 
 
+def test_connection_tracker_heartbeat():
+    """ Tests that ConnectionTracker trusts the open state only within the heartbeat interval and not after a transport error"""
+    tracker=ConnectionTracker(heartbeat_interval_s=.05)
+    assert not tracker.is_trusted(), 'never verified, should not be trusted'
+    tracker.mark_verified()
+    assert tracker.is_trusted()
+    time.sleep(.1)
+    assert not tracker.is_trusted(), 'heartbeat expired, should not be trusted'
+    tracker.mark_verified()
+    tracker.note_transport_error(RuntimeError('USB timeout'))
+    assert not tracker.is_trusted(), 'should not be trusted after transport error'
+    assert tracker.transport_errors==1
+
+
+@pytest.mark.serial
+def test_sim_transport_error_of_any_board_call_forces_liveness_check():
+    """ Tests on the SimPlane that a transport error from an ordinary board call is noted and makes the next check_open() check liveness"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        heartbeat_interval_s=coach.connection.heartbeat_interval_s
+        coach.connection.heartbeat_interval_s=None # trust forever unless there is an error
+        # Coach() can return an instance that earlier tests used, so only count what happens here
+        checks, errors=coach.connection.liveness_checks, coach.connection.transport_errors
+        coach.is_open()
+        assert coach.connection.liveness_checks==checks, 'only check_open() should count liveness checks'
+        assert sim.read_voltage is sim.read_voltage, 'the wrapper of a board call should be made once'
+        def fail(channel):
+            raise RuntimeError('USB timeout')
+        sim.read_voltage=fail # drops the kept wrapper
+        with pytest.raises(RuntimeError):
+            coach.measure_nta_vout()
+        assert coach.connection.transport_errors==errors+1
+        del sim.read_voltage
+        coach.check_open()
+        assert coach.connection.liveness_checks==checks+1
+        coach.check_open()
+        assert coach.connection.liveness_checks==checks+1
+    finally:
+        coach.connection.heartbeat_interval_s=heartbeat_interval_s
+        coach.close()
+
+
+def test_setup_profiles_merge_biases():
+    """ Tests that SetupProfile keeps the last value of a repeated bias address and that all registered profiles are named consistently"""
+    a=(pyplane.Coach.BiasAddress.BUFFER, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I240nA, 255)
+    b=(pyplane.Coach.BiasAddress.BUFFER, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I240nA, 0)
+    profile=SetupProfile('test', biases=(a,b))
+    assert profile.biases==(b,)
+    assert profile.mux_event() is None
+    for name,p in Coach.SETUP_PROFILES.items():
+        assert name==p.name
+
+
+@pytest.mark.serial  #https://github.com/pytest-dev/pytest-xdist/issues/84
+def test_sim_plane_skips_redundant_writes():
+    """ Tests on the SimPlane that repeated setup and DAC writes do not talk to the board again"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0&seed=1')
+    try:
+        sim=coach.get_pyplane()
+        assert isinstance(sim, TrackedPlane) and 'SimPlane' in str(sim)
+        coach.setup_nta()
+        n=sim.n_transactions()
+        coach.setup_nta()
+        assert sim.n_transactions()==n, 'repeated setup_nta() should send nothing'
+        v=coach.set_nfet_vg(.5)
+        assert abs(v-.5)<=Coach.DAC_LSB_V/2
+        coach.set_nfet_vg(.5+Coach.DAC_LSB_V/4) # same DAC code
+        assert sim.transactions['set_voltage']==1
+        with coach.batch():
+            coach.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 10)
+            coach.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 20)
+        assert sim.transactions['send_coach_events']==2, 'batch should be sent in one call'
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_set_dac_voltage_skips_same_dac_code():
+    """ Tests on the SimPlane that set_dac_voltage() writes only new DAC codes, and writes again after invalidate_dac_shadow()"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        writes=lambda: sim.transactions.get('set_voltage', 0)
+        lsb=Coach.DAC_LSB_V
+        v=coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5)
+        assert writes()==1
+        assert coach.get_dac_shadow()=={pyplane.DacChannel.AIN0: v}
+        assert coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5+lsb/4)==v, 'the same DAC code should return the cached voltage'
+        assert writes()==1
+        coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5+lsb)
+        assert writes()==2, 'the next DAC code should be written'
+        coach.set_dac_voltage(pyplane.DacChannel.AIN1, .5+lsb)
+        assert writes()==3, 'each channel has its own shadow'
+        # a raw write through get_pyplane() is recorded in the shadow, so setting the old value again is written
+        vraw=sim.set_voltage(pyplane.DacChannel.AIN0, .2)
+        assert writes()==4
+        assert coach.get_dac_shadow()[pyplane.DacChannel.AIN0]==vraw
+        coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5+lsb)
+        assert writes()==5 and abs(sim.get_set_voltage(pyplane.DacChannel.AIN0)-(.5+lsb))<=lsb/2
+        # a write that bypasses Coach is not seen until the shadow is invalidated
+        coach._pyplane.set_voltage(pyplane.DacChannel.AIN0, .2)
+        coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5+lsb)
+        assert writes()==6 and sim.get_set_voltage(pyplane.DacChannel.AIN0)<.3, 'the stale shadow should skip the write'
+        coach.invalidate_dac_shadow(pyplane.DacChannel.AIN0)
+        assert pyplane.DacChannel.AIN0 not in coach.get_dac_shadow() and pyplane.DacChannel.AIN1 in coach.get_dac_shadow()
+        coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5+lsb)
+        assert writes()==7 and abs(sim.get_set_voltage(pyplane.DacChannel.AIN0)-(.5+lsb))<=lsb/2
+        coach.invalidate_dac_shadow()
+        assert coach.get_dac_shadow()=={}
+        coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5+lsb)
+        coach.set_dac_voltage(pyplane.DacChannel.AIN1, .5+lsb)
+        assert writes()==9
+        # requests above the range are clipped like the board does, so they do not rewrite the top code
+        coach.set_dac_voltage(pyplane.DacChannel.AIN1, 5)
+        coach.set_dac_voltage(pyplane.DacChannel.AIN1, 6)
+        assert writes()==10
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_nested_batches_send_once_at_outermost_exit():
+    """ Tests on the SimPlane that the events of nested batches are sent in one call when the outermost batch exits"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        n, m=sim.transactions.get('send_coach_events', 0), coach.coach_events_sent
+        with coach.batch():
+            coach.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 10)
+            with coach.batch():
+                coach.set_bias(pyplane.Coach.BiasAddress.PTA_VB_P, pyplane.Coach.BiasType.P, pyplane.Coach.BiasGenMasterCurrent.I30nA, 20)
+                coach.setup_nta() # batches its biases too
+            assert sim.transactions.get('send_coach_events', 0)==n, 'the inner batch should not send when it exits'
+            assert sim.coach_events_sent==0
+        assert sim.transactions.get('send_coach_events', 0)==n+1
+        assert sim.coach_events_sent==coach.coach_events_sent-m>2
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_batch_discards_events_on_exception():
+    """ Tests on the SimPlane that a batch left by an exception, also from a nested batch, sends nothing and forgets the bias shadow"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        bias=(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 10)
+        n, m=sim.transactions.get('send_coach_events', 0), coach.coach_events_sent
+        with pytest.raises(ValueError):
+            with coach.batch():
+                coach.set_bias_from_tuple(bias)
+                with coach.batch():
+                    coach.setup_nta()
+                    raise ValueError('user error')
+        assert sim.transactions.get('send_coach_events', 0)==n
+        assert sim.coach_events_sent==0
+        assert coach.coach_events_sent==m, 'discarded events should not be counted as sent'
+        assert coach.get_bias_shadow()=={}
+        coach.set_bias_from_tuple(bias)
+        assert sim.coach_events_sent==1, 'the discarded bias should be sent again'
+        with coach.batch(): # the batch is usable again after the exception
+            coach.set_bias(*bias[:3], 11)
+        assert sim.coach_events_sent==2
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_failed_batch_flush_forgets_shadows():
+    """ Tests on the SimPlane that biases of a batch whose sending failed are sent again by the next set_bias()"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        def fail(events):
+            raise RuntimeError('USB transport error')
+        sim.send_coach_events=fail
+        m=coach.coach_events_sent
+        with pytest.raises(RuntimeError):
+            with coach.batch():
+                coach.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 10)
+                coach.setup_nta()
+        assert coach.get_bias_shadow()=={}
+        assert coach.coach_events_sent==m, 'events that failed to send should not be counted as sent'
+        del sim.send_coach_events
+        n=sim.coach_events_sent
+        coach.set_bias(pyplane.Coach.BiasAddress.NTA_VB_N, pyplane.Coach.BiasType.N, pyplane.Coach.BiasGenMasterCurrent.I30nA, 10)
+        assert sim.coach_events_sent==n+1
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_mux_shadow_follows_set_mux_and_invalidate():
+    """ Tests on the SimPlane that apply_profile() resends the mux after set_mux() or a raw mux event followed by invalidate_mux_shadow()"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        coach.setup_nta()
+        wta_mux=Coach.SETUP_PROFILES['wta_iout'].mux
+        coach.set_mux(*wta_mux)
+        n=sim.coach_events_sent
+        coach.set_mux(*wta_mux)
+        assert sim.coach_events_sent==n, 'the same mux should not be sent again'
+        coach.setup_nta()
+        assert sim.coach_events_sent==n+1, 'setup_nta() should restore its mux'
+        sim.send_coach_events([pyplane.Coach.generate_aerc_event(*wta_mux)]) # like the labs do with p.send_coach_events()
+        coach.invalidate_mux_shadow()
+        coach.setup_nta()
+        assert sim.coach_events_sent==n+3
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial  #https://github.com/pytest-dev/pytest-xdist/issues/84
+def test_sim_sweep_nfet():
+    """ Tests on the SimPlane that sweep_nfet() broadcasts the terminal voltages and writes each DAC only when its code changes"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0&seed=1')
+    try:
+        coach.setup_nfet()
+        vg=np.linspace(0,1,50)
+        r=coach.sweep_nfet(vg=vg, vd=np.array([.1,1])[:,None], vs=0, measure=('id',))
+        assert r.shape==(2,50)
+        assert np.all(np.abs(r['vg']-vg)<=Coach.DAC_LSB_V/2)
+        assert np.all(np.isnan(r['is'])) and not np.any(np.isnan(r['id']))
+        assert coach.get_pyplane().transactions['set_voltage']==2*50+2+1
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial  #https://github.com/pytest-dev/pytest-xdist/issues/84
+def test_sim_async_coach_capture_does_not_block_loop():
+    """ Tests on the SimPlane that AsyncCoach.capture_events() lets other coroutines run while the events are collected"""
+    import asyncio
+
+    async def run():
+        coach=AsyncCoach()
+        await coach.open('sim://?event_rate_hz=1000&seed=1')
+        try:
+            ticks=[]
+            async def ticker():
+                for i in range(5):
+                    await asyncio.sleep(.02)
+                    ticks.append(i)
+            events,_=await asyncio.gather(coach.capture_events(.2), ticker())
+            assert len(ticks)==5
+            assert len(events)>0
+            assert len(await coach.measure_c2f_freqs(.01))==16
+        finally:
+            await coach.close()
+
+    asyncio.run(run())
+
+
+def test_timestamp_unwrapper():
+    """ Tests that TimestampUnwrapper carries wrap arounds across blocks and ignores small out of order steps"""
+    u=TimestampUnwrapper()
+    r=TimestampUnwrapper.RANGE
+    assert list(u.unwrap([r-3,r-2]))==[r-3,r-2]
+    assert list(u.unwrap([r-1,1,0,5]))==[r-1,r+1,r,r+5]
+    assert list(u.unwrap([7]))==[r+7]
+    assert u.wraps==1
+
+
+def test_coach_events_to_arrays():
+    """ Tests the bulk conversion of CoachOutputEvent lists and event blocks to timestamp and address arrays"""
+    es=[pyplane.CoachOutputEvent(Coach.DVS_ON_ADDRESS if i%3 else Coach.DVS_OFF_ADDRESS, 2**32-1-i) for i in range(1000)]
+    ts,addresses=Coach.coach_events_to_arrays(es, raw_timestamps=True)
+    assert ts.dtype==np.uint32 and addresses.dtype==np.int32
+    assert ts[0]==2**32-1 and addresses[1]==Coach.DVS_ON_ADDRESS
+    ts_s,_=Coach.coach_events_to_arrays(es)
+    assert np.allclose(ts_s, ts/Coach.EVENT_TICKS_PER_S)
+    on,off=Coach().filter_dvs_events(es)
+    assert len(on)+len(off)==len(es) and len(off)==334
+
+
+def test_events_by_address():
+    """ Tests that events_by_address groups the timestamps of every address in order and reports counts and rates"""
+    es=[pyplane.CoachOutputEvent([Coach.DVS_ON_ADDRESS,Coach.DVS_OFF_ADDRESS,1,9][i%4], i) for i in range(1000)]
+    timestamps_by_address,counts,rates=Coach.events_by_address(es, duration_s=2)
+    assert sorted(counts)==[1,Coach.DVS_ON_ADDRESS,Coach.DVS_OFF_ADDRESS,9]
+    assert counts[9]==250 and rates[9]==125
+    assert np.allclose(timestamps_by_address[1], np.arange(2,1000,4)/Coach.EVENT_TICKS_PER_S)
+    assert Coach.events_by_address([])==({},{},{})
+
+
+def test_event_array_slicing_and_memmap(tmp_path):
+    """ Tests EventArray time and address slicing and the save/load round trip through a memory-mapped file"""
+    es=[pyplane.CoachOutputEvent(i%3, (2**32-100+i)%2**32) for i in range(1000)]
+    events=EventArray.from_coach_events(es)
+    assert events.events.dtype.itemsize==10
+    assert np.all(np.diff(events.timestamps.astype(np.int64))==1), 'timestamps should be unwrapped'
+    t=events.timestamps_s()
+    assert len(events.time_slice(t[10], t[20]))==10
+    assert len(events.select(0))==334 and len(events.select([1,2]))==666
+    path=str(tmp_path/'events.ne1evts')
+    events.save(path)
+    loaded=EventArray.load(path)
+    assert isinstance(loaded.events, np.memmap)
+    assert np.array_equal(loaded.events, events.events)
+
+
+@pytest.mark.serial  #https://github.com/pytest-dev/pytest-xdist/issues/84
+def test_sim_event_stream_across_chunks():
+    """ Tests on the SimPlane that EventStream delivers monotonic unwrapped timestamps across overlapping chunks and a wrap around"""
+    coach=Coach()
+    coach.open(f'sim://?event_rate_hz=5000&seed=1&start_ticks={2**32-500}')
+    try:
+        blocks=[]
+        with coach.stream_events(chunk_s=.2, overlap_s=.05) as stream:
+            t=time.time()
+            for block in stream:
+                blocks.append(block)
+                if time.time()-t>.8:
+                    stream.stop()
+        assert stream.error is None
+        ts=np.concatenate(blocks)['timestamp']
+        assert ts.dtype==np.uint64
+        assert np.all(np.diff(ts.astype(np.int64))>=0)
+        assert ts[-1]>2**32, 'timestamps should be unwrapped past 32 bits'
+        assert coach.get_pyplane().transactions['request_events']>=4
+    finally:
+        coach.close()
+
+
+def _sim_nfet_sweep(coach, n):
+    coach.setup_nfet()
+    return coach.sweep_nfet(vg=np.linspace(0,1,n), vd=.5, vs=0, measure=('id',))
+
+
+@pytest.mark.serial  #https://github.com/pytest-dev/pytest-xdist/issues/84
+def test_sim_coach_pool():
+    """ Tests that there is one Coach per port and that CoachPool runs a sweep on several simulated boards at once"""
+    assert Coach() is Coach(logging_level=logging.INFO)
+    other=Coach(usbport='sim://?seed=1')
+    assert other is not Coach()
+    del other
+    assert ('sim://?seed=1', None) not in Coach._instances, 'unused instances should not be kept'
+    ports=[f'sim://?time_scale=0&seed={i}' for i in range(3)]
+    with CoachPool(ports) as pool:
+        results=pool.map(_sim_nfet_sweep, 20)
+        assert len({id(c) for c in pool.coaches.values()})==3
+    assert list(results)==ports
+    assert all(r.shape==(20,) for r in results.values())
+
+
+@pytest.mark.serial
+def test_sim_board_is_open_in_one_coach_only():
+    """ Tests that two Coach instances cannot open the same board, and that the board is free again after close()"""
+    a=Coach(usbport='sim://?time_scale=0&teensy_sn=7')
+    b=Coach(usbport='sim://?time_scale=0&teensy_sn=7&seed=1') # another port name for the same board
+    try:
+        a.open()
+        with pytest.raises(RuntimeError):
+            b.open()
+        assert not b.open_flag
+        a.close()
+        b.open()
+        assert Coach._open_boards[7] is b
+    finally:
+        a.close()
+        b.close()
+    assert 7 not in Coach._open_boards
+
+
+def test_find_coach_with_serial_number_releases_other_boards(monkeypatch):
+    """ Tests that the boards that are opened to check their serial number are released before the next one is opened"""
+    coach=Coach(usbport='sim://?time_scale=0')
+    opened=[]
+    class FakePlane():
+        live=set()
+        def open(self, dev):
+            assert not FakePlane.live, 'the previous board should have been released first'
+            FakePlane.live.add(dev)
+            self.dev=dev
+            opened.append(dev)
+        def get_teensy_sn(self):
+            return int(self.dev[-1])
+        def __del__(self):
+            FakePlane.live.discard(getattr(self, 'dev', None))
+    monkeypatch.setattr(pyplane, 'Plane', FakePlane)
+    monkeypatch.setattr(Coach, 'find_coaches', staticmethod(lambda: ['/dev/ttyACM1', '/dev/ttyACM2', '/dev/ttyACM3']))
+    monkeypatch.setattr(Coach, 'PLANE_RELEASE_S', 0)
+    plane, dev=coach._find_coach_with_serial_number(3)
+    assert dev=='/dev/ttyACM3' and opened==['/dev/ttyACM1', '/dev/ttyACM2', '/dev/ttyACM3']
+    del plane
+    with pytest.raises(RuntimeError):
+        coach._find_coach_with_serial_number(4)
+
+
+class _FakeUdevDevice():
+    def __init__(self, action, device_node, serial):
+        self.action=action
+        self.device_node=device_node
+        self.properties={'ID_VENDOR':Coach.TEENSY_VENDOR_NAMES[0], 'ID_VENDOR_ID':Coach.TEENSY_VID, 'ID_MODEL_ID':Coach.TEENSY_PID, 'ID_SERIAL_SHORT':serial}
+
+
+class _FakeUdevMonitor():
+    """ Stands in for pyudev.Monitor; push() events from the test """
+    def __init__(self):
+        import queue
+        self.events=queue.Queue()
+        self.started=False
+    def start(self):
+        self.started=True
+    def push(self, device):
+        self.events.put(device)
+    def poll(self, timeout=None):
+        import queue
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def test_teensy_watcher_reconnect_on_add_event():
+    """ Tests that TeensyWatcher caches Teensy nodes and wakes up a waiter as soon as the same serial number is added again"""
+    import threading
+    monitor=_FakeUdevMonitor()
+    other=_FakeUdevDevice('add', '/dev/ttyS0', None)
+    other.properties={}
+    watcher=TeensyWatcher(monitor=monitor, devices=[_FakeUdevDevice('add', '/dev/ttyACM0', '123'), other], poll_s=.01)
+    try:
+        assert watcher.find()=='/dev/ttyACM0' and watcher.nodes=={'/dev/ttyACM0':'123'}
+        count=watcher.add_count('123')
+        monitor.push(_FakeUdevDevice('remove', '/dev/ttyACM0', '123'))
+        threading.Timer(.1, monitor.push, args=(_FakeUdevDevice('add', '/dev/ttyACM1', '123'),)).start()
+        t=time.perf_counter()
+        assert watcher.wait_for_add('123', count, timeout=5)=='/dev/ttyACM1'
+        assert time.perf_counter()-t<2, 'should return as soon as the add event arrives'
+        assert watcher.wait_for_add('456', 0, timeout=.05) is None
+    finally:
+        watcher.stop()
+
+
+def test_teensy_watcher_starts_monitor_first_and_dies_on_error():
+    """ Tests that TeensyWatcher listens before enumerating the attached devices and marks itself dead if the monitor fails"""
+    monitor=_FakeUdevMonitor()
+    def devices():
+        assert monitor.started, 'the monitor should be started before enumerating'
+        yield _FakeUdevDevice('add', '/dev/ttyACM0', '123')
+    watcher=TeensyWatcher(monitor=monitor, devices=devices(), poll_s=.01)
+    try:
+        assert watcher.alive and watcher.find()=='/dev/ttyACM0'
+        def fail(timeout=None):
+            raise OSError('netlink socket closed')
+        monitor.poll=fail
+        t=time.perf_counter()
+        assert watcher.wait_for_add('123', watcher.add_count('123'), timeout=5) is None
+        assert time.perf_counter()-t<2, 'waiters should not wait for a dead watcher'
+        assert not watcher.alive
+    finally:
+        watcher.stop()
+
+
+def test_import_is_headless():
+    """ Tests that import ne1 does not import matplotlib or the Deprecated package, in a fresh interpreter"""
+    import subprocess, sys, os
+    code="import ne1, sys; print('matplotlib' in sys.modules, 'deprecated' in sys.modules)"
+    out=subprocess.run([sys.executable, '-c', code], cwd=os.path.join(os.path.dirname(__file__), '..'),
+                       capture_output=True, text=True, check=True).stdout.split()
+    assert out[-2]=='False', 'import ne1 should not import matplotlib'
+    assert out[-1]=='False', 'import ne1 should not import deprecated'
+
+
+@pytest.mark.serial  #https://github.com/pytest-dev/pytest-xdist/issues/84
+def test_sim_dpi_c2f_uses_cached_calibration(tmp_path, monkeypatch):
+    """ Tests on the SimPlane that DPI_C2F reuses a fresh cached calibration of the same board without measuring"""
+    import json
+    monkeypatch.setattr(Coach, 'CACHE_DIR', str(tmp_path))
+    coach=Coach()
+    coach.open('sim://?time_scale=0&teensy_sn=42')
+    try:
+        fw='.'.join(str(v) for v in coach.get_firmware_version())
+        with open(tmp_path/f'dpi_c2f_42_{fw}.json','w') as f:
+            json.dump({'time':time.time(), 'fit':[0,1e-9,0], 'Ib_cal':[1e-9], 'c2f_calI1':[1]}, f)
+        cal=Coach.DPI_C2F(coach)
+        assert cal.f2i(2)==2e-9
+        assert 'read_c2f_output' not in coach.get_pyplane().transactions, 'should not have calibrated'
+        assert not cal._load(max_age_s=-1), 'expired calibration should not be loaded'
+        for malformed in ('{"time": 1', '[1, 2]', '{"fit": [0, 1e-9, 0]}', '{"time": "yesterday", "fit": [1], "Ib_cal": [], "c2f_calI1": []}'):
+            with open(cal.cache_file,'w') as f:
+                f.write(malformed)
+            assert not cal._load(max_age_s=1e9), f'malformed cache {malformed} should not be loaded'
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_c2f_calibration_converts_all_channels():
+    """ Tests on the SimPlane that calibrate_c2f fits all 16 channels and converts (N, 16) frequency matrices to currents"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0&seed=1')
+    try:
+        sim=coach.get_pyplane()
+        current={'I':0.}
+        sim.model_current_A=lambda adc=None: current['I']
+        def set_input(i):
+            current['I']=i
+            return i
+        cal=coach.calibrate_c2f(set_input, np.linspace(1e-9, 20e-9, 10), duration=1, settle_s=0)
+        assert cal.coeffs.shape==(16,3)
+        current['I']=10e-9
+        i=coach.measure_c2f_currents(cal, duration=1)
+        assert i.shape==(16,)
+        assert np.allclose(i, 10e-9, rtol=.05), 'calibration should compensate the mismatch of every channel'
+        freqs=np.array([coach.measure_c2f_freqs(1) for _ in range(4)])
+        assert np.allclose(cal.f2i(freqs), 10e-9, rtol=.05)
+        assert cal.f2i(freqs).shape==(4,16)
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_measure_c2f_freqs_adaptive():
+    """ Tests on the SimPlane that the adaptive C2F window is short for high currents and meets the precision for low ones"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0&seed=2')
+    try:
+        sim=coach.get_pyplane()
+        durations=[]
+        read_c2f_output=sim.read_c2f_output
+        sim.read_c2f_output=lambda duration: durations.append(duration) or read_c2f_output(duration)
+        for current, min_s, max_s in ((1e-5, 0, .01), (1e-7, .1, 5)):  # 100kHz and 1kHz nominal
+            sim.model_current_A=lambda adc=None: current
+            durations.clear()
+            freqs, sigma, counts=coach.measure_c2f_freqs_adaptive(rel_precision=.05, probe_s=.005, max_s=5)
+            assert freqs.shape==sigma.shape==counts.shape==(16,)
+            assert np.all(sigma/freqs<.06)
+            assert min_s<=sum(durations)<=max_s
+            assert max(durations)<=coach.C2F_COUNT_WINDOW_S, 'long windows should be read in pieces whose counts are exact'
+            assert np.allclose(freqs*sum(durations), counts)
+        # a channel that is silent in the probe read does not push the window to max_s, unless it is asked for
+        gains=sim.c2f_gains.copy()
+        sim.c2f_gains[3]=0
+        sim.model_current_A=lambda adc=None: 1e-5
+        durations.clear()
+        freqs, sigma, counts=coach.measure_c2f_freqs_adaptive(rel_precision=.05, probe_s=.005, max_s=5)
+        assert counts[3]==0 and sum(durations)<=.01
+        durations.clear()
+        coach.measure_c2f_freqs_adaptive(rel_precision=.05, probe_s=.005, max_s=5, channels=[3])
+        assert sum(durations)==pytest.approx(5)
+        sim.c2f_gains=gains
+    finally:
+        coach.close()
+
+
+def test_adaptive_sweep_refines_the_knee():
+    """ Tests that adaptive_sweep puts its points where a transfer curve bends and leaves the flat parts coarse"""
+    x_set=[]
+    curve=lambda x: np.tanh(20*(x-.5))
+    x, y=adaptive_sweep(x_set.append, lambda: curve(x_set[-1]), 0, 1, n_initial=9, max_points=40, tol=.005)
+    assert len(x)<=40 and np.all(np.diff(x)>0)
+    assert np.allclose(y, curve(x))
+    assert np.sum(np.abs(x-.5)<.15)>np.sum(np.abs(x-.5)>.35), 'the transition should get more points than the flat tails'
+    uniform=np.linspace(0, 1, len(x))
+    fine=np.linspace(0, 1, 10001)
+    err=lambda xs: np.max(np.abs(np.interp(fine, xs, curve(xs))-curve(fine)))
+    assert err(x)<err(uniform)/2
+
+    # exponential (subthreshold) curve refined in log y stops early when it is straight
+    x, y=adaptive_sweep(x_set.append, lambda: 1e-12*np.exp(x_set[-1]/.03), 0, 1, max_points=40, log_y=True)
+    assert len(x)==9
+
+
+@pytest.mark.serial
+def test_sim_settle_waits_only_as_long_as_needed():
+    """ Tests on the SimPlane that settle() returns once a first order transient has settled and times out on a drifting one"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0&noise=0')
+    try:
+        t0=time.perf_counter()
+        v, elapsed_s=coach.settle(lambda: 1-np.exp(-(time.perf_counter()-t0)/.02), abs_tol=1e-3, rel_tol=0, interval_s=.005, name='rc')
+        assert abs(v-1)<2e-3
+        assert .05<elapsed_s<.5, 'should settle after a few time constants'
+        assert coach.settle_times['rc']==elapsed_s
+        t0=time.perf_counter()
+        v, elapsed_s=coach.settle(lambda: time.perf_counter()-t0, abs_tol=1e-6, rel_tol=0, timeout_s=.05)
+        assert .05<=elapsed_s<.2, 'should give up at the timeout'
+        v, elapsed_s=coach.settle_voltage(pyplane.AdcChannel.AOUT10)
+        assert elapsed_s<.5
+        v, elapsed_s=coach.settle(lambda: 1., min_s=.1)
+        assert elapsed_s>=.1, 'should wait at least min_s'
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_setup_dvs_repeated_with_same_ratio_sends_nothing():
+    """ Tests on the SimPlane that setup_dvs() with a non-nominal on_off_ratio sends nothing the second time, so it does not settle again"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        coach.setup_dvs(on_off_ratio=4, settle_duration=0)
+        n=sim.coach_events_sent
+        coach.setup_dvs(on_off_ratio=4, settle_duration=0)
+        assert sim.coach_events_sent==n
+        currents, changed=coach._setup_dvs_without_settling(on_off_ratio=4)
+        assert not changed
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_measure_averaged_stops_early():
+    """ Tests on the SimPlane that measure_averaged() takes few readings of quiet signals and more of noisy ones"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0&noise=0&seed=3')
+    try:
+        sim=coach.get_pyplane()
+        m=coach.measure_averaged(coach.measure_nfet_id, rel_sem=.01)
+        assert m.n==2 and m.std==0
+        sim.noise=.1
+        m=coach.measure_averaged(coach.measure_nfet_id, rel_sem=.01, max_n=1000)
+        assert 50<m.n<1000
+        assert m.std/np.sqrt(m.n)<=.01*abs(m.mean)
+        assert abs(m.mean/sim.model_current_A()-1)<.05
+        coach.set_dac_voltage(pyplane.DacChannel.AIN0, .5)
+        m=coach.measure_averaged(sim.read_voltage, pyplane.AdcChannel.AOUT10, rel_sem=1e-6, max_n=5)
+        assert m.n==5
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_scan_adc():
+    """ Tests on the SimPlane that scan_adc() reads every channel of each row once and timestamps the rows"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0&latency_s=0.0001')
+    try:
+        sim=coach.get_pyplane()
+        samples, t_ns=coach.scan_adc(Coach.WTA_LVOUT_CHANNELS, n_repeats=5)
+        assert samples.shape==(5,16) and t_ns.shape==(5,)
+        assert np.all(np.diff(t_ns)>=16*1e5), 'each row takes 16 round trips'
+        assert sim.transactions['read_voltage']==5*16
+        samples, t_ns=coach.scan_adc([pyplane.AdcChannel.GO22], duration_s=.05, read_current=True)
+        assert samples.shape==(len(t_ns),1) and len(t_ns)>10
+        assert (t_ns[-1]-t_ns[0])/1e9<.05
+        with pytest.raises(ValueError):
+            coach.scan_adc(Coach.WTA_LVOUT_CHANNELS)
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_apply_wta_patterns_reuses_unchanged_inputs():
+    """ Tests on the SimPlane that apply_wta_patterns() writes only the WTA inputs that change between patterns"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        coach.setup_wta_iout()
+        vins=np.full((16,16), .3)
+        vins[np.arange(16), np.arange(16)]=.8 # a bump moving across the inputs
+        sim.transactions.clear()
+        out=coach.apply_wta_patterns(vins)
+        assert out.shape==(16,16)
+        assert sim.transactions['read_voltage']==16*16
+        assert sim.transactions['set_voltage']==16+2*15, 'only the two inputs that change should be written after the first pattern'
+        assert coach.apply_wta_pattern(vins[-1]).shape==(16,)
+        assert sim.transactions['set_voltage']==16+2*15, 'the board already holds the inputs of the last pattern'
+        with pytest.raises(ValueError):
+            coach.apply_wta_patterns(np.zeros((2,15)))
+    finally:
+        coach.close()
+
+
+@pytest.mark.serial
+def test_sim_apply_wta_patterns_after_raw_dac_write():
+    """ Tests on the SimPlane that apply_wta_patterns() and the other DAC setters apply their inputs after they were set directly with get_pyplane()"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        coach.setup_wta_iout()
+        coach.apply_wta_pattern(np.full(16, .3))
+        sim.set_voltage(Coach.WTA_VIN_CHANNELS[3], 1.) # like the labs do with p.set_voltage()
+        coach.apply_wta_pattern(np.full(16, .3))
+        assert abs(sim.get_set_voltage(Coach.WTA_VIN_CHANNELS[3])-.3)<Coach.DAC_LSB_V
+        coach.set_nfet_vg(.5)
+        sim.set_voltage(pyplane.DacChannel.AIN0, 1.) # the nfet gate is on AIN0
+        coach.set_nfet_vg(.5)
+        assert abs(sim.get_set_voltage(pyplane.DacChannel.AIN0)-.5)<Coach.DAC_LSB_V
+    finally:
+        coach.close()
+
+
+def test_waveforms():
+    """ Tests the Waveforms stimulus builders"""
+    assert np.array_equal(Waveforms.step(4, .2, .8), [.2, .2, .8, .8])
+    assert np.array_equal(Waveforms.staircase(7, [0, .5, 1]), [0, 0, .5, .5, 1, 1, 1])
+    sine=Waveforms.sine(100, interval_s=1e-3, freq_hz=10, amplitude=.1, offset=.5)
+    assert sine.shape==(100,) and np.isclose(sine.max(), .6) and np.isclose(sine[25], .6)
+    chirp=Waveforms.chirp(1000, 1e-3, 1, 20, amplitude=.1, offset=.5)
+    assert np.all(np.abs(chirp-.5)<=.1+1e-12)
+    crossings=np.flatnonzero(np.diff(np.sign(chirp-.5)))
+    assert np.diff(crossings)[-1]<np.diff(crossings)[0], 'the chirp should speed up'
+    assert np.array_equal(Waveforms.pwm(8, 4, .25, 0, 1), [1, 0, 0, 0, 1, 0, 0, 0])
+
+
+@pytest.mark.serial
+def test_sim_set_waveform_skips_identical_upload():
+    """ Tests on the SimPlane that set_waveform() uploads the same waveform only once until the board is reset or the waveform buffer may have changed"""
+    coach=Coach()
+    coach.open('sim://?time_scale=0')
+    try:
+        sim=coach.get_pyplane()
+        wf=Waveforms.sine(1000, 1e-4, 50, .1, .5)
+        assert coach.set_waveform(wf)
+        assert not coach.set_waveform(wf.copy())
+        assert not coach.set_waveform(wf.tolist())
+        assert sim.transactions['set_voltage_waveform']==1
+        assert coach.set_waveform(wf+.01)
+        coach.reset_soft()
+        assert coach.set_waveform(wf+.01)
+        assert sim.transactions['set_voltage_waveform']==3
+        assert len(coach.measure_foi_waveform(1e-4))==1000
+        assert not coach.set_waveform(wf+.01), 'measuring the waveform does not change it'
+        # the calls that may reprogram the waveform buffer make the next set_waveform() upload again
+        coach.transient_response(pyplane.DacChannel.AIN9, pyplane.AdcChannel.AOUT10, 1e-4, .5)
+        assert coach.set_waveform(wf+.01)
+        sim.set_voltage_waveform(wf.tolist())
+        assert coach.set_waveform(wf+.01)
+        coach.get_pyplane()
+        assert coach.set_waveform(wf+.01)
+        assert sim.transactions['set_voltage_waveform']==7
+    finally:
+        coach.close()
+
+
 def test_plt():
     ### NOTE you must be running a DISPLAY (e.g. Xserver) for the pyplot window to show
     # and you must close the plot for test to continue